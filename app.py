@@ -10,6 +10,7 @@ from views.transactions import transactions_view
 from views.teams import teams_view
 from views.csuites_view import csuites_view  # Import the new C-Suites view
 from views.agent_performance_view import agent_performance_view  # Agent Performance view
+from migrations import report_missing_indexes
 
 # Initialize session state keys used in various views
 if 'transactions_offset' not in st.session_state:
@@ -55,6 +56,13 @@ def render_sidebar():
 def render_main():
     # Render the appropriate view based on the selected table if logged in.
     if is_authenticated():
+        # Checked once per process: flag any filter indexes the migrations haven't created yet
+        missing = report_missing_indexes()
+        if missing:
+            st.sidebar.warning(
+                f"{len(missing)} database index(es) are missing, so some filters will be slow. "
+                "Run `python -m migrations`."
+            )
         selected_table = st.session_state.selected_table
         if selected_table == "Teams":
             teams_view()
@@ -2,6 +2,8 @@ import streamlit as st
 import psycopg2
 import os
 from dotenv import load_dotenv
+from db import close_pool
+from exports import delete_session_exports
 
 load_dotenv()  # Load environment variables from .env file (for local testing)
 
@@ -42,6 +44,10 @@ def login():
 
 
 def logout():
+    # Shut down this user's pooled connections before the credentials are wiped
+    close_pool(st.session_state.get("db_credentials"))
+    # Export files are per session; nobody can download them once it ends
+    delete_session_exports()
     for key in list(st.session_state.keys()):
         del st.session_state[key]
     st.success("Logged out successfully")
@@ -14,3 +14,55 @@ DB_CONFIG = {
 }
 
 EXPORT_PATH = os.getenv("EXPORT_PATH", "exports/")
+EXPORT_MAX_AGE = int(os.getenv("EXPORT_MAX_AGE", str(24 * 3600)))  # seconds before a session's export files are swept
+
+# Per-user PostgreSQL connection pool (see db.ConnectionPool)
+DB_POOL_MIN_CONN = int(os.getenv("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "8"))
+DB_POOL_IDLE_TIMEOUT = int(os.getenv("DB_POOL_IDLE_TIMEOUT", "300"))  # seconds before an idle connection is closed
+DB_POOL_PING_AFTER = int(os.getenv("DB_POOL_PING_AFTER", "30"))  # idle seconds before checkout runs SELECT 1
+DB_POOL_CHECKOUT_TIMEOUT = int(os.getenv("DB_POOL_CHECKOUT_TIMEOUT", "30"))
+
+# Worker threads shared by all sessions for running count and page queries concurrently
+QUERY_EXECUTOR_WORKERS = int(os.getenv("QUERY_EXECUTOR_WORKERS", "16"))
+
+# Show planner row estimates for "X of Y" counts while the exact COUNT(*) runs in the background
+ESTIMATE_ROW_COUNTS = os.getenv("ESTIMATE_ROW_COUNTS", "true").lower() in ("1", "true", "yes")
+COUNT_POLL_INTERVAL = float(os.getenv("COUNT_POLL_INTERVAL", "1.0"))  # seconds between checks for the exact count
+
+# Shared query result cache (see query_cache.py)
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+QUERY_CACHE_DEFAULT_TTL = int(os.getenv("QUERY_CACHE_DEFAULT_TTL", "600"))  # seconds
+# Per-table TTLs in seconds (lower-case, unqualified names). A query expires after the shortest TTL
+# of the tables it reads. These tables have watermark probes (see query_cache.current_watermark), so
+# entries are dropped as soon as the data changes and the TTLs can be long. Results cached while a
+# probe fails carry no watermark and are capped at QUERY_CACHE_DEFAULT_TTL.
+QUERY_CACHE_TABLE_TTLS = {
+    "transactions_2": 24 * 3600,
+    "agents_master": 24 * 3600,
+    "agent_metrics": 24 * 3600,
+    "z_agents": 24 * 3600,
+    "team_rollup": 24 * 3600,
+    "csuites": 24 * 3600,
+    "agent_performance_with_location_canon": 24 * 3600,
+}
+# Seconds a table watermark probe result is reused before the table is checked again
+WATERMARK_PROBE_INTERVAL = int(os.getenv("WATERMARK_PROBE_INTERVAL", "30"))
+
+# Persistent Parquet tier of the query cache, for loaders that opt in with persist=True
+CACHE_PATH = os.getenv("CACHE_PATH", "cache/")
+QUERY_CACHE_DISK_MAX_BYTES = int(os.getenv("QUERY_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+# Shared Snowflake session pool (see snowflake_db.SnowflakeSessionPool)
+SNOWFLAKE_POOL_MAX_CONN = int(os.getenv("SNOWFLAKE_POOL_MAX_CONN", "4"))
+SNOWFLAKE_POOL_CHECKOUT_TIMEOUT = int(os.getenv("SNOWFLAKE_POOL_CHECKOUT_TIMEOUT", "30"))  # seconds to wait for a session at the cap
+SNOWFLAKE_POOL_IDLE_TIMEOUT = int(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT", "1800"))  # seconds before an idle session is closed
+SNOWFLAKE_PING_AFTER = int(os.getenv("SNOWFLAKE_PING_AFTER", "300"))  # idle seconds before checkout runs SELECT 1
+SNOWFLAKE_HEARTBEAT_FREQUENCY = int(os.getenv("SNOWFLAKE_HEARTBEAT_FREQUENCY", "900"))  # keep-alive heartbeat, 900-3600s
+SNOWFLAKE_POLL_INTERVAL = float(os.getenv("SNOWFLAKE_POLL_INTERVAL", "0.25"))  # seconds between async query status checks
+SNOWFLAKE_RESULT_MAX_AGE = int(os.getenv("SNOWFLAKE_RESULT_MAX_AGE", str(20 * 3600)))  # reuse RESULT_SCAN ids below Snowflake's 24h
+SNOWFLAKE_RESULT_MAX_ENTRIES = int(os.getenv("SNOWFLAKE_RESULT_MAX_ENTRIES", "1000"))  # remembered result ids (LRU)
+
+# Local Arrow snapshots of small Snowflake tables (see table_snapshot.py)
+SNAPSHOT_REFRESH_INTERVAL = int(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "3600"))  # seconds between checks even without a watermark move
+SNAPSHOT_BUCKETS = int(os.getenv("SNAPSHOT_BUCKETS", "256"))  # hash buckets compared on refresh
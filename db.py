@@ -1,29 +1,228 @@
 import streamlit as st
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import pandas as pd
+import pyarrow as pa
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
 import warnings # To suppress potential UserWarning from pandas read_sql_query
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from query_cache import cache_get, cache_put, fingerprint, current_watermark, register_watermark_source
+from config import (DB_POOL_MIN_CONN, DB_POOL_MAX_CONN, DB_POOL_IDLE_TIMEOUT, DB_POOL_PING_AFTER,
+                    DB_POOL_CHECKOUT_TIMEOUT, QUERY_EXECUTOR_WORKERS)
 
 # Database connection details (consider moving sensitive parts like host/port to secrets)
 DB_HOST = "scout-database.ca51kangyonq.us-east-1.rds.amazonaws.com"
 DB_PORT = "5432"
 DB_NAME = "postgres"
 
+DEFAULT_CHUNK_ROWS = 10_000  # Rows per batch for streamed (server-side cursor) queries
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections for a single set of database credentials.
+
+    Connections are opened lazily up to `maxconn`, kept warm down to `minconn`, evicted after
+    sitting idle for `idle_timeout` seconds, and health-checked before being handed out.
+    """
+
+    def __init__(self, username, password, minconn=DB_POOL_MIN_CONN, maxconn=DB_POOL_MAX_CONN,
+                 idle_timeout=DB_POOL_IDLE_TIMEOUT, ping_after=DB_POOL_PING_AFTER):
+        self._username = username
+        self._password = password
+        self.minconn = minconn
+        self.maxconn = max(maxconn, 1)
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, last_returned_at), most recently returned last
+        self._in_use = set()
+        self._closed = False
+        for _ in range(min(self.minconn, self.maxconn)):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(
+            dbname=DB_NAME,
+            user=self._username,
+            password=self._password,
+            host=DB_HOST,
+            port=DB_PORT
+        )
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception as e:
+            print(f"Error closing pooled database connection: {e}")
+
+    def _is_healthy(self, conn, last_used):
+        """Cheap checks first; only ping the server if the connection has been idle for a while."""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _evict_idle(self):
+        """Close connections idle past the timeout, keeping at least `minconn` open. Caller holds the lock."""
+        now = time.monotonic()
+        keep = []
+        expired = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                expired.append((conn, last_used))
+            else:
+                keep.append((conn, last_used))
+        # Retain the freshest expired connections if evicting them all would drop below minconn
+        spare = max(self.minconn - len(keep) - len(self._in_use), 0)
+        if spare:
+            keep = expired[-spare:] + keep
+            expired = expired[:-spare]
+        self._idle = keep
+        for conn, _ in expired:
+            self._discard(conn)
+
+    def getconn(self, timeout=DB_POOL_CHECKOUT_TIMEOUT):
+        """Borrows a healthy connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("connection pool is closed")
+                    self._evict_idle()
+                    if self._idle or len(self._in_use) < self.maxconn:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise psycopg2.pool.PoolError("timed out waiting for a pooled connection")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    # Reserve a slot for the new connection
+                    conn, last_used = object(), None
+                self._in_use.add(conn)
+
+            # The health check may ping the server and connecting is slow; neither holds the lock
+            if last_used is not None:
+                if self._is_healthy(conn, last_used):
+                    return conn
+                print("Discarding unhealthy pooled database connection.")
+                self._discard(conn)
+                with self._cond:
+                    self._in_use.discard(conn)
+                    self._cond.notify()
+                continue
+
+            placeholder = conn
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._in_use.discard(placeholder)
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._in_use.discard(placeholder)
+                self._in_use.add(conn)
+            print("Database connection established successfully.") # Debug print
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Returns a borrowed connection, ending any open transaction first."""
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use.discard(conn)
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._evict_idle()
+            self._cond.notify()
+
+    def closeall(self):
+        """Closes idle connections now; borrowed ones are closed as they are returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+def _pool_key(creds):
+    password_digest = hashlib.sha256(creds["password"].encode("utf-8")).hexdigest()
+    return creds["username"], password_digest
+
+
+@st.cache_resource
+def _get_pool_registry():
+    """
+    Process-wide registry of connection pools, shared across sessions and keyed by credentials,
+    plus the pool each borrowed connection came from (keyed by id(conn)).
+    """
+    return {"lock": threading.Lock(), "pools": {}, "owners": {}}
+
+
+def get_pool(creds):
+    """Returns the connection pool for the given credentials, creating it on first use."""
+    registry = _get_pool_registry()
+    key = _pool_key(creds)
+    with registry["lock"]:
+        pool = registry["pools"].get(key)
+        if pool is None:
+            pool = ConnectionPool(creds["username"], creds["password"])
+            registry["pools"][key] = pool
+        return pool
+
+
+def close_pool(creds):
+    """Shuts down and forgets the connection pool for the given credentials (used on logout)."""
+    if not creds:
+        return
+    registry = _get_pool_registry()
+    with registry["lock"]:
+        pool = registry["pools"].pop(_pool_key(creds), None)
+    if pool is not None:
+        pool.closeall()
+        print("Database connection pool closed.")
+
 
 def get_connection():
-    """Establishes a connection to the PostgreSQL database using credentials from session state."""
+    """Borrows a pooled connection to the PostgreSQL database using credentials from session state."""
     creds = st.session_state.get("db_credentials")
     if creds and st.session_state.get("authenticated"):
         try:
-            conn = psycopg2.connect(
-                dbname=DB_NAME,
-                user=creds["username"],
-                password=creds["password"],
-                host=DB_HOST,
-                port=DB_PORT
-            )
-            print("Database connection established successfully.") # Debug print
+            pool = get_pool(creds)
+            conn = pool.getconn()
+            # Remember the owner: the session may log out or switch credentials before releasing
+            registry = _get_pool_registry()
+            with registry["lock"]:
+                registry["owners"][id(conn)] = pool
             return conn
-        except psycopg2.Error as e: # Catch specific psycopg2 errors
+        except psycopg2.Error as e: # Catch specific psycopg2 errors (includes PoolError)
             st.error(f"Database connection error: {e}")
             print(f"Database connection error: {e}") # Also print to console
             return None
@@ -38,19 +237,157 @@ def get_connection():
         return None
 
 
+def _cache_namespace(kind):
+    """
+    Query cache namespace for results fetched with this session's login. Each login sees only what
+    its own grants allow, so results are only shared between sessions on the same credentials.
+    """
+    creds = st.session_state.get("db_credentials")
+    login = hashlib.sha256(repr(_pool_key(creds)).encode("utf-8")).hexdigest() if creds else "anonymous"
+    return f"postgres:{login}:{kind}"
+
+
+def release_connection(conn, discard=False):
+    """Returns a connection obtained from get_connection() to the pool it was borrowed from."""
+    registry = _get_pool_registry()
+    with registry["lock"]:
+        pool = registry["owners"].pop(id(conn), None)
+    try:
+        if pool is not None:
+            # A closed pool (after logout) closes the connection instead of keeping it
+            pool.putconn(conn, discard=discard)
+        else:
+            conn.close()
+    except Exception as e:
+        print(f"Error releasing database connection: {e}")
+
+
 # --- run_query (Corrected) ---
-def run_query(query, params=None):
+# --- Arrow fetch path ---
+# PostgreSQL type OIDs -> pyarrow column types. Anything not listed is left to pyarrow inference.
+PG_OID_TO_ARROW = {
+    16: pa.bool_(),                       # bool
+    20: pa.int64(),                       # int8
+    21: pa.int16(),                       # int2
+    23: pa.int32(),                       # int4
+    700: pa.float32(),                    # float4
+    701: pa.float64(),                    # float8
+    1700: pa.float64(),                   # numeric (decoded straight to float, see _NUMERIC_AS_FLOAT)
+    18: pa.string(),                      # char
+    19: pa.string(),                      # name
+    25: pa.string(),                      # text
+    1042: pa.string(),                    # bpchar
+    1043: pa.string(),                    # varchar
+    1082: pa.date32(),                    # date
+    1114: pa.timestamp("us"),             # timestamp
+    1184: pa.timestamp("us", tz="UTC"),   # timestamptz
+}
+
+# Decode NUMERIC as float on Arrow cursors instead of allocating a Decimal per value
+_NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None
+)
+
+
+def _rows_to_arrow(rows, description):
+    """Builds a typed pyarrow Table from fetched rows using the cursor's column type OIDs."""
+    names = [desc[0] for desc in description]
+    columns = list(zip(*rows)) if rows else [() for _ in description]
+    arrays = []
+    for desc, values in zip(description, columns):
+        arrow_type = PG_OID_TO_ARROW.get(desc[1])
+        try:
+            arrays.append(pa.array(values, type=arrow_type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed or exotic values: fall back to their text representation
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def _fetch_arrow(conn, query, params=None, batch_rows=DEFAULT_CHUNK_ROWS):
+    """Executes `query` on `conn` and assembles the result batch by batch into a pyarrow Table."""
+    with conn.cursor() as cur:
+        psycopg2.extensions.register_type(_NUMERIC_AS_FLOAT, cur)
+        cur.execute(query, params)
+        if cur.description is None:
+            return pa.table({})
+        tables = []
+        while True:
+            rows = cur.fetchmany(batch_rows)
+            if not rows:
+                break
+            tables.append(_rows_to_arrow(rows, cur.description))
+        if not tables:
+            return _rows_to_arrow([], cur.description)
+        return pa.concat_tables(tables)
+
+
+def run_query_arrow(query, params=None, batch_rows=DEFAULT_CHUNK_ROWS, cache=False):
+    """
+    Executes a SQL query and returns the result as a typed pyarrow Table.
+
+    Args:
+        query (str): The SQL query string (can contain placeholders like %(key)s).
+        params (dict, optional): A dictionary of parameters to bind to the query. Defaults to None.
+        batch_rows (int, optional): Rows fetched and converted per batch.
+        cache (bool, optional): Serve from / store in the shared query cache (see query_cache.py).
+
+    Returns:
+        pyarrow.Table: The query results, or an empty table on error.
+    """
+    print(f"run_query_arrow called. Query: {query[:200]}... Params: {params}")
+    cache_key = fingerprint(query, params, namespace=_cache_namespace("arrow")) if cache else None
+    watermark = current_watermark("postgres", query) if cache_key else None
+    if cache_key:
+        cached = cache_get(cache_key, watermark=watermark)
+        if cached is not None:
+            print(f"Query cache hit. Rows returned: {cached.num_rows}")
+            return cached
+    conn = get_connection()
+    if conn is None:
+        st.error("Failed to get database connection.")
+        return pa.table({})
+    try:
+        table = _fetch_arrow(conn, query, params, batch_rows)
+        print(f"Query executed successfully. Rows returned: {table.num_rows}")
+        if cache_key:
+            cache_put(cache_key, query, table, watermark=watermark)
+        return table
+    except psycopg2.Error as e:
+        st.error(f"Database query execution error: {e}")
+        print(f"Database query execution error: {e}")
+        return pa.table({})
+    finally:
+        release_connection(conn)
+
+
+def run_query(query, params=None, dtype_backend=None, cache=False, persist=False):
     """
     Executes a SQL query against the database with optional parameters.
 
     Args:
         query (str): The SQL query string (can contain placeholders like %(key)s).
         params (dict, optional): A dictionary of parameters to bind to the query. Defaults to None.
+        dtype_backend (str, optional): "pyarrow" to fetch through the Arrow path and return
+            Arrow-backed dtypes; None (default) uses pd.read_sql_query with NumPy dtypes.
+        cache (bool, optional): Serve from / store in the shared query cache (see query_cache.py).
+            Failed queries are never cached.
+        persist (bool, optional): Also keep the result in the on-disk Parquet cache so it survives
+            restarts. Meant for expensive, slow-changing queries. Implies `cache`.
 
     Returns:
         pd.DataFrame: A DataFrame containing the query results, or an empty DataFrame on error.
     """
     print(f"run_query called. Query: {query[:200]}... Params: {params}") # Log query start and params
+    cache_key = fingerprint(query, params, namespace=_cache_namespace(dtype_backend)) if cache or persist else None
+    watermark = current_watermark("postgres", query) if cache_key else None
+    if cache_key:
+        cached = cache_get(cache_key, persist=persist, watermark=watermark)
+        if cached is not None:
+            print(f"Query cache hit. Rows returned: {len(cached)}")
+            return cached
     conn = None # Initialize conn to None
     try:
         conn = get_connection()
@@ -58,15 +395,24 @@ def run_query(query, params=None):
             st.error("Failed to get database connection.")
             return pd.DataFrame() # Return empty DataFrame if connection failed
 
+        if dtype_backend == "pyarrow":
+            df = _fetch_arrow(conn, query, params).to_pandas(types_mapper=pd.ArrowDtype)
+            print(f"Query executed successfully (Arrow). Rows returned: {len(df)}")
+            if cache_key:
+                cache_put(cache_key, query, df, persist=persist, watermark=watermark)
+            return df
+
         # Use pandas read_sql_query, passing parameters correctly
         # Suppress UserWarning about SQLAlchemy connectable which is not relevant here
         with warnings.catch_warnings():
              warnings.simplefilter("ignore", UserWarning)
              df = pd.read_sql_query(query, conn, params=params)
         print(f"Query executed successfully. Rows returned: {len(df)}")
+        if cache_key:
+            cache_put(cache_key, query, df, persist=persist, watermark=watermark)
         return df
 
-    except pd.errors.DatabaseError as e: # Catch pandas DB errors specifically
+    except (pd.errors.DatabaseError, psycopg2.Error) as e: # Catch DB errors specifically
         st.error(f"Database query execution error: {e}")
         print(f"Database query execution error: {e}")
         return pd.DataFrame() # Return empty DataFrame on error
@@ -76,11 +422,254 @@ def run_query(query, params=None):
         return pd.DataFrame() # Return empty DataFrame on error
     finally:
         if conn is not None:
-            try:
-                conn.close()
-                print("Database connection closed.")
-            except Exception as e:
-                 print(f"Error closing database connection: {e}")
+            release_connection(conn)
+
+
+# --- run_query_iter (streaming, server-side cursor) ---
+def run_query_iter(query, params=None, chunk_rows=DEFAULT_CHUNK_ROWS, as_arrow=False):
+    """
+    Streams query results in chunks using a named (server-side) psycopg2 cursor, so only
+    one chunk is held in memory at a time.
+
+    Args:
+        query (str): The SQL query string (can contain placeholders like %(key)s).
+        params (dict, optional): A dictionary of parameters to bind to the query. Defaults to None.
+        chunk_rows (int, optional): Number of rows fetched from the server per chunk.
+        as_arrow (bool, optional): Yield pyarrow RecordBatches instead of DataFrames.
+
+    Yields:
+        pd.DataFrame | pyarrow.RecordBatch: One batch of at most `chunk_rows` rows.
+    """
+    print(f"run_query_iter called. Query: {query[:200]}... Params: {params}")
+    conn = get_connection()
+    if conn is None:
+        st.error("Failed to get database connection.")
+        return
+
+    discard = False
+    total_rows = 0
+    try:
+        # DECLARE ... CURSOR FOR <query> does not accept a trailing semicolon
+        sql = query.strip().rstrip(";")
+        with conn.cursor(name=f"run_query_iter_{uuid.uuid4().hex}") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(sql, params)
+            if as_arrow:
+                psycopg2.extensions.register_type(_NUMERIC_AS_FLOAT, cur)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                total_rows += len(rows)
+                if as_arrow:
+                    yield from _rows_to_arrow(rows, cur.description).to_batches()
+                else:
+                    columns = [desc[0] for desc in cur.description]
+                    yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        print(f"Streaming query finished. Rows returned: {total_rows}")
+    except psycopg2.Error as e:
+        discard = True
+        st.error(f"Database query execution error: {e}")
+        print(f"Database query execution error: {e}")
+    finally:
+        release_connection(conn, discard=discard)
+
+
+# --- copy_query_to_csv (COPY ... TO STDOUT export) ---
+def copy_query_to_csv(query, params=None, dest=None):
+    """
+    Exports a SELECT as CSV by letting PostgreSQL render it with COPY (...) TO STDOUT WITH CSV HEADER,
+    streaming the output straight into a file without building a DataFrame.
+
+    Args:
+        query (str): The SELECT to export (can contain placeholders like %(key)s or %s).
+        params (dict | tuple, optional): Parameters to bind to the query. Defaults to None.
+        dest (str | file-like, optional): A file path or binary file object to write to.
+            If None, the CSV is returned as bytes.
+
+    Returns:
+        bool | bytes: True on success when writing to `dest` (bytes when `dest` is None), False on error.
+    """
+    print(f"copy_query_to_csv called. Query: {query[:200]}... Params: {params}")
+    conn = get_connection()
+    if conn is None:
+        st.error("Failed to get database connection.")
+        return False
+
+    discard = False
+    try:
+        with conn.cursor() as cur:
+            # COPY cannot take bind parameters, so let psycopg2 quote them into the statement
+            select_sql = cur.mogrify(query.strip().rstrip(";"), params).decode("utf-8")
+            copy_sql = f"COPY ({select_sql}) TO STDOUT WITH CSV HEADER"
+            if dest is None:
+                buffer = io.BytesIO()
+                cur.copy_expert(copy_sql, buffer)
+                print(f"COPY export finished. Bytes written: {buffer.tell()}")
+                return buffer.getvalue()
+            if isinstance(dest, (str, os.PathLike)):
+                with open(dest, "wb") as f:
+                    cur.copy_expert(copy_sql, f)
+            else:
+                cur.copy_expert(copy_sql, dest)
+        print(f"COPY export finished. Destination: {dest}")
+        return True
+    except psycopg2.Error as e:
+        discard = True
+        st.error(f"Database export error: {e}")
+        print(f"Database export error: {e}")
+        return False
+    finally:
+        release_connection(conn, discard=discard)
+
+
+# --- Table watermarks for the query cache ---
+def pg_table_watermarks(tables):
+    """
+    Watermark probe for query_cache: per-table modification counters from pg_stat_user_tables.
+
+    Inserted/updated/deleted tuple counts move on every write (reported at commit, so a change is
+    visible within a second or so), and the relation filenode changes on TRUNCATE and on
+    non-concurrent REFRESH MATERIALIZED VIEW, which the counters don't see.
+
+    Args:
+        tables (list[str]): Lower-cased, unqualified table or materialized view names.
+
+    Returns:
+        dict: {table: [n_tup_ins, n_tup_upd, n_tup_del, filenode]} for the tables found.
+    """
+    conn = get_connection()
+    if conn is None:
+        return {}
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT lower(relname), n_tup_ins, n_tup_upd, n_tup_del, pg_relation_filenode(relid)
+                FROM pg_stat_user_tables
+                WHERE lower(relname) = ANY(%(tables)s)
+                """,
+                {"tables": list(tables)}
+            )
+            return {row[0]: list(row[1:]) for row in cur.fetchall()}
+    finally:
+        release_connection(conn)
+
+
+register_watermark_source("postgres", pg_table_watermarks)
+
+
+# --- Row count estimates (planner statistics) ---
+# Plan nodes that sit above the scan whose row estimate we want when EXPLAINing a COUNT(*) query
+_COUNT_WRAPPER_NODES = {"Aggregate", "Gather", "Gather Merge"}
+
+
+def _is_count_wrapper(plan):
+    """Whether `plan` only gathers or totals its input: a plain (ungrouped) Aggregate or a Gather."""
+    if plan.get("Node Type") not in _COUNT_WRAPPER_NODES:
+        return False
+    # Hashed/sorted/mixed Aggregates are a GROUP BY: their input rows aren't the rows being counted
+    return plan.get("Node Type") != "Aggregate" or plan.get("Strategy") == "Plain"
+
+
+def _plan_row_estimate(plan):
+    """
+    Walks down through the plain Aggregate and Gather nodes of a COUNT(*) plan and returns the
+    row estimate of the node being counted. A grouped Aggregate stops the walk, so counting the
+    groups of a GROUP BY reports the estimated number of groups, not of their input rows.
+    Parallel plans report rows per worker, so those are scaled back up by the number of planned
+    processes (workers + leader).
+    """
+    workers = 0
+    while _is_count_wrapper(plan) and plan.get("Plans"):
+        workers = max(workers, plan.get("Workers Planned", 0))
+        plan = plan["Plans"][0]
+    rows = plan.get("Plan Rows", 0)
+    if plan.get("Parallel Aware") and workers:
+        rows *= workers + 1
+    return int(rows)
+
+
+def estimate_count(count_query, params=None):
+    """
+    Returns the planner's estimate for a `SELECT COUNT(*) ...` query without executing it.
+
+    Args:
+        count_query (str): The COUNT(*) query (can contain placeholders like %(key)s or %s).
+        params (dict | tuple, optional): Parameters to bind to the query. Defaults to None.
+
+    Returns:
+        int | None: The estimated row count, or None if the query could not be planned.
+    """
+    conn = get_connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN (FORMAT JSON) {count_query.strip().rstrip(';')}", params)
+            explain = cur.fetchone()[0]
+        estimate = _plan_row_estimate(explain[0]["Plan"])
+        print(f"Estimated row count: {estimate}")
+        return estimate
+    except (psycopg2.Error, KeyError, IndexError, TypeError) as e:
+        print(f"Row count estimate failed: {e}")
+        return None
+    finally:
+        release_connection(conn)
+
+
+def estimate_table_rows(table):
+    """
+    Returns pg_class.reltuples for `table` (kept current by ANALYZE/autovacuum), which is
+    essentially free and is what an unfiltered COUNT(*) would be estimated at anyway.
+
+    Args:
+        table (str): Table name, optionally schema-qualified.
+
+    Returns:
+        int | None: The estimated row count, or None if the table has never been analyzed.
+    """
+    conn = get_connection()
+    if conn is None:
+        return None
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+            row = cur.fetchone()
+        # reltuples is -1 for tables that have never been vacuumed or analyzed
+        return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+    except psycopg2.Error as e:
+        print(f"Table row estimate failed: {e}")
+        return None
+    finally:
+        release_connection(conn)
+
+
+# --- Concurrent query execution ---
+@st.cache_resource
+def _get_query_executor():
+    """Process-wide thread pool used to run independent queries (e.g. count + page) side by side."""
+    return ThreadPoolExecutor(max_workers=QUERY_EXECUTOR_WORKERS, thread_name_prefix="query")
+
+
+def submit_query(fn, *args, **kwargs):
+    """
+    Submits `fn(*args, **kwargs)` to the shared query executor.
+
+    The caller's Streamlit script context is attached to the worker thread, so loaders can keep
+    reading st.session_state (credentials, filters) and reporting errors with st.error. Each
+    call borrows its own pooled connection through run_query.
+
+    Returns:
+        concurrent.futures.Future: Future resolving to the function's return value.
+    """
+    ctx = get_script_run_ctx()
+
+    def _run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+
+    return _get_query_executor().submit(_run)
 
 
 # --- build_query (Commented Out - Unsafe) ---
@@ -0,0 +1,46 @@
+from db import run_query
+from snowflake_db import run_snowflake_query
+from filter_spec import POSTGRES, SNOWFLAKE
+
+# Option lists for the sidebar multiselects and selectboxes.
+#
+# Fixed dimensions are plain constants here so every view shares one copy. Data-driven ones come
+# from distinct_values(), which reads the distinct values of a (table, column) through the shared
+# query cache: one DISTINCT query serves every session, and it only runs again once the table's
+# watermark moves (or its TTL runs out). The result is also persisted to the disk cache, so a restart
+# doesn't cost a scan either.
+
+US_STATES = [
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
+    'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
+    'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
+    'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
+    'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
+]
+
+
+def distinct_values(table, column, source=POSTGRES):
+    """
+    Returns the sorted distinct, non-empty values of a text column.
+
+    Args:
+        table (str): Table name, quoted if needed (e.g. '"z_agents"').
+        column (str): Column name, quoted if needed (e.g. '"Team_role"').
+        source (str, optional): POSTGRES or SNOWFLAKE (see filter_spec).
+
+    Returns:
+        list[str]: The values, or an empty list if the query failed.
+    """
+    query = f"""
+    SELECT DISTINCT {column} AS value
+    FROM {table}
+    WHERE {column} IS NOT NULL AND {column} <> ''
+    ORDER BY 1
+    """
+    if source == SNOWFLAKE:
+        df = run_snowflake_query(query, persist=True)
+    else:
+        df = run_query(query, persist=True)
+    if df.empty:
+        return []
+    return df[df.columns[0]].dropna().tolist()
@@ -0,0 +1,104 @@
+import streamlit as st
+import copy
+import os
+import shutil
+import time
+import uuid
+from config import EXPORT_PATH, EXPORT_MAX_AGE
+
+# Full-result CSV exports.
+#
+# Exports of every matching row are too slow to rebuild on each rerun (a fragment's Load More, a count
+# poll), so they only run when the user presses "Prepare Full CSV" and the file is then offered until
+# the applied filters change. Files go to a directory of their own per session, so two analysts
+# exporting at the same time don't overwrite each other's file. A session's directory is deleted on
+# logout, and directories untouched for EXPORT_MAX_AGE seconds are swept whenever a new session starts
+# exporting (covering sessions that ended without logging out).
+
+_SESSION_KEY = "export_session_id"
+
+
+def _last_modified(path):
+    """Newest mtime of `path` and the files directly inside it."""
+    newest = os.path.getmtime(path)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            newest = max(newest, entry.stat().st_mtime)
+    return newest
+
+
+def _sweep_old_exports():
+    """Deletes the session export directories under EXPORT_PATH that haven't been written for EXPORT_MAX_AGE."""
+    cutoff = time.time() - EXPORT_MAX_AGE
+    try:
+        with os.scandir(EXPORT_PATH) as entries:
+            session_dirs = [entry.path for entry in entries if entry.is_dir()]
+    except FileNotFoundError:
+        return
+    for path in session_dirs:
+        try:
+            if _last_modified(path) < cutoff:
+                shutil.rmtree(path)
+                print(f"Removed expired export directory {path}")
+        except OSError as e:
+            print(f"Error sweeping export directory {path}: {e}")
+
+
+def session_export_path(file_name):
+    """Path for `file_name` in this session's export directory (EXPORT_PATH/<session id>/), created if needed."""
+    if _SESSION_KEY not in st.session_state:
+        # First export of this session: a good moment to clear out the ones nobody will come back for
+        _sweep_old_exports()
+        st.session_state[_SESSION_KEY] = uuid.uuid4().hex
+    export_dir = os.path.join(EXPORT_PATH, st.session_state[_SESSION_KEY])
+    os.makedirs(export_dir, exist_ok=True)
+    return os.path.join(export_dir, file_name)
+
+
+def delete_session_exports():
+    """Deletes this session's export directory, if it has one (used on logout)."""
+    session_dir = st.session_state.get(_SESSION_KEY)
+    if session_dir:
+        shutil.rmtree(os.path.join(EXPORT_PATH, session_dir), ignore_errors=True)
+
+
+def full_csv_download(key, file_name, filters, export_fn, total_rows=None):
+    """
+    Renders "Prepare Full CSV", then "Download Full CSV" once the export for `filters` is ready.
+    Call it from inside the view's results fragment.
+
+    The file is only read into the download button right after it was written or when the user asks
+    for it again, so other reruns (a Load More, a count poll) don't reload the whole export.
+
+    Args:
+        key (str): Widget key suffix; also names the session state entries holding the export's state.
+        file_name (str): Name of the file on disk and of the download.
+        filters: The applied filters the export is for (compared with ==).
+        export_fn (callable): export_fn(dest) writes the CSV to path `dest`, returning True on success.
+        total_rows (int, optional): Matching row count, for the spinner text.
+    """
+    export_path = session_export_path(file_name)
+    state_key = f"{key}_export_filters"
+    ready_key = f"{key}_export_ready"
+    if st.session_state.get(state_key) != filters or not os.path.exists(export_path):
+        if st.button("Prepare Full CSV", key=f"prepare_{key}"):
+            rows = f"{total_rows:,} " if total_rows is not None else ""
+            with st.spinner(f"Exporting {rows}rows..."):
+                if export_fn(export_path):
+                    st.session_state[state_key] = copy.deepcopy(filters)
+                    st.session_state[ready_key] = True
+            st.rerun(scope="fragment")
+    elif st.session_state.pop(ready_key, False):
+        with open(export_path, "rb") as f:
+            st.download_button(
+                label="Download Full CSV",
+                data=f,
+                file_name=file_name,
+                mime="text/csv",
+                # Saving the file doesn't need a rerun
+                on_click="ignore",
+                key=f"download_{key}"
+            )
+    elif st.button("Download Full CSV", key=f"show_download_{key}"):
+        st.session_state[ready_key] = True
+        st.rerun(scope="fragment")
@@ -0,0 +1,272 @@
+import pyarrow.compute as pc
+from dataclasses import dataclass
+
+# Declarative row filters shared by every view.
+#
+# Views describe their sidebar filters as a FilterSpec (a tuple of predicates on raw columns) and
+# compile it for the database they query, instead of each loader hand-building its own WHERE clause.
+# The compiled forms are the index-friendly ones: ILIKE '%...%' directly on the column (servable by a
+# pg_trgm GIN index, unlike LOWER(col) LIKE), "= ANY(array)" for lists, and plain range comparisons
+# on the column itself.
+#
+# Specs are frozen and compile deterministically (params are named by predicate position), so equal
+# filters produce identical SQL and params and share query cache entries; a spec can also be used
+# directly as a dict or session state key.
+#
+# The helper constructors (contains, one_of, ...) return None for an empty filter value, and
+# FilterSpec.of() drops None entries, so views can list every filter unconditionally.
+
+POSTGRES = "postgres"
+SNOWFLAKE = "snowflake"
+
+# Full-text search: the generated tsvector column added by migrations/search_vectors.py, the text
+# search configuration it was built with, and the param search_rank() binds the query text to.
+SEARCH_VECTOR = "search_vector"
+SEARCH_CONFIG = "simple"
+SEARCH_RANK_PARAM = "search_rank"
+
+
+def _bind(name, dialect):
+    return f"%({name})s" if dialect == POSTGRES else f":{name}"
+
+
+def _unquote(column):
+    return column.strip('"')
+
+
+@dataclass(frozen=True)
+class Contains:
+    """Case-insensitive substring match of `value` in any of `columns`; with negate, in none of them."""
+    columns: tuple
+    value: str
+    negate: bool = False
+
+    def compile(self, name, dialect):
+        bind = _bind(name, dialect)
+        if len(self.columns) == 1:
+            op = "NOT ILIKE" if self.negate else "ILIKE"
+            return f"{self.columns[0]} {op} {bind}", {name: f"%{self.value}%"}
+        sql = "(" + " OR ".join(f"{column} ILIKE {bind}" for column in self.columns) + ")"
+        return (f"NOT {sql}" if self.negate else sql), {name: f"%{self.value}%"}
+
+    def to_arrow(self):
+        expr = None
+        for column in self.columns:
+            match = pc.match_substring(pc.field(_unquote(column)), self.value, ignore_case=True)
+            expr = match if expr is None else expr | match
+        return pc.invert(expr) if self.negate else expr
+
+
+@dataclass(frozen=True)
+class Equals:
+    """`column` equals `value`."""
+    column: str
+    value: object
+
+    def compile(self, name, dialect):
+        return f"{self.column} = {_bind(name, dialect)}", {name: self.value}
+
+    def to_arrow(self):
+        return pc.field(_unquote(self.column)) == self.value
+
+
+@dataclass(frozen=True)
+class OneOf:
+    """`column` equals one of `values`."""
+    column: str
+    values: tuple
+
+    def compile(self, name, dialect):
+        if dialect == POSTGRES:
+            # One array param regardless of list length, so the statement text doesn't vary
+            return f"{self.column} = ANY({_bind(name, dialect)})", {name: list(self.values)}
+        binds = {f"{name}_{i}": value for i, value in enumerate(self.values)}
+        return f"{self.column} IN ({', '.join(_bind(key, dialect) for key in binds)})", binds
+
+    def to_arrow(self):
+        return pc.field(_unquote(self.column)).isin(list(self.values))
+
+
+@dataclass(frozen=True)
+class Range:
+    """low <= `column` <= high (either bound may be None); with keep_null, NULLs match too."""
+    column: str
+    low: object = None
+    high: object = None
+    keep_null: bool = False
+
+    def compile(self, name, dialect):
+        clauses, params = [], {}
+        if self.low is not None:
+            clauses.append(f"{self.column} >= {_bind(f'{name}_min', dialect)}")
+            params[f"{name}_min"] = self.low
+        if self.high is not None:
+            clauses.append(f"{self.column} <= {_bind(f'{name}_max', dialect)}")
+            params[f"{name}_max"] = self.high
+        sql = " AND ".join(clauses)
+        if self.keep_null:
+            sql = f"({self.column} IS NULL OR ({sql}))"
+        elif len(clauses) > 1:
+            sql = f"({sql})"
+        return sql, params
+
+    def to_arrow(self):
+        field = pc.field(_unquote(self.column))
+        expr = None
+        if self.low is not None:
+            expr = field >= self.low
+        if self.high is not None:
+            expr = (field <= self.high) if expr is None else expr & (field <= self.high)
+        return (field.is_null() | expr) if self.keep_null else expr
+
+
+@dataclass(frozen=True)
+class Raw:
+    """
+    A fixed SQL predicate (e.g. a view's base condition, or a keyset seek predicate whose params the
+    caller binds itself). Not available in Arrow.
+    """
+    sql: str
+
+    def compile(self, name, dialect):
+        return self.sql, {}
+
+    def to_arrow(self):
+        raise ValueError(f"Raw SQL predicate can't be evaluated locally: {self.sql}")
+
+
+@dataclass(frozen=True)
+class Search:
+    """
+    Full-text match of `text` (web search syntax: quoted phrases, OR, -word) against a tsvector
+    column. Postgres only; there is no Snowflake or Arrow equivalent of the precomputed vector.
+    """
+    column: str
+    text: str
+
+    def compile(self, name, dialect):
+        if dialect != POSTGRES:
+            raise ValueError(f"Full-text search is only supported on PostgreSQL, not {dialect}")
+        return f"{self.column} @@ websearch_to_tsquery('{SEARCH_CONFIG}', {_bind(name, dialect)})", {name: self.text}
+
+    def to_arrow(self):
+        raise ValueError(f"Full-text search on {self.column} can't be evaluated locally")
+
+
+def contains(columns, value, negate=False):
+    """Contains predicate, or None if `value` is empty. `columns` is one column or a list of them."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    columns = (columns,) if isinstance(columns, str) else tuple(columns)
+    return Contains(columns, value, negate)
+
+
+def excludes(column, raw):
+    """One negated Contains per entry of a comma-separated exclude list."""
+    return [contains(column, value, negate=True) for value in (raw or "").split(",")]
+
+
+def equals(column, value):
+    """Equals predicate, or None if `value` is None or empty."""
+    if value is None or value == "":
+        return None
+    return Equals(column, value)
+
+
+def search(text, column=SEARCH_VECTOR):
+    """Search predicate, or None if `text` is empty."""
+    text = (text or "").strip()
+    if not text:
+        return None
+    return Search(column, text)
+
+
+def search_rank(column=SEARCH_VECTOR):
+    """
+    SQL for the relevance of a row to the search text, for ordering results best match first.
+    The caller binds the text as params[SEARCH_RANK_PARAM]. Cast to float8 so a keyset cursor
+    built from the returned value compares exactly against the recomputed rank.
+    """
+    return f"ts_rank({column}, websearch_to_tsquery('{SEARCH_CONFIG}', %({SEARCH_RANK_PARAM})s))::float8"
+
+
+def one_of(column, values):
+    """OneOf predicate, or None if `values` is empty."""
+    if not values:
+        return None
+    return OneOf(column, tuple(values))
+
+
+def between(column, low=None, high=None, floor=None, cap=None, keep_null=False):
+    """
+    Range predicate, or None if neither bound applies.
+
+    Args:
+        low, high: The bounds; None leaves that side open.
+        floor (optional): Drop `low` when it is at or below this (e.g. a slider's minimum).
+        cap (optional): Drop `high` when it is at or above this (e.g. a slider's "no limit" maximum).
+        keep_null (bool, optional): Let NULLs through.
+    """
+    if low is not None and floor is not None and low <= floor:
+        low = None
+    if high is not None and cap is not None and high >= cap:
+        high = None
+    if low is None and high is None:
+        return None
+    return Range(column, low, high, keep_null)
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """An AND of predicates, compiled per dialect."""
+    predicates: tuple = ()
+
+    @classmethod
+    def of(cls, *predicates):
+        """Builds a spec from predicates and lists of predicates, skipping None entries."""
+        flat = []
+        for predicate in predicates:
+            if isinstance(predicate, (list, tuple)):
+                flat.extend(p for p in predicate if p is not None)
+            elif predicate is not None:
+                flat.append(predicate)
+        return cls(tuple(flat))
+
+    def and_(self, *predicates):
+        """A new spec with `predicates` added."""
+        return FilterSpec.of(list(self.predicates), *predicates)
+
+    def __bool__(self):
+        return bool(self.predicates)
+
+    def compile(self, dialect=POSTGRES, prefix="f"):
+        """
+        Compiles to a parameterized predicate.
+
+        Args:
+            dialect (str, optional): POSTGRES (%(name)s binds) or SNOWFLAKE (:name binds).
+            prefix (str, optional): Param name prefix, to keep two specs in one query apart.
+
+        Returns:
+            tuple[str, dict]: The predicates joined with AND ("" when empty) and their params.
+        """
+        clauses, params = [], {}
+        for i, predicate in enumerate(self.predicates):
+            sql, predicate_params = predicate.compile(f"{prefix}{i}", dialect)
+            clauses.append(sql)
+            params.update(predicate_params)
+        return " AND ".join(clauses), params
+
+    def where(self, dialect=POSTGRES, prefix="f"):
+        """Like compile(), but returns a "WHERE ..." clause ("" when empty)."""
+        sql, params = self.compile(dialect, prefix)
+        return (f"WHERE {sql}" if sql else ""), params
+
+    def to_arrow(self):
+        """The spec as a pyarrow compute expression over the raw columns, or None when empty."""
+        expr = None
+        for predicate in self.predicates:
+            condition = predicate.to_arrow()
+            expr = condition if expr is None else expr & condition
+        return expr
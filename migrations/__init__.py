@@ -0,0 +1,123 @@
+import streamlit as st
+import psycopg2
+import time
+from config import DB_CONFIG
+from db import DB_HOST, DB_PORT, DB_NAME, get_connection, release_connection
+from migrations import brokerage_rollup, numeric_columns, row_keys, search_vectors, team_rollup, trigram_indexes
+
+# Schema migrations for the PostgreSQL database the views read.
+#
+# Each migration module has an idempotent upgrade(cur), run with autocommit so indexes can be built
+# CONCURRENTLY while the app keeps reading (search_vectors and numeric_columns also add stored
+# generated columns, which rewrite their tables under an ACCESS EXCLUSIVE lock that blocks readers:
+# run those in a maintenance window; row_keys backfills its column in batches instead), and an
+# INDEXES list of the (table, index name) pairs it leaves behind, which the app checks at startup.
+# Migrations that create materialized views also list them in MATERIALIZED_VIEWS. Apply them with an
+# admin login (DB_USER/DB_PASSWORD, see config.DB_CONFIG):
+#
+#     python -m migrations             # apply every migration
+#     python -m migrations --check     # only report missing indexes
+#     python -m migrations --refresh   # refresh the materialized views (after each data load)
+
+# The rollups use pg_trgm, which trigram_indexes installs; brokerage_rollup is built from team_rollup
+# (and refreshed after it)
+MIGRATIONS = [trigram_indexes, search_vectors, numeric_columns, row_keys, team_rollup, brokerage_rollup]
+
+
+def connect_admin():
+    """Opens an autocommit connection with the DB_CONFIG (environment) credentials."""
+    conn = psycopg2.connect(
+        dbname=DB_CONFIG["database"] or DB_NAME,
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        host=DB_CONFIG["host"] or DB_HOST,
+        port=DB_CONFIG["port"] or DB_PORT
+    )
+    conn.autocommit = True
+    return conn
+
+
+def apply_migrations(conn, migrations=MIGRATIONS):
+    """Runs every migration's upgrade() in order on an autocommit connection."""
+    for migration in migrations:
+        print(f"Applying {migration.__name__} ...")
+        with conn.cursor() as cur:
+            migration.upgrade(cur)
+    print("Migrations applied.")
+
+
+def refresh_materialized_views(conn, migrations=MIGRATIONS):
+    """
+    Refreshes every migration's materialized views on an autocommit connection. CONCURRENTLY, so
+    readers keep seeing the old rows until each refresh commits (the views' unique indexes allow it).
+    """
+    for migration in migrations:
+        for view in getattr(migration, "MATERIALIZED_VIEWS", []):
+            print(f"Refreshing {view} ...")
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+                # Fresh statistics for the row estimates and plans
+                cur.execute(f"ANALYZE {view}")
+            print(f"Refreshed {view} in {time.monotonic() - started:.1f}s.")
+
+
+def missing_indexes(conn, migrations=MIGRATIONS):
+    """
+    Returns the expected indexes that don't exist or are invalid.
+
+    Returns:
+        list[tuple[str, str]]: (table, index name) pairs.
+    """
+    expected = [index for migration in migrations for index in migration.INDEXES]
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE i.indisvalid AND c.relname = ANY(%s)
+            """,
+            ([name for _, name in expected],)
+        )
+        present = {row[0] for row in cur.fetchall()}
+    return [(table, name) for table, name in expected if name not in present]
+
+
+@st.cache_resource
+def _get_index_check():
+    """Process-wide result of the startup index check: {"missing": None} until a check succeeds."""
+    return {"missing": None}
+
+
+def report_missing_indexes():
+    """
+    Startup check: finds the indexes the migrations should have created but that are missing, so
+    slow filters have an obvious cause. A successful check runs once per process (the first
+    logged-in session) and is remembered; a failed one is retried on the next call.
+
+    Returns:
+        list[tuple[str, str]] | None: The missing (table, index name) pairs, or None if the check failed.
+    """
+    check = _get_index_check()
+    if check["missing"] is not None:
+        return check["missing"]
+    conn = get_connection()
+    if conn is None:
+        return None
+    try:
+        missing = missing_indexes(conn)
+        conn.rollback()
+    except psycopg2.Error as e:
+        print(f"Index check failed: {e}")
+        return None
+    finally:
+        release_connection(conn)
+    if missing:
+        print(f"Missing {len(missing)} index(es), run `python -m migrations`:")
+        for table, name in missing:
+            print(f"  {table}: {name}")
+    else:
+        print("Index check: all expected indexes are present.")
+    check["missing"] = missing
+    return missing
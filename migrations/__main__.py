@@ -0,0 +1,29 @@
+import argparse
+import sys
+from migrations import apply_migrations, connect_admin, missing_indexes, refresh_materialized_views
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the database migrations (indexes, materialized views etc.).")
+    parser.add_argument("--check", action="store_true", help="only report missing indexes")
+    parser.add_argument("--refresh", action="store_true", help="only refresh the materialized views")
+    args = parser.parse_args()
+
+    conn = connect_admin()
+    try:
+        if args.refresh:
+            refresh_materialized_views(conn)
+            return 0
+        if not args.check:
+            apply_migrations(conn)
+        missing = missing_indexes(conn)
+    finally:
+        conn.close()
+
+    for table, name in missing:
+        print(f"Missing index on {table}: {name}")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
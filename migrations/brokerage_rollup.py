@@ -0,0 +1,82 @@
+from migrations.indexes import create_index_concurrently
+from migrations.team_rollup import VIEW_NAME as TEAM_ROLLUP
+
+# Materialized brokerage aggregates for the Teams view's "Group results by Brokerage" mode.
+#
+# One row per brokerage, keyed on the canonical UPPER(TRIM("Org")): team and member counts, sales
+# totals, and the leads, lead emails, states, cities, zips and member names as arrays. It is built from
+# team_rollup (already one row per team) rather than the z_agents self-join, so a refresh only has to
+# aggregate the teams, and REFRESH ... CONCURRENTLY rewrites just the brokerages whose rows changed.
+# `python -m migrations --refresh` refreshes it right after team_rollup.
+#
+# Sales 12 Mo. is stored as 0 rather than NULL so the grouped view can page on it by keyset. The rows
+# hold every state's teams, so with a State filter the view runs brokerage_aggregate() over just the
+# selected states' teams instead. Verify these match your actual schema!
+
+VIEW_NAME = "brokerage_rollup"
+
+
+def brokerage_aggregate(teams_where=""):
+    """
+    The brokerage rollup query over the team_rollup rows matching `teams_where`.
+
+    Args:
+        teams_where (str, optional): A WHERE clause on team_rollup columns; "" aggregates every team.
+
+    Returns:
+        str: A query with the materialized view's columns, one row per brokerage.
+    """
+    return f"""
+WITH teams AS (
+    SELECT UPPER(TRIM(COALESCE(org, ''))) AS brokerage_key, t.*
+    FROM {TEAM_ROLLUP} AS t
+    {teams_where}
+),
+members AS (
+    SELECT brokerage_key, array_agg(DISTINCT member_name) AS members
+    FROM teams, unnest(teams.members) AS member_name
+    GROUP BY brokerage_key
+)
+SELECT
+    teams.brokerage_key,
+    MAX(TRIM(teams.org)) AS brokerage,
+    COUNT(*) AS teams,
+    COALESCE(cardinality(MAX(members.members)), 0) AS team_members,
+    array_agg(DISTINCT teams.team_lead) FILTER (WHERE teams.team_lead IS NOT NULL) AS team_leads,
+    array_agg(DISTINCT teams.email) FILTER (WHERE teams.email IS NOT NULL) AS team_lead_emails,
+    array_agg(DISTINCT teams.state) FILTER (WHERE teams.state <> '') AS states,
+    array_agg(DISTINCT teams.city) FILTER (WHERE teams.city IS NOT NULL) AS cities,
+    array_agg(DISTINCT teams.zip) FILTER (WHERE teams.zip IS NOT NULL) AS zips,
+    SUM(teams.sales) AS total_sales,
+    COALESCE(SUM(teams.sales_lastyear), 0) AS sales_12_mo,
+    AVG(teams.avg_sale) AS avg_sale,
+    MAX(members.members) AS members
+FROM teams
+LEFT JOIN members ON members.brokerage_key = teams.brokerage_key
+GROUP BY teams.brokerage_key
+"""
+
+
+VIEW_DEFINITION = brokerage_aggregate()
+
+# (index name, definition, unique); REFRESH ... CONCURRENTLY needs the unique index on brokerage_key
+VIEW_INDEXES = [
+    (f"{VIEW_NAME}_brokerage_key_idx", "(brokerage_key)", True),
+    # Grouped keyset order (read backwards for Sales 12 Mo. descending)
+    (f"{VIEW_NAME}_sales_12_mo_idx", "(sales_12_mo, brokerage_key)", False),
+    # Brokerage contains/excludes filters
+    (f"{VIEW_NAME}_brokerage_trgm_idx", "USING gin (brokerage gin_trgm_ops)", False),
+]
+
+# (table, index name) pairs this migration leaves behind
+INDEXES = [(VIEW_NAME, name) for name, _, _ in VIEW_INDEXES]
+
+# Materialized views `python -m migrations --refresh` refreshes
+MATERIALIZED_VIEWS = [VIEW_NAME]
+
+
+def upgrade(cur):
+    print(f"Creating materialized view {VIEW_NAME} ...")
+    cur.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW_NAME} AS {VIEW_DEFINITION} WITH DATA")
+    for name, definition, unique in VIEW_INDEXES:
+        create_index_concurrently(cur, name, VIEW_NAME, definition, unique=unique)
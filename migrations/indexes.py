@@ -0,0 +1,41 @@
+# Helpers shared by migrations that build indexes.
+
+
+def index_state(cur, name):
+    """Returns "valid", "invalid" (left behind by a failed CONCURRENTLY build) or None if the index doesn't exist."""
+    cur.execute(
+        """
+        SELECT i.indisvalid
+        FROM pg_class c
+        JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = %s
+        """,
+        (name,)
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return "valid" if row[0] else "invalid"
+
+
+def create_index_concurrently(cur, name, table, definition, unique=False):
+    """
+    Creates index `name` on `table` without blocking writes (the connection must be in autocommit).
+    An invalid leftover from an interrupted earlier run is dropped and rebuilt.
+
+    Args:
+        name (str): Index name.
+        table (str): Table name (quoted if needed).
+        definition (str): The part after ON <table>, e.g. 'USING gin (col gin_trgm_ops)'.
+        unique (bool, optional): Create a UNIQUE index.
+    """
+    state = index_state(cur, name)
+    if state == "valid":
+        print(f"Index {name} already exists.")
+        return
+    if state == "invalid":
+        print(f"Dropping invalid index {name} left by an earlier run.")
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    print(f"Creating index {name} on {table} ...")
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cur.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}")
@@ -0,0 +1,57 @@
+from migrations.indexes import create_index_concurrently
+
+# Typed numeric copies of z_agents' sales columns for the Z Agents range filters.
+#
+# "sales_lastyear" and "averageValueThreeYear" hold numbers as text (with stray "$" and ","), so the
+# view used to clean and cast them with REGEXP_REPLACE inside its WHERE clause, on every row of every
+# count. These stored generated columns do the cleanup once per write, and B-tree indexes on them turn
+# the sales number, sales value and "active teams" filters into index range scans. Values that still
+# aren't a number after the cleanup (e.g. "1.2.3") become NULL instead of failing the cast; ".5" and
+# "12." still count as numbers. sales_lastyear_num casts numeric to bigint, which rounds a decimal
+# count where the view's old text-to-bigint cast raised an error.
+#
+# Adding a stored generated column rewrites the table under an ACCESS EXCLUSIVE lock, which blocks
+# every read for the length of the rewrite: run this migration in a maintenance window. Loaders are
+# unaffected (COPY skips generated columns, INSERT computes them). Verify these match your actual schema!
+
+TABLE = '"z_agents"'
+SALES_LASTYEAR = '"sales_lastyear"'
+AVERAGE_VALUE = '"averageValueThreeYear"'
+
+
+def numeric_expression(column):
+    """`column` as numeric: everything but digits and dots stripped, NULL if that isn't a number."""
+    cleaned = f"REGEXP_REPLACE({column}::text, '[^0-9.]', '', 'g')"
+    return f"CASE WHEN {cleaned} ~ '^([0-9]+\\.?[0-9]*|\\.[0-9]+)$' THEN {cleaned}::numeric END"
+
+
+# column -> (type, expression); every part is IMMUTABLE, as generated columns require
+NUMERIC_COLUMNS = {
+    "sales_lastyear_num": ("bigint", f"({numeric_expression(SALES_LASTYEAR)})::bigint"),
+    "average_value_num": ("numeric", numeric_expression(AVERAGE_VALUE)),
+    # Generated columns can't reference each other, so the product repeats both expressions
+    "sales_value_num": (
+        "numeric",
+        f"({numeric_expression(SALES_LASTYEAR)}) * ({numeric_expression(AVERAGE_VALUE)})"
+    ),
+}
+
+
+def index_name(column):
+    table = TABLE.strip('"')
+    return f"{table}_{column}_idx".lower()
+
+
+# (table, index name) pairs this migration leaves behind
+INDEXES = [(TABLE.strip('"'), index_name(column)) for column in NUMERIC_COLUMNS]
+
+
+def upgrade(cur):
+    print(f"Adding {', '.join(NUMERIC_COLUMNS)} to {TABLE} ...")
+    # One ALTER so the table is rewritten once, not once per column
+    cur.execute(f"ALTER TABLE {TABLE} " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {column} {column_type} GENERATED ALWAYS AS ({expression}) STORED"
+        for column, (column_type, expression) in NUMERIC_COLUMNS.items()
+    ))
+    for column in NUMERIC_COLUMNS:
+        create_index_concurrently(cur, index_name(column), TABLE, f"({column})")
@@ -0,0 +1,141 @@
+from migrations.indexes import create_index_concurrently
+from pagination import ROW_ID
+
+# Stable row keys and keyset indexes for the views' "Load More" pagination.
+#
+# Each paged table gets an identity column (pagination.ROW_ID) as the unique tiebreaker of its keyset
+# order, with a unique index, plus a composite (sort key, row id) index per order so a page is an
+# index range scan instead of a sort of every matching row. The tables are bulk-loaded without a
+# declared primary key, so the identity column gives every one the same unique, never-changing key.
+#
+# Adding an identity column in one ALTER would rewrite the table under an ACCESS EXCLUSIVE lock that
+# blocks every reader, so the column is added empty (a catalog change), numbered from a sequence in
+# committed batches of BACKFILL_BATCH_ROWS, and only then turned into a GENERATED BY DEFAULT identity.
+# Every step takes at most a brief lock; rows inserted meanwhile are numbered by the column default.
+#
+# Loaders: INSERTs without a column list keep working (row_id takes its default), and BY DEFAULT also
+# accepts explicit row ids, e.g. when reloading a dump. A COPY without a column list now expects a
+# row_id value too ("missing data for column row_id"): name the loaded columns, e.g.
+# COPY agents_master (email, agent_first_name, ...) FROM ...
+#
+# The sort key expressions must match the views' *_SORT_KEYS exactly (an expression index is only
+# used for the identical expression); keep them in sync. Search orders rank by ts_rank, which no
+# index can serve. Verify these match your actual schema!
+
+ROW_KEY_TABLES = ["agents_master", "agent_metrics", "transactions_2", '"z_agents"']
+
+# Rows numbered per committed UPDATE while backfilling the row key
+BACKFILL_BATCH_ROWS = 50_000
+
+# (table, leading sort key expressions); ROW_ID is appended as the tiebreaker
+KEYSET_ORDERS = [
+    # views/transactions.py TRANSACTIONS_SORT_KEYS (read backwards for newest first)
+    ("transactions_2", ["COALESCE(list_date, DATE '0001-01-01')"]),
+    # views/z_agents.py AGENTS_SORT_KEYS
+    ('"z_agents"', ['COALESCE("Name", \'\')']),
+    # views/agents.py and views/active_agents.py page on ROW_ID alone: the unique index serves them
+]
+
+
+def row_key_index_name(table):
+    table = table.strip('"')
+    return f"{table}_{ROW_ID}_key".lower()
+
+
+def keyset_index_name(table):
+    table = table.strip('"')
+    return f"{table}_keyset_idx".lower()
+
+
+# (table, index name) pairs this migration leaves behind
+INDEXES = (
+    [(table.strip('"'), row_key_index_name(table)) for table in ROW_KEY_TABLES]
+    + [(table.strip('"'), keyset_index_name(table)) for table, _ in KEYSET_ORDERS]
+)
+
+
+def _identity_generation(cur, table):
+    """The row key's identity kind ("ALWAYS", "BY DEFAULT"), or None if it isn't an identity column (yet)."""
+    cur.execute(
+        """
+        SELECT identity_generation
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """,
+        (table.strip('"'), ROW_ID)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def add_row_key(cur, table):
+    """
+    Adds the ROW_ID identity column to `table` without rewriting it (the connection must be in
+    autocommit, so each batch commits on its own) and builds its unique index.
+    """
+    name = table.strip('"').lower()
+    sequence = f"{name}_{ROW_ID}_backfill_seq"
+    constraint = f"{name}_{ROW_ID}_not_null"
+    generation = _identity_generation(cur, table)
+    if generation == "ALWAYS":
+        # Added by an earlier version of this migration
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN {ROW_ID} SET GENERATED BY DEFAULT")
+    if generation is not None:
+        create_index_concurrently(cur, row_key_index_name(table), table, f"({ROW_ID})", unique=True)
+        return
+
+    print(f"Adding {ROW_ID} to {table} ...")
+    cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence} AS bigint")
+    # A column without a default is a catalog-only change; setting the default afterwards only
+    # applies to new rows, so neither statement rewrites the table
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {ROW_ID} bigint")
+    cur.execute(f"ALTER TABLE {table} ALTER COLUMN {ROW_ID} SET DEFAULT nextval('{sequence}')")
+
+    numbered = 0
+    while True:
+        cur.execute(
+            f"""
+            UPDATE {table} SET {ROW_ID} = nextval('{sequence}')
+            WHERE ctid = ANY(ARRAY(SELECT ctid FROM {table} WHERE {ROW_ID} IS NULL LIMIT %(batch)s))
+            """,
+            {"batch": BACKFILL_BATCH_ROWS}
+        )
+        if cur.rowcount <= 0:
+            break
+        numbered += cur.rowcount
+        print(f"Numbered {numbered:,} rows of {table} ...")
+
+    create_index_concurrently(cur, row_key_index_name(table), table, f"({ROW_ID})", unique=True)
+
+    # A validated CHECK lets SET NOT NULL skip its full-table scan under the exclusive lock;
+    # VALIDATE itself only blocks schema changes
+    cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}")
+    cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} CHECK ({ROW_ID} IS NOT NULL) NOT VALID")
+    cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}")
+    # Swap the default for the identity in one short transaction, continuing after the backfill's
+    # last number so new rows never reuse a row id
+    cur.execute("BEGIN")
+    try:
+        cur.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {ROW_ID} SET NOT NULL, "
+            f"ALTER COLUMN {ROW_ID} DROP DEFAULT"
+        )
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN {ROW_ID} ADD GENERATED BY DEFAULT AS IDENTITY")
+        cur.execute(f"SELECT last_value + 1 FROM {sequence}")
+        restart = cur.fetchone()[0]
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN {ROW_ID} RESTART WITH {int(restart)}")
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {constraint}")
+        cur.execute(f"DROP SEQUENCE {sequence}")
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+
+
+def upgrade(cur):
+    for table in ROW_KEY_TABLES:
+        add_row_key(cur, table)
+    for table, sort_keys in KEYSET_ORDERS:
+        # Expressions need their own parentheses in an index column list
+        columns = ", ".join(f"({expr})" for expr in sort_keys)
+        create_index_concurrently(cur, keyset_index_name(table), table, f"({columns}, {ROW_ID})")
@@ -0,0 +1,65 @@
+from migrations.indexes import create_index_concurrently
+from filter_spec import SEARCH_CONFIG, SEARCH_VECTOR
+
+# Full-text search columns for the views' single "Search" box.
+#
+# Each table gets a stored generated tsvector column over its name, brokerage, team and city columns
+# (names weighted highest, city lowest) and a GIN index on it, so one websearch_to_tsquery() lookup
+# covers every term instead of a separate %x% scan per text box. The 'simple' configuration is used
+# because names shouldn't be stemmed or dropped as stop words.
+#
+# Adding a stored generated column rewrites the table under an ACCESS EXCLUSIVE lock, which blocks
+# every read for the length of the rewrite: run this migration in a maintenance window. Loaders are
+# unaffected (COPY skips generated columns, INSERT computes them). Verify these match your actual schema!
+
+# table -> [(weight, [columns])]
+SEARCH_COLUMNS = {
+    "agents_master": [
+        ("A", ["agent_first_name", "agent_last_name"]),
+        ("B", ["office_name"]),
+        ("C", ["office_city"]),
+    ],
+    "agent_metrics": [
+        ("A", ["agent_first_name", "agent_last_name"]),
+        ("B", ["broker", "team"]),
+        ("C", ["office_city"]),
+    ],
+    '"z_agents"': [
+        ("A", ['"Name"']),
+        ("B", ['"Org"', '"Team"']),
+        ("C", ['"City"']),
+    ],
+    "transactions_2": [
+        ("A", ["presented_by_first_name", "presented_by_last_name"]),
+        ("B", ["brokered_by"]),
+        ("C", ["city"]),
+    ],
+}
+
+
+def index_name(table):
+    table = table.strip('"')
+    return f"{table}_{SEARCH_VECTOR}_idx".lower()
+
+
+def vector_expression(groups):
+    """The tsvector expression for [(weight, [columns])]; every part is IMMUTABLE, as generated columns require."""
+    parts = []
+    for weight, columns in groups:
+        text = " || ' ' || ".join(f"coalesce({column}::text, '')" for column in columns)
+        parts.append(f"setweight(to_tsvector('{SEARCH_CONFIG}', {text}), '{weight}')")
+    return " || ".join(parts)
+
+
+# (table, index name) pairs this migration leaves behind
+INDEXES = [(table.strip('"'), index_name(table)) for table in SEARCH_COLUMNS]
+
+
+def upgrade(cur):
+    for table, groups in SEARCH_COLUMNS.items():
+        print(f"Adding {SEARCH_VECTOR} to {table} ...")
+        cur.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {SEARCH_VECTOR} tsvector "
+            f"GENERATED ALWAYS AS ({vector_expression(groups)}) STORED"
+        )
+        create_index_concurrently(cur, index_name(table), table, f"USING gin ({SEARCH_VECTOR})")
@@ -0,0 +1,79 @@
+from migrations.indexes import create_index_concurrently
+from pagination import ROW_ID
+
+# Materialized team rollup for the Teams view.
+#
+# One row per team (z_agents rows sharing a "Team_encodedZuid"): the lead's attributes, the member
+# count and the member names as an array. The Teams loaders read it directly instead of self-joining
+# z_agents and grouping on every request, so the team size filter is a plain range on an indexed
+# column rather than a HAVING over the join.
+#
+# The view only changes when it is refreshed: run `python -m migrations --refresh` after each z_agents
+# load (REFRESH ... CONCURRENTLY, so the app keeps reading the old rows meanwhile). CREATE ... IF NOT
+# EXISTS won't pick up a changed definition; drop the view first to rebuild it (DROP ... CASCADE also
+# drops brokerage_rollup, which the next migration run recreates). Leads are picked by the row key
+# that migrations/row_keys.py adds, which runs first.
+# Verify these match your actual schema!
+
+VIEW_NAME = "team_rollup"
+
+VIEW_DEFINITION = f"""
+SELECT
+    lead."Team_encodedZuid" AS team_id,
+    lead."Team" AS team_name,
+    lead."Name" AS team_lead,
+    members.member_count AS team_members,
+    members.member_names AS members,
+    lead."Org" AS org,
+    COALESCE(lead."State", '') AS state,
+    lead."City" AS city,
+    lead."Zip" AS zip,
+    lead."sales" AS sales,
+    lead."sales_lastyear" AS sales_lastyear,
+    lead."averageValueThreeYear" AS avg_sale,
+    lead."Email" AS email,
+    lead."Cell" AS cell
+FROM (
+    -- One lead row per team (the lowest row key if a team lists several), so a refresh keeps
+    -- picking the same lead whatever VACUUM FULL or updates do to the rows' physical order
+    SELECT DISTINCT ON ("Team_encodedZuid")
+        "Team_encodedZuid", "Team", "Name", "Org", "State", "City", "Zip",
+        "sales", "sales_lastyear", "averageValueThreeYear", "Email", "Cell"
+    FROM "z_agents"
+    WHERE "Team_role" = 'Lead' AND "Team_encodedZuid" IS NOT NULL
+    ORDER BY "Team_encodedZuid", {ROW_ID}
+) AS lead
+JOIN (
+    SELECT
+        "Team_encodedZuid",
+        COUNT(*) AS member_count,
+        array_agg(DISTINCT "Name") FILTER (WHERE "Name" IS NOT NULL) AS member_names
+    FROM "z_agents"
+    WHERE "Team_encodedZuid" IS NOT NULL
+    GROUP BY "Team_encodedZuid"
+) AS members ON members."Team_encodedZuid" = lead."Team_encodedZuid"
+"""
+
+# (index name, definition, unique); REFRESH ... CONCURRENTLY needs the unique index on team_id
+VIEW_INDEXES = [
+    (f"{VIEW_NAME}_team_id_idx", "(team_id)", True),
+    # The Teams keyset order and the State filter
+    (f"{VIEW_NAME}_state_idx", "(state, team_id)", False),
+    # Brokerage contains/excludes filters
+    (f"{VIEW_NAME}_org_trgm_idx", "USING gin (org gin_trgm_ops)", False),
+    # Team size range
+    (f"{VIEW_NAME}_team_members_idx", "(team_members)", False),
+]
+
+# (table, index name) pairs this migration leaves behind
+INDEXES = [(VIEW_NAME, name) for name, _, _ in VIEW_INDEXES]
+
+# Materialized views `python -m migrations --refresh` refreshes
+MATERIALIZED_VIEWS = [VIEW_NAME]
+
+
+def upgrade(cur):
+    print(f"Creating materialized view {VIEW_NAME} ...")
+    cur.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW_NAME} AS {VIEW_DEFINITION} WITH DATA")
+    for name, definition, unique in VIEW_INDEXES:
+        create_index_concurrently(cur, name, VIEW_NAME, definition, unique=unique)
@@ -0,0 +1,46 @@
+from migrations.indexes import create_index_concurrently
+
+# GIN trigram indexes for the views' "contains" filters.
+#
+# FilterSpec compiles contains() filters to `col ILIKE '%text%'` on the bare column, which pg_trgm
+# can answer from these indexes instead of scanning the table (for search text of 3+ characters).
+# Keep this list in sync with the contains() columns of the Postgres views' _*_filter() functions.
+# Verify these match your actual schema!
+
+TRIGRAM_INDEXES = [
+    # views/active_agents.py
+    ("agent_metrics", "agent_first_name"),
+    ("agent_metrics", "agent_last_name"),
+    ("agent_metrics", "broker"),
+    ("agent_metrics", "office_state"),
+    ("agent_metrics", "team"),
+    ("agent_metrics", "association"),
+    # views/agents.py
+    ("agents_master", "agent_first_name"),
+    ("agents_master", "agent_last_name"),
+    ("agents_master", "office_name"),
+    ("agents_master", "association"),
+    # views/transactions.py
+    ("transactions_2", "presented_by_first_name"),
+    ("transactions_2", "presented_by_last_name"),
+    ("transactions_2", "brokered_by"),
+    # views/z_agents.py and views/teams.py
+    ('"z_agents"', '"Org"'),
+    ('"z_agents"', '"Team"'),
+    ('"z_agents"', '"Name"'),
+]
+
+
+def index_name(table, column):
+    table, column = table.strip('"'), column.strip('"')
+    return f"{table}_{column}_trgm_idx".lower()
+
+
+# (table, index name) pairs this migration leaves behind
+INDEXES = [(table.strip('"'), index_name(table, column)) for table, column in TRIGRAM_INDEXES]
+
+
+def upgrade(cur):
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in TRIGRAM_INDEXES:
+        create_index_concurrently(cur, index_name(table, column), table, f"USING gin ({column} gin_trgm_ops)")
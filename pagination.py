@@ -0,0 +1,84 @@
+import datetime
+import pandas as pd
+
+# Keyset ("seek") pagination helpers.
+#
+# Instead of LIMIT/OFFSET, each page is fetched with WHERE (sort_key, tiebreaker) > (last seen values),
+# so with an index on the sort keys page N costs the same as page 1, and rows don't shift between
+# pages when the table changes.
+# Loaders select their sort key expressions as hidden "_seek_<i>" columns; views split those off
+# with split_page() and keep the returned cursor in session state for the next "Load More".
+
+SEEK_COL_PREFIX = "_seek_"
+
+# Unique tiebreaker column: a stable identity added to every keyset-paged table by
+# migrations/row_keys.py, which also indexes (sort key, row id) for each view's order. Unlike the
+# physical ctid it doesn't change when a row is updated or the table is vacuumed or rewritten.
+ROW_ID = "row_id"
+
+
+def seek_select(sort_keys):
+    """SELECT-list fragment exposing the sort keys as hidden _seek_<i> columns."""
+    return ",\n        ".join(f'{expr} AS "{SEEK_COL_PREFIX}{i}"' for i, expr in enumerate(sort_keys))
+
+
+def seek_order_by(sort_keys, descending=False):
+    """ORDER BY clause matching the seek predicate (every key sorted in the same direction)."""
+    direction = "DESC" if descending else "ASC"
+    return "ORDER BY " + ", ".join(f"{expr} {direction}" for expr in sort_keys)
+
+
+def seek_predicate(sort_keys, after, descending=False, positional=False):
+    """
+    Builds the WHERE predicate selecting rows strictly after the cursor `after`.
+
+    Args:
+        sort_keys (list[str]): SQL expressions, most significant first. The last one must be unique.
+        after (tuple | None): Cursor returned by split_page() for the previous page, or None for page 1.
+        descending (bool): Whether the keys are sorted descending.
+        positional (bool): Emit %s placeholders and a list of params instead of %(seek_<i>)s and a dict.
+
+    Returns:
+        tuple[str | None, dict | list]: The predicate (None when `after` is None) and its params.
+    """
+    if after is None:
+        return None, ([] if positional else {})
+    op = "<" if descending else ">"
+    if positional:
+        binds = ["%s"] * len(sort_keys)
+        params = list(after)
+    else:
+        binds = [f"%(seek_{i})s" for i in range(len(sort_keys))]
+        params = {f"seek_{i}": value for i, value in enumerate(after)}
+    # Row-value comparison, so a composite index on the sort keys can serve it
+    return f"({', '.join(sort_keys)}) {op} ({', '.join(binds)})", params
+
+
+def split_page(df):
+    """
+    Separates the hidden _seek_<i> columns from a loaded page.
+
+    Returns:
+        tuple[pd.DataFrame, tuple | None]: The page without seek columns, and the cursor
+        (sort key values of its last row) to pass as `after` for the next page.
+    """
+    seek_cols = [col for col in df.columns if str(col).startswith(SEEK_COL_PREFIX)]
+    if not seek_cols:
+        return df, None
+    cursor = None
+    if not df.empty:
+        cursor = tuple(_to_python(value) for value in df[seek_cols].iloc[-1])
+    return df.drop(columns=seek_cols), cursor
+
+
+def _to_python(value):
+    """Converts NumPy/pandas scalars back to plain Python values psycopg2 can adapt."""
+    if value is None or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, (datetime.date, str)):
+        return value
+    if hasattr(value, "item"):
+        return value.item()
+    return value
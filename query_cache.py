@@ -0,0 +1,403 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from config import (QUERY_CACHE_MAX_BYTES, QUERY_CACHE_DEFAULT_TTL, QUERY_CACHE_TABLE_TTLS,
+                    CACHE_PATH, QUERY_CACHE_DISK_MAX_BYTES, WATERMARK_PROBE_INTERVAL)
+
+# Process-wide query result cache shared by every session.
+#
+# Entries are keyed by a fingerprint of the normalized SQL text, its bound params and a namespace, so
+# analysts running the same filters share one result. Loaders put the database login in the namespace
+# (see db._cache_namespace) where logins differ, so a result is only served to sessions on the login
+# that produced it; the Snowflake runner shares one service login. The cache holds at most
+# QUERY_CACHE_MAX_BYTES (least recently used entries are evicted first), and each entry expires after
+# the shortest TTL of the tables its query reads (QUERY_CACHE_TABLE_TTLS, falling back to
+# QUERY_CACHE_DEFAULT_TTL).
+#
+# Expensive loaders can also opt into a persistent tier (DiskCache): zstd-compressed Parquet files under
+# CACHE_PATH that survive restarts and are read back memory-mapped. cache_get/cache_put consult and fill
+# both tiers.
+#
+# Entries are also stamped with a watermark of the tables they read (see current_watermark): a cheap
+# per-table "has this changed?" probe registered per data source. An entry whose watermark no longer
+# matches is dropped on lookup, so table TTLs only bound how long a probe miss can go unnoticed. Results
+# whose tables couldn't all be probed carry no watermark and keep at most QUERY_CACHE_DEFAULT_TTL, and
+# a lookup whose probe fails never serves an entry stored with a watermark.
+
+# Table names after FROM/JOIN; names followed by "(" are table functions (e.g. TABLE(RESULT_SCAN(...)))
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+((?:"?[A-Za-z_][\w$]*"?\.)*"?[A-Za-z_][\w$]*"?)(?![\w$]|\s*\()',
+                        re.IGNORECASE)
+
+
+def _normalize_sql(query):
+    """Collapses whitespace and drops a trailing semicolon so formatting differences share an entry."""
+    return " ".join(query.split()).rstrip(";").strip()
+
+
+def _normalize_params(params):
+    """Renders params deterministically: dicts sorted by key, tuples/lists/sets as lists."""
+    if isinstance(params, dict):
+        return {str(key): _normalize_params(value) for key, value in sorted(params.items())}
+    if isinstance(params, (list, tuple)):
+        return [_normalize_params(value) for value in params]
+    if isinstance(params, (set, frozenset)):
+        return sorted(_normalize_params(value) for value in params)
+    return params
+
+
+def fingerprint(query, params=None, namespace=""):
+    """
+    Returns a stable hex key for (namespace, SQL, params).
+
+    Args:
+        query (str): The SQL query string.
+        params (dict | tuple | list, optional): Parameters bound to the query.
+        namespace (str, optional): Separates otherwise identical queries (e.g. database, result type).
+
+    Returns:
+        str: A sha256 hex digest.
+    """
+    payload = json.dumps(
+        [namespace, _normalize_sql(query), _normalize_params(params)],
+        default=str, separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def tables_in(query):
+    """Lower-cased table names referenced after FROM/JOIN (unqualified, quotes stripped)."""
+    return {match.split(".")[-1].strip('"').lower() for match in _TABLE_REF.findall(query)}
+
+
+def ttl_for(query):
+    """TTL in seconds for a query's result: the shortest TTL among the tables it reads."""
+    ttls = [QUERY_CACHE_TABLE_TTLS[table] for table in tables_in(query) if table in QUERY_CACHE_TABLE_TTLS]
+    return min(ttls) if ttls else QUERY_CACHE_DEFAULT_TTL
+
+
+def _sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pa.Table, pa.RecordBatch)):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    # Views add and rewrite columns on the frames they get back; never hand out the cached object.
+    # Arrow tables are immutable and can be shared as-is.
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    return value
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query results with a byte budget and per-entry expiry.
+    """
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, nbytes, expires_at, watermark), least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        _, nbytes, _, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key, watermark=None):
+        """
+        Returns a copy of the cached value, or None on a miss, expired entry, or an entry stored
+        under a different table watermark (see _watermarks_match).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is not None and not _watermarks_match(entry[3], watermark):
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[0]
+        return _copy(value)
+
+    def put(self, key, value, ttl, watermark=None):
+        """Stores a copy of `value` for `ttl` seconds, evicting least recently used entries to fit."""
+        nbytes = _sizeof(value)
+        if ttl <= 0 or nbytes > self.max_bytes:
+            return
+        value = _copy(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while self._entries and self._bytes + nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = (value, nbytes, time.monotonic() + ttl, watermark)
+            self._bytes += nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current footprint, e.g. for logging or an admin panel."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@st.cache_resource
+def get_query_cache():
+    """The process-wide QueryCache instance."""
+    return QueryCache()
+
+
+# Parquet schema metadata keys holding the entry's absolute expiry (epoch seconds) and table watermark
+_EXPIRES_AT = b"query_cache_expires_at"
+_WATERMARK = b"query_cache_watermark"
+
+
+class DiskCache:
+    """
+    Persistent cache of query results as compressed Parquet files, one per fingerprint.
+
+    Entries expire by the wall-clock time stored in their schema metadata. When the directory
+    grows past `max_bytes`, the least recently read files are removed (reads touch the mtime).
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=QUERY_CACHE_DISK_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.parquet")
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, key, watermark=None):
+        """
+        Returns (value, remaining_ttl_seconds), or (None, 0) on a miss, or an expired, stale
+        (watermark mismatch) or unreadable entry. DataFrames come back as DataFrames.
+        """
+        path = self._file(key)
+        try:
+            table = pq.read_table(path, memory_map=True)
+        except FileNotFoundError:
+            return None, 0
+        except (OSError, pa.ArrowException) as e:
+            print(f"Discarding unreadable cache file {path}: {e}")
+            self._remove(path)
+            return None, 0
+        metadata = table.schema.metadata or {}
+        remaining = float(metadata.get(_EXPIRES_AT, b"0")) - time.time()
+        stored_watermark = metadata.get(_WATERMARK)
+        stored_watermark = stored_watermark.decode() if stored_watermark is not None else None
+        if remaining <= 0 or not _watermarks_match(stored_watermark, watermark):
+            self._remove(path)
+            return None, 0
+        try:
+            os.utime(path)  # mark as recently used for size-cap eviction
+        except OSError:
+            pass
+        if b"pandas" in metadata:
+            return table.to_pandas(), remaining
+        return table, remaining
+
+    def put(self, key, value, ttl, watermark=None):
+        """Writes `value` (DataFrame or Arrow table) for `ttl` seconds. Values Arrow can't represent are skipped."""
+        if ttl <= 0:
+            return
+        try:
+            if isinstance(value, pd.DataFrame):
+                table = pa.Table.from_pandas(value, preserve_index=False)
+            elif isinstance(value, pa.Table):
+                table = value
+            else:
+                return
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            print(f"Not persisting query result {key[:12]}: {e}")
+            return
+        metadata = dict(table.schema.metadata or {})
+        metadata[_EXPIRES_AT] = str(time.time() + ttl).encode()
+        if watermark is not None:
+            metadata[_WATERMARK] = watermark.encode()
+        table = table.replace_schema_metadata(metadata)
+        # Write to a temporary name and rename, so readers never see a partial file
+        tmp_path = os.path.join(self.path, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, self._file(key))
+        except OSError as e:
+            print(f"Error writing query cache file: {e}")
+            self._remove(tmp_path)
+            return
+        self._enforce_size_cap()
+
+    def _enforce_size_cap(self):
+        with self._lock:
+            files = []
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".parquet"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".parquet"):
+                        self._remove(entry.path)
+
+
+@st.cache_resource
+def get_disk_cache():
+    """The process-wide DiskCache instance."""
+    return DiskCache()
+
+
+def cache_get(key, persist=False, watermark=None):
+    """
+    Looks `key` up in memory, then (with `persist=True`) on disk. Disk hits are promoted to the
+    in-memory cache for the rest of their TTL. Entries stored under a different `watermark` are dropped.
+    """
+    value = get_query_cache().get(key, watermark)
+    if value is not None or not persist:
+        return value
+    value, remaining = get_disk_cache().get(key, watermark)
+    if value is not None:
+        get_query_cache().put(key, value, remaining, watermark)
+    return value
+
+
+def cache_put(key, query, value, persist=False, watermark=None):
+    """
+    Stores a query result in memory and (with `persist=True`) on disk, with the query's table TTL.
+    Pass the watermark taken *before* running the query, so a change that lands mid-query is not masked.
+    Without a watermark nothing would notice the tables changing, so the TTL is capped at
+    QUERY_CACHE_DEFAULT_TTL.
+    """
+    ttl = ttl_for(query)
+    if watermark is None:
+        ttl = min(ttl, QUERY_CACHE_DEFAULT_TTL)
+    get_query_cache().put(key, value, ttl, watermark)
+    if persist:
+        get_disk_cache().put(key, value, ttl, watermark)
+
+
+# --- Table watermarks ---
+def _watermarks_match(stored, current):
+    """
+    Whether an entry stored under watermark `stored` may be served now. Both None (no probe for these
+    tables; the entry's TTL was capped) matches; one side None means a probe failed, which can't
+    vouch for the entry, so it is a miss.
+    """
+    return stored == current
+
+
+_WATERMARK_SOURCES = {}
+
+
+def register_watermark_source(source, probe):
+    """
+    Registers the watermark probe for a data source ("postgres", "snowflake").
+
+    `probe(tables)` receives lower-cased, unqualified table names and returns a dict mapping each
+    table it could check to a JSON-serializable value that changes whenever the table's data does.
+    It may raise; a failed probe means results are cached on QUERY_CACHE_DEFAULT_TTL alone and entries
+    stored with a watermark aren't served until the probe works again.
+    """
+    _WATERMARK_SOURCES[source] = probe
+
+
+@st.cache_resource
+def _get_watermark_state():
+    """Recent probe results shared by all sessions: (source, table) -> (watermark, probed_at)."""
+    return {"lock": threading.Lock(), "values": {}}
+
+
+def table_watermarks(source, tables):
+    """
+    Returns {table: watermark} for `tables`, probing at most once per WATERMARK_PROBE_INTERVAL
+    seconds per table. Tables the probe could not check map to None.
+    """
+    state = _get_watermark_state()
+    now = time.monotonic()
+    result, stale = {}, []
+    with state["lock"]:
+        for table in tables:
+            cached = state["values"].get((source, table))
+            if cached is not None and now - cached[1] < WATERMARK_PROBE_INTERVAL:
+                result[table] = cached[0]
+            else:
+                stale.append(table)
+    probe = _WATERMARK_SOURCES.get(source)
+    if stale and probe is not None:
+        try:
+            probed = probe(sorted(stale))
+        except Exception as e:
+            print(f"Watermark probe for {source} failed: {e}")
+            probed = {}
+        with state["lock"]:
+            for table in stale:
+                result[table] = probed.get(table)
+                state["values"][(source, table)] = (result[table], now)
+    return {table: result.get(table) for table in tables}
+
+
+def current_watermark(source, query):
+    """
+    Combined watermark of every table `query` reads, as a string to stamp cache entries with,
+    or None if any of them could not be probed (a change to it would go unnoticed).
+    """
+    tables = sorted(tables_in(query))
+    if not tables or source not in _WATERMARK_SOURCES:
+        return None
+    watermarks = table_watermarks(source, tables)
+    if any(value is None for value in watermarks.values()):
+        return None
+    return json.dumps(watermarks, sort_keys=True, default=str)
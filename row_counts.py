@@ -0,0 +1,97 @@
+import streamlit as st
+from db import submit_query
+from config import ESTIMATE_ROW_COUNTS, COUNT_POLL_INTERVAL
+
+# Estimate-first row counts.
+#
+# The "X of Y" caption and the Load More decision only need a rough total to render, so views call
+# start_count() with their count function: it stores the planner estimate under `total_key` right
+# away and runs the exact COUNT(*) on the shared query executor. Each later run calls
+# refresh_count() (or renders watch_count()) to swap the exact number in once it is ready.
+#
+# Count functions must accept `estimate=True` and return a planner estimate (or None) in that mode.
+
+_PENDING_SUFFIX = "__pending_count"
+
+
+def _pending_key(total_key):
+    return f"{total_key}{_PENDING_SUFFIX}"
+
+
+def _drop_pending(total_key):
+    """Forgets the exact count pending for `total_key`, cancelling it if it hasn't started yet."""
+    future = st.session_state.pop(_pending_key(total_key), None)
+    if future is not None:
+        future.cancel()
+
+
+def start_count(total_key, count_fn, *args, **kwargs):
+    """
+    Sets st.session_state[total_key] to an estimate of count_fn(*args, **kwargs) and starts
+    the exact count in the background. Any count still pending for `total_key` is superseded:
+    cancelled if it is still queued, its result ignored otherwise.
+
+    Returns:
+        int: The value stored (the estimate, or the exact count if estimating is disabled/failed).
+    """
+    _drop_pending(total_key)
+    if not ESTIMATE_ROW_COUNTS:
+        st.session_state[total_key] = count_fn(*args, **kwargs)
+        return st.session_state[total_key]
+
+    # Submit the exact count first so it starts while the estimate is being planned
+    future = submit_query(count_fn, *args, **kwargs)
+    estimate = count_fn(*args, estimate=True, **kwargs)
+    if estimate is None:
+        st.session_state[total_key] = future.result()
+    else:
+        st.session_state[_pending_key(total_key)] = future
+        st.session_state[total_key] = estimate
+    return st.session_state[total_key]
+
+
+def reset_count(total_key, value=0):
+    """Sets st.session_state[total_key] to `value` and drops any exact count still pending for it."""
+    _drop_pending(total_key)
+    st.session_state[total_key] = value
+
+
+def refresh_count(total_key):
+    """
+    Swaps the exact count into st.session_state[total_key] if it has finished.
+
+    Returns:
+        bool: True if the stored value is exact.
+    """
+    future = st.session_state.get(_pending_key(total_key))
+    if future is None:
+        return True
+    if not future.done():
+        return False
+    st.session_state.pop(_pending_key(total_key), None)
+    try:
+        st.session_state[total_key] = future.result()
+    except Exception as e:
+        # Keep showing the estimate rather than failing the page over a caption
+        print(f"Exact count for {total_key} failed: {e}")
+    return True
+
+
+def count_label(total_key):
+    """Formats the stored total for captions, prefixed with "~" while it is still an estimate."""
+    exact = refresh_count(total_key)
+    total = st.session_state.get(total_key) or 0
+    return f"{total:,}" if exact else f"~{total:,}"
+
+
+@st.fragment(run_every=COUNT_POLL_INTERVAL)
+def _poll_exact_count(total_key):
+    if refresh_count(total_key):
+        # Rerun the whole page so captions and Load More pick up the exact total
+        st.rerun()
+
+
+def watch_count(total_key):
+    """Renders a small polling fragment while the exact count for `total_key` is still running."""
+    if not refresh_count(total_key):
+        _poll_exact_count(total_key)
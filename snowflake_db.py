@@ -0,0 +1,593 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import snowflake.connector
+from snowflake.connector.errors import DatabaseError, OperationalError
+from query_cache import cache_get, cache_put, fingerprint, current_watermark, register_watermark_source
+from config import (SNOWFLAKE_POOL_MAX_CONN, SNOWFLAKE_POOL_IDLE_TIMEOUT, SNOWFLAKE_PING_AFTER,
+                    SNOWFLAKE_POOL_CHECKOUT_TIMEOUT,
+                    SNOWFLAKE_HEARTBEAT_FREQUENCY, SNOWFLAKE_POLL_INTERVAL, SNOWFLAKE_RESULT_MAX_AGE,
+                    SNOWFLAKE_RESULT_MAX_ENTRIES, QUERY_CACHE_DEFAULT_TTL)
+
+SNOWFLAKE = {
+    "user": os.getenv("SNOWFLAKE_USER"),
+    "password": os.getenv("SNOWFLAKE_PASSWORD"),
+    "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+    "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+    "database": os.getenv("SNOWFLAKE_DATABASE"),
+    "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+}
+
+# Error codes Snowflake returns once a session or its token is no longer valid
+SESSION_EXPIRED_ERRNOS = {390111, 390112, 390114}
+
+
+def connect_snowflake() -> snowflake.connector.SnowflakeConnection:
+    """Opens a new Snowflake session with client keep-alive (heartbeat) enabled."""
+    try:
+        conn = snowflake.connector.connect(
+            **SNOWFLAKE,
+            client_session_keep_alive=True,
+            client_session_keep_alive_heartbeat_frequency=SNOWFLAKE_HEARTBEAT_FREQUENCY
+        )
+        return conn
+    except Exception as e:
+        st.error(f"Failed to connect to Snowflake: {e}")
+        return None
+
+
+def _is_session_error(e):
+    """True for errors that mean the session is dead (expired, or the network dropped) rather than a bad query."""
+    return isinstance(e, OperationalError) or getattr(e, "errno", None) in SESSION_EXPIRED_ERRNOS
+
+
+class SnowflakeSessionPool:
+    """
+    Thread-safe pool of warm Snowflake sessions shared by every user (the app connects with one
+    service login from the environment).
+
+    At most `maxconn` sessions exist at once (idle plus checked out): sessions are created lazily up
+    to that cap, and checkouts beyond it wait for a session to be returned. Idle sessions are closed
+    after `idle_timeout` seconds and checked with SELECT 1 before reuse once they have been idle for
+    `ping_after` seconds.
+    """
+
+    def __init__(self, maxconn=SNOWFLAKE_POOL_MAX_CONN, idle_timeout=SNOWFLAKE_POOL_IDLE_TIMEOUT,
+                 ping_after=SNOWFLAKE_PING_AFTER):
+        self.maxconn = max(maxconn, 1)
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, last_returned_at), most recently returned last
+        self._in_use = 0  # sessions checked out, including logins still in progress
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception as e:
+            print(f"Error closing Snowflake session: {e}")
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, last_used):
+        if conn.is_closed():
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout=SNOWFLAKE_POOL_CHECKOUT_TIMEOUT):
+        """
+        Returns a live session: a warm idle one if available, otherwise a new login if the pool is
+        below `maxconn` (None if the login fails). Waits up to `timeout` seconds for a session to be
+        returned when the pool is at its cap, then raises OperationalError.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            expired = []
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    expired += [c for c, t in self._idle if now - t > self.idle_timeout]
+                    self._idle = [(c, t) for c, t in self._idle if now - t <= self.idle_timeout]
+                    if self._idle or self._in_use + len(expired) < self.maxconn:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise OperationalError(msg="Timed out waiting for a pooled Snowflake session.")
+                    self._cond.wait(remaining)
+                entry = self._idle.pop() if self._idle else None
+                self._in_use += 1
+            # Closing, pinging and logging in are slow; none of them hold the lock
+            for conn in expired:
+                self._discard(conn)
+            if entry is None:
+                conn = connect_snowflake()
+                if conn is None:
+                    self._release_slot()
+                return conn
+            conn, last_used = entry
+            if self._is_healthy(conn, last_used):
+                return conn
+            self._discard(conn)
+            self._release_slot()
+
+    def putconn(self, conn, discard=False):
+        """Returns a checked-out session to the pool, or closes it if `discard` is set."""
+        if conn is None:
+            return
+        if discard or conn.is_closed():
+            self._discard(conn)
+            self._release_slot()
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+@st.cache_resource
+def get_snowflake_pool():
+    """The process-wide SnowflakeSessionPool."""
+    return SnowflakeSessionPool()
+
+
+def _prepare_sql(query, params):
+    # Normalize any Unicode comparison operators that may sneak in
+    sql = query.replace("≥", ">=").replace("≤", "<=")
+    # Convert SQLAlchemy/colon binds (:name) to pyformat binds (%(name)s)
+    if params:
+        sql = re.sub(r":([A-Za-z_][A-Za-z0-9_]*)", r"%(\1)s", sql)
+    return sql
+
+
+def _open_cursor(sql, params, asynchronous=False):
+    """
+    Executes `sql` on a pooled session and returns (conn, cursor) positioned on the result; hand both
+    back with _close_cursor. If the session turns out to be expired or disconnected, it is replaced
+    and the statement retried once on a fresh login. With `asynchronous=True` the statement is only
+    submitted (execute_async) and the cursor's sfqid identifies it.
+    """
+    pool = get_snowflake_pool()
+    for attempt in range(2):
+        conn = pool.getconn()
+        if conn is None:
+            raise OperationalError("Snowflake connection was not established.")
+        cur = conn.cursor()
+        execute = cur.execute_async if asynchronous else cur.execute
+        try:
+            if params:
+                execute(sql, params)
+            else:
+                execute(sql)
+            return conn, cur
+        except DatabaseError as e:
+            discard = _is_session_error(e)
+            _close_cursor(conn, cur, discard=discard)
+            if discard and attempt == 0:
+                print(f"Snowflake session lost ({e}); reconnecting and retrying.")
+                continue
+            raise
+        except Exception:
+            _close_cursor(conn, cur)
+            raise
+
+
+def _close_cursor(conn, cur, discard=False):
+    try:
+        cur.close()
+    except Exception as e:
+        print(f"Error closing Snowflake cursor: {e}")
+    get_snowflake_pool().putconn(conn, discard=discard)
+
+
+def run_snowflake_query(query, params=None, cache=False, persist=False):
+    """
+    Executes a query on Snowflake and returns a DataFrame.
+
+    Results are fetched as Arrow result batches and converted column-wise, so no per-row Python
+    objects are built (NUMBER columns arrive as int64/float64, dates and timestamps typed).
+
+    Args:
+        query (str): The SQL query string (can contain :name binds).
+        params (dict, optional): Values for the binds. Defaults to None.
+        cache (bool, optional): Serve from / store in the shared query cache (see query_cache.py).
+        persist (bool, optional): Also keep the result in the on-disk Parquet cache across restarts.
+
+    Returns:
+        pd.DataFrame: The query results, or an empty DataFrame on error.
+    """
+    sql = _prepare_sql(query, params)
+    cache_key = fingerprint(sql, params, namespace="snowflake") if cache or persist else None
+    watermark = current_watermark("snowflake", sql) if cache_key else None
+    if cache_key:
+        cached = cache_get(cache_key, persist=persist, watermark=watermark)
+        if cached is not None:
+            return cached
+    try:
+        conn, cur = _open_cursor(sql, params)
+        discard = False
+        try:
+            df = cur.fetch_arrow_all(force_return_table=True).to_pandas()
+        except DatabaseError as e:
+            discard = _is_session_error(e)
+            raise
+        finally:
+            _close_cursor(conn, cur, discard=discard)
+        if cache_key:
+            cache_put(cache_key, sql, df, persist=persist, watermark=watermark)
+        return df
+    except Exception as e:
+        st.error(f"Error executing query: {e}")
+        st.error(f"SQL Query: {sql}")
+        if params:
+            st.error(f"Parameters: {params}")
+        return pd.DataFrame()
+
+
+def fetch_snowflake_arrow(query, params=None):
+    """
+    Executes a query on Snowflake and returns the result as a pyarrow Table. Unlike
+    run_snowflake_query, errors are raised rather than reported, for callers running
+    outside a page render (e.g. background refreshes).
+    """
+    sql = _prepare_sql(query, params)
+    conn, cur = _open_cursor(sql, params)
+    discard = False
+    try:
+        return cur.fetch_arrow_all(force_return_table=True)
+    except DatabaseError as e:
+        discard = _is_session_error(e)
+        raise
+    finally:
+        _close_cursor(conn, cur, discard=discard)
+
+
+def run_snowflake_query_iter(query, params=None, as_arrow=False):
+    """
+    Streams a Snowflake result batch by batch (the connector's Arrow result chunks), holding one
+    pooled session for the duration and only one batch in memory at a time.
+
+    Args:
+        query (str): The SQL query string (can contain :name binds).
+        params (dict, optional): Values for the binds. Defaults to None.
+        as_arrow (bool, optional): Yield pyarrow Tables instead of DataFrames.
+
+    Yields:
+        pd.DataFrame | pyarrow.Table: One result batch.
+    """
+    sql = _prepare_sql(query, params)
+    try:
+        conn, cur = _open_cursor(sql, params)
+    except Exception as e:
+        st.error(f"Error executing query: {e}")
+        return
+    discard = False
+    total_rows = 0
+    try:
+        batches = cur.fetch_arrow_batches() if as_arrow else cur.fetch_pandas_batches()
+        for batch in batches:
+            total_rows += batch.num_rows if as_arrow else len(batch)
+            yield batch
+        print(f"Streaming Snowflake query finished. Rows returned: {total_rows}")
+    except DatabaseError as e:
+        discard = _is_session_error(e)
+        st.error(f"Error executing query: {e}")
+    finally:
+        _close_cursor(conn, cur, discard=discard)
+
+
+def snowflake_query_to_csv(query, params=None, dest=None):
+    """
+    Exports a Snowflake query as CSV by writing its Arrow batches straight to `dest` with
+    pyarrow's CSV writer, without building a DataFrame.
+
+    Args:
+        query (str): The SELECT to export (can contain :name binds).
+        params (dict, optional): Values for the binds. Defaults to None.
+        dest (str | file-like): A file path or binary file object to write to.
+
+    Returns:
+        bool: True on success, False on error.
+    """
+    writer = None
+    try:
+        for batch in run_snowflake_query_iter(query, params, as_arrow=True):
+            if writer is None:
+                writer = pa_csv.CSVWriter(dest, batch.schema)
+            elif batch.schema != writer.schema:
+                batch = batch.cast(writer.schema)
+            writer.write_table(batch)
+        if writer is None:
+            # No rows: still produce an (empty) file
+            if isinstance(dest, (str, os.PathLike)):
+                open(dest, "wb").close()
+        return True
+    except (OSError, pa.ArrowException) as e:
+        st.error(f"Export error: {e}")
+        print(f"Snowflake CSV export error: {e}")
+        return False
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# --- Asynchronous execution ---
+def cancel_snowflake_queries(qids):
+    """Asks Snowflake to cancel the given query ids (already finished ones are ignored)."""
+    for qid in qids:
+        try:
+            conn, cur = _open_cursor("SELECT SYSTEM$CANCEL_QUERY(%(qid)s)", {"qid": qid})
+            _close_cursor(conn, cur)
+            print(f"Cancelled Snowflake query {qid}")
+        except Exception as e:
+            print(f"Could not cancel Snowflake query {qid}: {e}")
+
+
+def execute_snowflake_queries_async(state_key, queries, poll_interval=SNOWFLAKE_POLL_INTERVAL):
+    """
+    Submits several Snowflake queries at once with execute_async and waits until they have all
+    finished, so the warehouse works on them side by side. Results are left on the server, to be
+    read by query id (fetch_snowflake_result, or RESULT_SCAN).
+
+    The submitted query ids are recorded in st.session_state[state_key]. If the script run is
+    interrupted while waiting (a filter changed and Streamlit reran), the outstanding queries are
+    cancelled right away; any ids left behind by a run that died harder are cancelled the next time
+    this is called with the same `state_key`.
+
+    Args:
+        state_key (str): Session state key for the in-flight query ids, one per call site.
+        queries (list[tuple[str, dict | None]]): (query, params) pairs; queries can use :name binds.
+        poll_interval (float, optional): Seconds between status checks.
+
+    Returns:
+        list[str | None]: The query id of each successful query, in order (None where it failed).
+    """
+    stale = st.session_state.pop(state_key, None)
+    if stale:
+        cancel_snowflake_queries(stale)
+
+    prepared = [(_prepare_sql(query, params), params) for query, params in queries]
+    qids = [None] * len(prepared)
+    pending = set()
+    status = st.empty()
+    try:
+        for i, (sql, params) in enumerate(prepared):
+            try:
+                conn, cur = _open_cursor(sql, params, asynchronous=True)
+                qids[i] = cur.sfqid
+                _close_cursor(conn, cur)
+            except Exception as e:
+                st.error(f"Error submitting query: {e}")
+                st.error(f"SQL Query: {sql}")
+        st.session_state[state_key] = [qid for qid in qids if qid]
+        pending = {i for i, qid in enumerate(qids) if qid}
+
+        pool = get_snowflake_pool()
+        conn = pool.getconn()
+        if conn is None:
+            raise OperationalError("Snowflake connection was not established.")
+        try:
+            started = time.monotonic()
+            while pending:
+                for i in list(pending):
+                    if not conn.is_still_running(conn.get_query_status(qids[i])):
+                        pending.discard(i)
+                if pending:
+                    # Touching an element lets Streamlit interrupt this run if the user changes a filter
+                    status.caption(f"Waiting on Snowflake... {time.monotonic() - started:.0f}s")
+                    time.sleep(poll_interval)
+            for i, qid in enumerate(qids):
+                if qid is None:
+                    continue
+                try:
+                    conn.get_query_status_throw_if_error(qid)
+                except DatabaseError as e:
+                    st.error(f"Error executing query: {e}")
+                    st.error(f"SQL Query: {prepared[i][0]}")
+                    qids[i] = None
+        finally:
+            pool.putconn(conn)
+    except BaseException as e:
+        # Includes Streamlit's rerun/stop signals: stop the queries nobody is waiting for anymore
+        if pending:
+            cancel_snowflake_queries([qids[i] for i in pending])
+        st.session_state.pop(state_key, None)
+        if not isinstance(e, Exception):
+            raise
+        st.error(f"Error waiting for Snowflake queries: {e}")
+        return [None] * len(prepared)
+    status.empty()
+    st.session_state.pop(state_key, None)
+    return qids
+
+
+def fetch_snowflake_result(qid):
+    """Downloads the (finished) result of query `qid` as a DataFrame, via Arrow batches."""
+    pool = get_snowflake_pool()
+    conn = pool.getconn()
+    if conn is None:
+        raise OperationalError("Snowflake connection was not established.")
+    discard = False
+    cur = conn.cursor()
+    try:
+        cur.get_results_from_sfqid(qid)
+        return cur.fetch_arrow_all(force_return_table=True).to_pandas()
+    except DatabaseError as e:
+        discard = _is_session_error(e)
+        raise
+    finally:
+        _close_cursor(conn, cur, discard=discard)
+
+
+def run_snowflake_queries_async(state_key, queries, cache=False, poll_interval=SNOWFLAKE_POLL_INTERVAL):
+    """
+    Runs several Snowflake queries side by side (see execute_snowflake_queries_async) and
+    collects each result by query id.
+
+    Args:
+        state_key (str): Session state key for the in-flight query ids, one per call site.
+        queries (list[tuple[str, dict | None]]): (query, params) pairs; queries can use :name binds.
+        cache (bool, optional): Serve from / store in the shared query cache (see query_cache.py).
+        poll_interval (float, optional): Seconds between status checks.
+
+    Returns:
+        list[pd.DataFrame]: One result per query, in order (an empty DataFrame for a failed query).
+    """
+    results = [None] * len(queries)
+    cache_keys = [None] * len(queries)
+    watermarks = [None] * len(queries)
+    if cache:
+        for i, (query, params) in enumerate(queries):
+            sql = _prepare_sql(query, params)
+            cache_keys[i] = fingerprint(sql, params, namespace="snowflake")
+            watermarks[i] = current_watermark("snowflake", sql)
+            results[i] = cache_get(cache_keys[i], watermark=watermarks[i])
+
+    to_run = [i for i, result in enumerate(results) if result is None]
+    qids = execute_snowflake_queries_async(state_key, [queries[i] for i in to_run], poll_interval)
+    for i, qid in zip(to_run, qids):
+        results[i] = pd.DataFrame()
+        if qid is None:
+            continue
+        try:
+            results[i] = fetch_snowflake_result(qid)
+        except Exception as e:
+            st.error(f"Error fetching query results: {e}")
+            continue
+        if cache_keys[i]:
+            cache_put(cache_keys[i], _prepare_sql(*queries[i]), results[i], watermark=watermarks[i])
+    return results
+
+
+# --- Paging over a remembered result (RESULT_SCAN) ---
+# Hidden column numbering the rows of a remembered result in its ORDER BY order
+RESULT_ROW_COL = "_row"
+
+
+@st.cache_resource
+def _get_result_registry():
+    """
+    Query ids of finished full results shared by all sessions: fingerprint -> (qid, watermark, finished_at),
+    least recently used first.
+    """
+    return {"lock": threading.Lock(), "results": OrderedDict()}
+
+
+def _remember_result(registry, key, entry):
+    """Stores `entry`, dropping expired ids and then the least recently used past SNOWFLAKE_RESULT_MAX_ENTRIES. Caller holds the lock."""
+    results = registry["results"]
+    results[key] = entry
+    results.move_to_end(key)
+    now = time.time()
+    for stale in [k for k, (_, _, finished_at) in results.items() if now - finished_at >= SNOWFLAKE_RESULT_MAX_AGE]:
+        del results[stale]
+    while len(results) > SNOWFLAKE_RESULT_MAX_ENTRIES:
+        results.popitem(last=False)
+
+
+def run_snowflake_query_once(state_key, query, params=None):
+    """
+    Runs `query` in the warehouse once per (query, params) and table watermark, and returns its
+    query id so pages and counts can be read from the stored result with RESULT_SCAN instead of
+    filtering and sorting the table again. The query should number its rows in a
+    RESULT_ROW_COL column (ROW_NUMBER() OVER (ORDER BY ...)) for result_page_query.
+
+    The app uses one Snowflake login, so remembered results are shared across sessions. Snowflake
+    keeps results for 24 hours; ids are reused for at most SNOWFLAKE_RESULT_MAX_AGE seconds, or
+    QUERY_CACHE_DEFAULT_TTL when the tables' watermark couldn't be probed.
+
+    Args:
+        state_key (str): Session state key for the in-flight query id (see execute_snowflake_queries_async).
+        query (str): The full, ordered query (can contain :name binds).
+        params (dict, optional): Values for the binds. Defaults to None.
+
+    Returns:
+        str | None: The query id, or None if the query failed.
+    """
+    sql = _prepare_sql(query, params)
+    key = fingerprint(sql, params, namespace="snowflake:result")
+    watermark = current_watermark("snowflake", sql)
+    registry = _get_result_registry()
+    with registry["lock"]:
+        entry = registry["results"].get(key)
+        if entry is not None:
+            registry["results"].move_to_end(key)
+    # Without a watermark nothing would notice the tables changing
+    max_age = SNOWFLAKE_RESULT_MAX_AGE if watermark is not None else min(SNOWFLAKE_RESULT_MAX_AGE, QUERY_CACHE_DEFAULT_TTL)
+    if entry is not None:
+        qid, stored_watermark, finished_at = entry
+        if stored_watermark == watermark and time.time() - finished_at < max_age:
+            return qid
+    [qid] = execute_snowflake_queries_async(state_key, [(query, params)])
+    if qid is not None:
+        with registry["lock"]:
+            _remember_result(registry, key, (qid, watermark, time.time()))
+    return qid
+
+
+def result_page_query(qid, offset, limit):
+    """(query, params) reading rows offset+1 .. offset+limit of remembered result `qid`, in order."""
+    query = f"""
+    SELECT * EXCLUDE "{RESULT_ROW_COL}"
+    FROM TABLE(RESULT_SCAN(:qid))
+    WHERE "{RESULT_ROW_COL}" > :offset
+    ORDER BY "{RESULT_ROW_COL}"
+    LIMIT :limit
+    """
+    return query, {"qid": qid, "offset": offset, "limit": limit}
+
+
+def result_count_query(qid):
+    """(query, params) counting the rows of remembered result `qid`."""
+    return 'SELECT COUNT(*) AS "total" FROM TABLE(RESULT_SCAN(:qid))', {"qid": qid}
+
+
+def snowflake_table_watermarks(tables):
+    """
+    Watermark probe for query_cache: LAST_ALTERED of SCOUT_DW.COMPCURVE tables.
+    LAST_ALTERED moves on DML as well as DDL for tables; for views it only tracks DDL.
+    """
+    binds = ", ".join(f"%(t{i})s" for i in range(len(tables)))
+    params = {f"t{i}": table.upper() for i, table in enumerate(tables)}
+    conn, cur = _open_cursor(
+        f"""
+        SELECT TABLE_NAME, LAST_ALTERED
+        FROM SCOUT_DW.INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = 'COMPCURVE' AND TABLE_NAME IN ({binds})
+        """,
+        params
+    )
+    try:
+        rows = cur.fetchall()
+    finally:
+        _close_cursor(conn, cur)
+    return {name.lower(): str(last_altered) for name, last_altered in rows}
+
+
+register_watermark_source("snowflake", snowflake_table_watermarks)
@@ -0,0 +1,223 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import json
+import os
+import threading
+import time
+import uuid
+from db import submit_query
+from query_cache import table_watermarks
+from snowflake_db import fetch_snowflake_arrow
+from config import CACHE_PATH, SNAPSHOT_REFRESH_INTERVAL, SNAPSHOT_BUCKETS
+
+# Local columnar snapshots of small Snowflake tables.
+#
+# A TableSnapshot keeps a whole table as an in-process Arrow table, mirrored to a Parquet file under
+# CACHE_PATH so restarts start warm. Views filter it locally with pyarrow.compute instead of querying
+# the warehouse on every filter change.
+#
+# Refreshes are incremental. Every row falls into one of `buckets` hash buckets (a hash of all its
+# columns), and the snapshot remembers a HASH_AGG of each bucket. A refresh asks the warehouse for
+# the current per-bucket hashes (one small GROUP BY) and downloads only the buckets whose hash
+# changed. It runs on the shared query executor when the table's watermark (LAST_ALTERED) moves, or
+# every SNAPSHOT_REFRESH_INTERVAL seconds for changes the watermark can't see (e.g. behind a view).
+# Readers keep using the previous snapshot until the refreshed one is swapped in.
+
+# Hidden column holding each row's hash bucket
+BUCKET_COL = "_bucket"
+
+_METADATA_KEY = b"table_snapshot"
+
+
+class TableSnapshot:
+    """
+    Locally held copy of one Snowflake table.
+
+    Args:
+        name (str): Snapshot name, used for the Parquet file.
+        table (str): Fully qualified table name.
+        columns (list[str]): Columns to keep (upper-case, as Snowflake returns them).
+        order_by (list[tuple[str, str]], optional): Sort order kept locally, as (column, "ascending" |
+            "descending") pairs; nulls sort last.
+        buckets (int, optional): Number of hash buckets a refresh compares.
+    """
+
+    def __init__(self, name, table, columns, order_by=(), buckets=SNAPSHOT_BUCKETS, path=CACHE_PATH):
+        self.name = name
+        self.table = table
+        self.columns = list(columns)
+        self.order_by = list(order_by)
+        self.buckets = buckets
+        self.path = path
+        self._lock = threading.Lock()  # guards the fields below
+        self._refresh_lock = threading.Lock()  # one refresh at a time
+        self._data = None
+        self._hashes = {}  # bucket -> HASH_AGG of its rows
+        self._watermark = None
+        self._refreshed_at = 0.0
+        self._pending = None
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    def _file(self):
+        return os.path.join(self.path, f"snapshot_{self.name}.parquet")
+
+    def _table_name(self):
+        """Unqualified lower-case name, as used by the watermark probe."""
+        return self.table.rsplit(".", 1)[-1].strip('"').lower()
+
+    def _bucket_expr(self):
+        return f"MOD(ABS(HASH({', '.join(self.columns)})), {self.buckets})"
+
+    def _fetch(self, buckets=None):
+        """Downloads all rows, or only those in `buckets`, with their bucket number."""
+        where_clause = ""
+        if buckets is not None:
+            where_clause = f"WHERE {self._bucket_expr()} IN ({', '.join(str(int(b)) for b in buckets)})"
+        query = f"""
+        SELECT {', '.join(self.columns)}, {self._bucket_expr()} AS "{BUCKET_COL}"
+        FROM {self.table}
+        {where_clause}
+        """
+        data = fetch_snowflake_arrow(query)
+        index = data.schema.get_field_index(BUCKET_COL)
+        return data.set_column(index, BUCKET_COL, pc.cast(data[BUCKET_COL], pa.int64()))
+
+    def _fetch_hashes(self):
+        data = fetch_snowflake_arrow(f"""
+        SELECT {self._bucket_expr()} AS "bucket", HASH_AGG({', '.join(self.columns)}) AS "hash"
+        FROM {self.table}
+        GROUP BY 1
+        """)
+        return {str(int(b)): str(h) for b, h in zip(data["bucket"].to_pylist(), data["hash"].to_pylist())}
+
+    def _sort(self, data):
+        if not self.order_by:
+            return data
+        return data.take(pc.sort_indices(data, sort_keys=self.order_by, null_placement="at_end"))
+
+    def refresh(self):
+        """
+        Brings the snapshot up to date with the warehouse, downloading only changed buckets
+        (or everything, when there is no snapshot yet or most buckets changed).
+
+        Returns:
+            int: Number of buckets downloaded.
+        """
+        with self._refresh_lock:
+            table_name = self._table_name()
+            watermark = table_watermarks("snowflake", [table_name]).get(table_name)
+            hashes = self._fetch_hashes()
+            with self._lock:
+                current, old_hashes, old_watermark = self._data, self._hashes, self._watermark
+            changed = sorted(b for b in set(hashes) | set(old_hashes) if hashes.get(b) != old_hashes.get(b))
+
+            data = None
+            if current is not None and len(changed) <= self.buckets // 2:
+                if not changed:
+                    data = current
+                else:
+                    try:
+                        fresh = self._fetch(changed).select(current.column_names).cast(current.schema)
+                        stale_rows = pc.is_in(current[BUCKET_COL], value_set=pa.array([int(b) for b in changed], pa.int64()))
+                        data = self._sort(pa.concat_tables([current.filter(pc.invert(stale_rows)), fresh]))
+                    except (pa.ArrowException, KeyError) as e:
+                        print(f"Snapshot {self.name}: incremental refresh failed, reloading: {e}")
+            if data is None:
+                data = self._sort(self._fetch())
+                changed = sorted(hashes)
+
+            with self._lock:
+                self._data = data
+                self._hashes = hashes
+                self._watermark = watermark
+                self._refreshed_at = time.time()
+            if changed or watermark != old_watermark:
+                self._save()
+            print(f"Snapshot {self.name} refreshed: {len(changed)} bucket(s) downloaded, {data.num_rows} rows.")
+            return len(changed)
+
+    def _is_stale(self):
+        table_name = self._table_name()
+        watermark = table_watermarks("snowflake", [table_name]).get(table_name)
+        with self._lock:
+            moved = watermark is not None and watermark != self._watermark
+            return moved or time.time() - self._refreshed_at > SNAPSHOT_REFRESH_INTERVAL
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Snapshot {self.name}: background refresh failed: {e}")
+            with self._lock:
+                # Don't retry on every page render; the next interval (or watermark move) tries again
+                self._refreshed_at = time.time()
+
+    def get(self):
+        """
+        Returns the snapshot as a pyarrow Table (with the BUCKET_COL column), loading it first if
+        there is none yet. A stale snapshot is returned as is while a refresh runs in the background.
+
+        Returns:
+            pyarrow.Table | None: The snapshot, or None if it could not be loaded.
+        """
+        with self._lock:
+            data = self._data
+        if data is None:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Snapshot {self.name}: load failed: {e}")
+                return None
+            with self._lock:
+                return self._data
+        if self._is_stale():
+            with self._lock:
+                if self._pending is None or self._pending.done():
+                    self._pending = submit_query(self._refresh_in_background)
+        return data
+
+    def _save(self):
+        with self._lock:
+            data, state = self._data, {
+                "table": self.table,
+                "columns": self.columns,
+                "buckets": self.buckets,
+                "hashes": self._hashes,
+                "watermark": self._watermark,
+                "refreshed_at": self._refreshed_at,
+            }
+        metadata = dict(data.schema.metadata or {})
+        metadata[_METADATA_KEY] = json.dumps(state).encode()
+        # Write to a temporary name and rename, so readers never see a partial file
+        tmp_path = os.path.join(self.path, f".snapshot_{self.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            pq.write_table(data.replace_schema_metadata(metadata), tmp_path, compression="zstd")
+            os.replace(tmp_path, self._file())
+        except OSError as e:
+            print(f"Error writing snapshot {self.name}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _load(self):
+        """Picks up the snapshot saved by a previous process, if it matches this definition."""
+        try:
+            data = pq.read_table(self._file())
+        except FileNotFoundError:
+            return
+        except (OSError, pa.ArrowException) as e:
+            print(f"Ignoring unreadable snapshot {self._file()}: {e}")
+            return
+        try:
+            state = json.loads((data.schema.metadata or {}).get(_METADATA_KEY, b"{}"))
+        except ValueError:
+            return
+        if (state.get("table"), state.get("columns"), state.get("buckets")) != (self.table, self.columns, self.buckets):
+            return
+        self._data = data.replace_schema_metadata(None)
+        self._hashes = state.get("hashes", {})
+        self._watermark = state.get("watermark")
+        self._refreshed_at = state.get("refreshed_at", 0.0)
@@ -1,65 +1,58 @@
 import streamlit as st
 import pandas as pd
-import os
-from config import EXPORT_PATH
-from db import run_query
+import io
+from db import run_query, run_query_iter, copy_query_to_csv, estimate_count, estimate_table_rows
+from pagination import ROW_ID, seek_order_by, seek_predicate, seek_select, split_page
+from row_counts import start_count, refresh_count, count_label, watch_count
+from filter_spec import FilterSpec, Raw, SEARCH_RANK_PARAM, between, contains, search, search_rank
+from dimension_options import US_STATES
+from exports import full_csv_download, session_export_path
 
 CACHE_LIMIT_AGENTS = 5000
 
-
-def load_agents_data(limit=CACHE_LIMIT_AGENTS, offset=0, states=None, agent_name_filter=None, brokerage_filter=None,
+# agent_metrics has no natural ordering; page by its row key (see migrations/row_keys.py)
+ACTIVE_AGENTS_SORT_KEYS = [ROW_ID]
+# While searching, best match first (descending, with the row id as tiebreaker)
+ACTIVE_AGENTS_SEARCH_SORT_KEYS = [search_rank(), ROW_ID]
+
+
+def _agents_filter(agent_name_filter=None, brokerage_filter=None, state_filter=None, team_filter=None,
+                   sales_25_min=None, sales_25_max=None, volume_25_min=None, volume_25_max=None, search_text=None,
+                   association=None):
+    """The agent_metrics filters as a FilterSpec."""
+    return FilterSpec.of(
+        search(search_text),
+        contains(["agent_first_name", "agent_last_name"], agent_name_filter),
+        contains("broker", brokerage_filter),
+        contains("office_state", state_filter),
+        contains("team", team_filter),
+        between("sales_25", sales_25_min, sales_25_max, cap=999999),
+        # Only apply upper bound if volume_25_max is below a very high cap (e.g., 999,999,999)
+        between("volume_25", volume_25_min, volume_25_max, cap=999999999),
+        contains("association", association),
+    )
+
+
+def load_agents_data(limit=CACHE_LIMIT_AGENTS, after=None, states=None, agent_name_filter=None, brokerage_filter=None,
                      state_filter=None, team_filter=None, sales_25_min=None, sales_25_max=None,
-                     volume_25_min=None, volume_25_max=None):
-    """Loads agent data from the database based on filters."""
-    where_clauses = []
-    params = {'limit': limit, 'offset': offset}
-
-    # Remove states param, only use state_filter for filtering state
-
-    if agent_name_filter:
-        where_clauses.append('('
-                             'LOWER(agent_first_name) LIKE %(agent_name_like)s OR '
-                             'LOWER(agent_last_name) LIKE %(agent_name_like)s'
-                             ')')
-        params['agent_name_like'] = f"%{agent_name_filter}%"
-
-    if brokerage_filter:
-        where_clauses.append('LOWER(broker) LIKE %(brokerage_like)s')
-        params['brokerage_like'] = f"%{brokerage_filter}%"
-
-    if state_filter:
-        where_clauses.append('LOWER(office_state) LIKE %(state_like)s')
-        params['state_like'] = f"%{state_filter}%"
-
-    if team_filter:
-        where_clauses.append('LOWER(team) LIKE %(team_filter)s')
-        params['team_filter'] = f"%{team_filter}%"
-
-    if sales_25_min is not None:
-        where_clauses.append('sales_25 >= %(sales_25_min)s')
-        params['sales_25_min'] = sales_25_min
-
-    if sales_25_max is not None and sales_25_max < 999999:
-        where_clauses.append('sales_25 <= %(sales_25_max)s')
-        params['sales_25_max'] = sales_25_max
-
-    if volume_25_min is not None:
-        where_clauses.append('volume_25 >= %(volume_25_min)s')
-        params['volume_25_min'] = volume_25_min
-
-    # Only apply upper bound if volume_25_max is below a very high cap (e.g., 999,999,999)
-    if volume_25_max is not None and volume_25_max < 999999999:
-        where_clauses.append('volume_25 <= %(volume_25_max)s')
-        params['volume_25_max'] = volume_25_max
-
-    association_filter = st.session_state.get("filter_association", "").strip().lower()
-    if association_filter:
-        where_clauses.append('LOWER(association) LIKE %(association_like)s')
-        params['association_like'] = f"%{association_filter}%"
-
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
+                     volume_25_min=None, volume_25_max=None, search_text=None, association=None):
+    """
+    Loads one keyset page of agent data (rows after the cursor `after`) based on filters.
+    With `search_text`, pages are ordered by search relevance.
+    """
+    spec = _agents_filter(agent_name_filter, brokerage_filter, state_filter, team_filter,
+                          sales_25_min, sales_25_max, volume_25_min, volume_25_max, search_text, association)
+    search_predicate = search(search_text)
+    descending = search_predicate is not None
+    sort_keys = ACTIVE_AGENTS_SEARCH_SORT_KEYS if descending else ACTIVE_AGENTS_SORT_KEYS
+    seek_clause, seek_params = seek_predicate(sort_keys, after, descending=descending)
+    if seek_clause:
+        spec = spec.and_(Raw(seek_clause))
+    where_clause, params = spec.where()
+    params.update(seek_params)
+    params['limit'] = limit
+    if descending:
+        params[SEARCH_RANK_PARAM] = search_predicate.text
 
     query = f"""
     SELECT
@@ -80,70 +73,25 @@ def load_agents_data(limit=CACHE_LIMIT_AGENTS, offset=0, states=None, agent_name
       volume_25,
       license_type AS "License Type",
       mlsid AS "MLSID",
-      association AS "Association"
+      association AS "Association",
+      {seek_select(sort_keys)}
     FROM agent_metrics
     {where_clause}
-    LIMIT %(limit)s OFFSET %(offset)s;
+    {seek_order_by(sort_keys, descending=descending)}
+    LIMIT %(limit)s;
     """
 
-    df = run_query(query, params=params)
+    df = run_query(query, params=params, dtype_backend="pyarrow", cache=True)
     return df
 
 
-# New function: same as load_agents_data but without LIMIT/OFFSET
-def load_all_agents_data(states=None, agent_name_filter=None, brokerage_filter=None,
-                         state_filter=None, team_filter=None, sales_25_min=None, sales_25_max=None,
-                         volume_25_min=None, volume_25_max=None):
-    """Loads all agent data from the database based on filters (no LIMIT/OFFSET)."""
-    where_clauses = []
-    params = {}
-
-    # Remove states param, only use state_filter for filtering state
-
-    if agent_name_filter:
-        where_clauses.append('('
-                             'LOWER(agent_first_name) LIKE %(agent_name_like)s OR '
-                             'LOWER(agent_last_name) LIKE %(agent_name_like)s'
-                             ')')
-        params['agent_name_like'] = f"%{agent_name_filter}%"
-
-    if brokerage_filter:
-        where_clauses.append('LOWER(broker) LIKE %(brokerage_like)s')
-        params['brokerage_like'] = f"%{brokerage_filter}%"
-
-    if state_filter:
-        where_clauses.append('LOWER(office_state) LIKE %(state_like)s')
-        params['state_like'] = f"%{state_filter}%"
-
-    if team_filter:
-        where_clauses.append('LOWER(team) LIKE %(team_filter)s')
-        params['team_filter'] = f"%{team_filter}%"
-
-    if sales_25_min is not None:
-        where_clauses.append('sales_25 >= %(sales_25_min)s')
-        params['sales_25_min'] = sales_25_min
-
-    if sales_25_max is not None and sales_25_max < 999999:
-        where_clauses.append('sales_25 <= %(sales_25_max)s')
-        params['sales_25_max'] = sales_25_max
-
-    if volume_25_min is not None:
-        where_clauses.append('volume_25 >= %(volume_25_min)s')
-        params['volume_25_min'] = volume_25_min
-
-    # Only apply upper bound if volume_25_max is below a very high cap (e.g., 999,999,999)
-    if volume_25_max is not None and volume_25_max < 999999999:
-        where_clauses.append('volume_25 <= %(volume_25_max)s')
-        params['volume_25_max'] = volume_25_max
-
-    association_filter = st.session_state.get("filter_association", "").strip().lower()
-    if association_filter:
-        where_clauses.append('LOWER(association) LIKE %(association_like)s')
-        params['association_like'] = f"%{association_filter}%"
-
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
+def _all_agents_query(states=None, agent_name_filter=None, brokerage_filter=None,
+                      state_filter=None, team_filter=None, sales_25_min=None, sales_25_max=None,
+                      volume_25_min=None, volume_25_max=None, search_text=None, association=None):
+    """Builds the unpaginated agent query and its params for the given filters."""
+    where_clause, params = _agents_filter(agent_name_filter, brokerage_filter, state_filter, team_filter,
+                                          sales_25_min, sales_25_max, volume_25_min, volume_25_max,
+                                          search_text, association).where()
 
     query = f"""
     SELECT
@@ -169,83 +117,62 @@ def load_all_agents_data(states=None, agent_name_filter=None, brokerage_filter=N
     {where_clause}
     ;
     """
+    return query, params
 
-    df = run_query(query, params=params)
-    return df
+
+def all_agents_csv(states=None, agent_name_filter=None, brokerage_filter=None,
+                   state_filter=None, team_filter=None, sales_25_min=None, sales_25_max=None,
+                   volume_25_min=None, volume_25_max=None, search_text=None, association=None):
+    """
+    Renders every agent matching the filters as CSV bytes. Rows are streamed through a server-side
+    cursor (db.run_query_iter), so only one chunk is held as a DataFrame at a time.
+    """
+    query, params = _all_agents_query(
+        states, agent_name_filter, brokerage_filter, state_filter, team_filter,
+        sales_25_min, sales_25_max, volume_25_min, volume_25_max, search_text, association
+    )
+    buffer = io.BytesIO()
+    for i, chunk in enumerate(run_query_iter(query, params=params)):
+        chunk.to_csv(buffer, index=False, header=(i == 0))
+    return buffer.getvalue()
+
+
+def export_all_agents_csv(dest, states=None, agent_name_filter=None, brokerage_filter=None,
+                          state_filter=None, team_filter=None, sales_25_min=None, sales_25_max=None,
+                          volume_25_min=None, volume_25_max=None, search_text=None, association=None):
+    """Writes every agent matching the filters to `dest` as CSV via COPY, skipping pandas entirely."""
+    query, params = _all_agents_query(
+        states, agent_name_filter, brokerage_filter, state_filter, team_filter,
+        sales_25_min, sales_25_max, volume_25_min, volume_25_max, search_text, association
+    )
+    return copy_query_to_csv(query, params=params, dest=dest)
 
 
 def get_total_agents_count(states=None, agent_name_filter=None, brokerage_filter=None,
                            state_filter=None, team_filter=None, sales_25_min=None, sales_25_max=None,
-                           volume_25_min=None, volume_25_max=None):
-    """Counts total number of agents matching the filters."""
-    where_clauses = []
-    params = {}
-
-    # Remove states param, only use state_filter for filtering state
-
-    if agent_name_filter:
-        where_clauses.append('('
-                             'LOWER(agent_first_name) LIKE %(agent_name_like)s OR '
-                             'LOWER(agent_last_name) LIKE %(agent_name_like)s'
-                             ')')
-        params['agent_name_like'] = f"%{agent_name_filter}%"
-
-    if brokerage_filter:
-        where_clauses.append('LOWER(broker) LIKE %(brokerage_like)s')
-        params['brokerage_like'] = f"%{brokerage_filter}%"
-
-    if state_filter:
-        where_clauses.append('LOWER(office_state) LIKE %(state_like)s')
-        params['state_like'] = f"%{state_filter}%"
-
-    if team_filter:
-        where_clauses.append('LOWER(team) LIKE %(team_filter)s')
-        params['team_filter'] = f"%{team_filter}%"
-
-    if sales_25_min is not None:
-        where_clauses.append('sales_25 >= %(sales_25_min)s')
-        params['sales_25_min'] = sales_25_min
-
-    if sales_25_max is not None and sales_25_max < 999999:
-        where_clauses.append('sales_25 <= %(sales_25_max)s')
-        params['sales_25_max'] = sales_25_max
-
-    if volume_25_min is not None:
-        where_clauses.append('volume_25 >= %(volume_25_min)s')
-        params['volume_25_min'] = volume_25_min
-
-    # Only apply upper bound if volume_25_max is below a very high cap (e.g., 999,999,999)
-    if volume_25_max is not None and volume_25_max < 999999999:
-        where_clauses.append('volume_25 <= %(volume_25_max)s')
-        params['volume_25_max'] = volume_25_max
-
-    association_filter = st.session_state.get("filter_association", "").strip().lower()
-    if association_filter:
-        where_clauses.append('LOWER(association) LIKE %(association_like)s')
-        params['association_like'] = f"%{association_filter}%"
-
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
+                           volume_25_min=None, volume_25_max=None, search_text=None, association=None,
+                           estimate=False):
+    """Counts total number of agents matching the filters; with `estimate=True` returns the planner's estimate instead."""
+    where_clause, params = _agents_filter(agent_name_filter, brokerage_filter, state_filter, team_filter,
+                                          sales_25_min, sales_25_max, volume_25_min, volume_25_max,
+                                          search_text, association).where()
 
     query = f"""
     SELECT COUNT(*) FROM agent_metrics
     {where_clause};
     """
 
-    result = run_query(query, params=params)
+    if estimate:
+        # Unfiltered: the table statistics already hold the answer
+        return estimate_count(query, params) if where_clause else estimate_table_rows("agent_metrics")
+
+    result = run_query(query, params=params, cache=True)
     return result.iloc[0][0] if not result.empty else 0
 
 
 def agents_view():
     st.title("Agents View")
 
-    us_states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-                 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-                 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-                 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-                 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
-
     # Additional filters
     st.session_state.setdefault('filter_agent', "")
     st.session_state.setdefault('filter_brokerage', "")
@@ -253,8 +180,9 @@ def agents_view():
     # Session state
     st.session_state.setdefault('agents_offset', 0)
     st.session_state.setdefault('filtered_agents_data', pd.DataFrame())
+    st.session_state.setdefault('agent_metrics_cursor', None)
     st.session_state.setdefault('total_agents', 0)
-    st.session_state.setdefault('selected_states_agents', us_states)
+    st.session_state.setdefault('selected_states_agents', US_STATES)
     st.session_state.setdefault('agents_filters_applied', False)
     st.session_state.setdefault('load_more_requested', False)
 
@@ -267,10 +195,10 @@ def agents_view():
         st.header("Filter Agents by Location")
         select_all_states_agents = st.checkbox("Select All States", key="select_all_states_agents", value=True)
         if select_all_states_agents:
-            st.session_state.selected_states_agents = us_states
+            st.session_state.selected_states_agents = US_STATES
         else:
             st.session_state.selected_states_agents = st.multiselect(
-                "State", us_states, default=st.session_state.selected_states_agents, key="state_select_agents"
+                "State", US_STATES, default=st.session_state.selected_states_agents, key="state_select_agents"
             )
 
         col1, col2 = st.columns(2)
@@ -278,7 +206,7 @@ def agents_view():
             apply_filters_btn = st.button("Apply Filters", key="apply_filters_agents")
         with col2:
             if st.button("Clear Filters", key="clear_filters_agents"):
-                st.session_state.selected_states_agents = us_states
+                st.session_state.selected_states_agents = US_STATES
                 st.session_state.agents_filters_applied = False
                 st.session_state.agents_offset = 0
                 st.session_state.filtered_agents_data = pd.DataFrame()
@@ -288,23 +216,22 @@ def agents_view():
 
     agent_name_filter = st.session_state.get("filter_agent", "").strip().lower()
     brokerage_filter = st.session_state.get("filter_brokerage", "").strip().lower()
+    association_filter = st.session_state.get("filter_association", "").strip().lower()
 
     if apply_filters_btn or not st.session_state.agents_filters_applied:
         st.session_state.agents_offset = 0
         st.session_state.agents_filters_applied = True
-        with st.spinner("Calculating total agents..."):
-            st.session_state.total_agents = get_total_agents_count(
-                st.session_state.selected_states_agents,
-                agent_name_filter,
-                brokerage_filter
+        # Estimated total now, exact COUNT(*) in the background
+        start_count('total_agents', get_total_agents_count,
+                    st.session_state.selected_states_agents, agent_name_filter, brokerage_filter,
+                    association=association_filter)
+        with st.spinner("Loading agent data..."):
+            first_page = load_agents_data(
+                CACHE_LIMIT_AGENTS, None, st.session_state.selected_states_agents, agent_name_filter, brokerage_filter,
+                association=association_filter
             )
-        if st.session_state.total_agents > 0:
-            with st.spinner("Loading agent data..."):
-                st.session_state.filtered_agents_data = load_agents_data(
-                    CACHE_LIMIT_AGENTS, 0, st.session_state.selected_states_agents, agent_name_filter, brokerage_filter
-                )
-        else:
-            st.session_state.filtered_agents_data = pd.DataFrame()
+        first_page, st.session_state.agent_metrics_cursor = split_page(first_page)
+        st.session_state.filtered_agents_data = first_page
         if apply_filters_btn:
             st.rerun()
 
@@ -316,15 +243,15 @@ def agents_view():
         col_metric_agents, col_dl_agents = st.columns([2, 1])
         with col_metric_agents:
             st.metric("Rows Displayed", len(df_agents))
-            st.metric("Total Rows Matching Filters", st.session_state.total_agents)
+            st.metric("Total Rows Matching Filters", count_label('total_agents'))
             start = st.session_state.agents_offset + 1
             end = st.session_state.agents_offset + len(df_agents)
-            st.caption(f"Showing agents {start}-{end} of {st.session_state.total_agents}")
+            st.caption(f"Showing agents {start}-{end} of {count_label('total_agents')}")
+            watch_count('total_agents')
 
         with col_dl_agents:
             if len(df_agents) > 15000:
-                os.makedirs(EXPORT_PATH, exist_ok=True)
-                export_path = os.path.join(EXPORT_PATH, "filtered_agents_view.csv")
+                export_path = session_export_path("filtered_agents_view.csv")
                 df_agents.to_csv(export_path, index=False)
                 with open(export_path, "rb") as f:
                     st.download_button(
@@ -352,12 +279,15 @@ def agents_view():
             with st.spinner("Loading more agent data..."):
                 new_agents = load_agents_data(
                     CACHE_LIMIT_AGENTS,
-                    st.session_state.agents_offset + CACHE_LIMIT_AGENTS,
+                    st.session_state.get('agent_metrics_cursor'),
                     st.session_state.selected_states_agents,
                     agent_name_filter,
-                    brokerage_filter
+                    brokerage_filter,
+                    association=association_filter
                 )
+            new_agents, next_cursor = split_page(new_agents)
             if not new_agents.empty:
+                st.session_state.agent_metrics_cursor = next_cursor
                 st.session_state.filtered_agents_data = pd.concat(
                     [st.session_state.filtered_agents_data, new_agents], ignore_index=True
                 )
@@ -394,77 +324,168 @@ def format_dollars_slider(val):
         return str(val)
 
 
+def _format_volumes(df):
+    """Formats the volume_24 and volume_25 columns of a page for display, if present."""
+    def dollar_fmt(val):
+        try:
+            return _fmt_compact_dollars(val)
+        except Exception:
+            return val
+
+    df_fmt = df.copy()
+    for col in ["volume_24", "volume_25"]:
+        if col in df_fmt.columns:
+            df_fmt[col] = df_fmt[col].apply(dollar_fmt)
+    return df_fmt
+
+
+@st.fragment
+def _active_agents_results(active_filters):
+    """
+    The results table, metrics, export and Load More. Runs as a fragment, so fetching the next
+    page only reruns this part of the page (and formats only the new rows) instead of the whole app.
+    """
+    df_agents_display = st.session_state['active_agents_data']
+    df_agents_display_fmt = st.session_state.get('active_agents_data_fmt', df_agents_display)
+    total_label = count_label('active_agents_total')
+    total_agents = st.session_state['active_agents_total']
+
+    if not df_agents_display.empty:
+        st.dataframe(df_agents_display_fmt, use_container_width=True, hide_index=True)
+
+        col_metric_agents, col_dl_agents = st.columns([2, 1])
+        with col_metric_agents:
+            st.metric("Rows Displayed", len(df_agents_display))
+            st.metric("Total Rows Matching Filters", total_label)
+            # Show "Showing X-Y of Z" (offset is 0-based, len is number displayed)
+            start = 1
+            end = len(df_agents_display)
+            st.caption(f"Showing agents {start}-{end} of {total_label}")
+            watch_count('active_agents_total')
+
+        with col_dl_agents:
+            # For export, always export all rows matching filters. Only an exact total can pick the
+            # in-memory export: planner estimates for text filters can be far too low
+            if not refresh_count('active_agents_total') or total_agents > 15000:
+                # Let PostgreSQL render the CSV (COPY ... TO STDOUT), only when asked for
+                full_csv_download(
+                    "active_agents", "active_agents_view_full.csv", active_filters,
+                    lambda dest: export_all_agents_csv(dest, **active_filters),
+                    total_agents
+                )
+            else:
+                # Stream every matching row into the CSV, chunk by chunk, once per filter set
+                # rather than on every Load More
+                if st.session_state.get('active_agents_csv_filters') != active_filters:
+                    st.session_state['active_agents_csv'] = all_agents_csv(**active_filters)
+                    st.session_state['active_agents_csv_filters'] = dict(active_filters)
+                csv_data = st.session_state['active_agents_csv']
+                st.download_button(
+                    label="Export Full Data as CSV",
+                    data=csv_data,
+                    file_name="active_agents_view_full.csv",
+                    mime="text/csv",
+                    key="download_active_agents_csv"
+                )
+
+        # "Load More" button for incremental loading
+        if len(df_agents_display) < total_agents:
+            if st.button("Load More", key="load_more_active_agents"):
+                with st.spinner("Loading more active agents..."):
+                    next_offset = st.session_state['active_agents_offset'] + CACHE_LIMIT_AGENTS
+                    new_agents = load_agents_data(
+                        limit=CACHE_LIMIT_AGENTS,
+                        after=st.session_state.get('active_agents_cursor'),
+                        **active_filters
+                    )
+                    new_agents, next_cursor = split_page(new_agents)
+                    if not new_agents.empty:
+                        st.session_state['active_agents_cursor'] = next_cursor
+                        st.session_state['active_agents_data'] = pd.concat(
+                            [st.session_state['active_agents_data'], new_agents],
+                            ignore_index=True
+                        )
+                        st.session_state['active_agents_data_fmt'] = pd.concat(
+                            [df_agents_display_fmt, _format_volumes(new_agents)],
+                            ignore_index=True
+                        )
+                        st.session_state['active_agents_offset'] = next_offset
+                # Only the results need redrawing; the sidebar and filters haven't changed
+                st.rerun(scope="fragment")
+    else:
+        st.info("No active agents match the current filters.")
+
+
 def active_agents_view():
     st.title("Active Agents")
 
-    # List of US states for dropdown
-    us_states = [
-        'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-        'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-        'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-        'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-        'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
-    ]
-
     # Ensure filters exist in session state
     st.session_state.setdefault('filter_agent', "")
     st.session_state.setdefault('filter_brokerage', "")
     st.session_state.setdefault('filter_association', "")
     st.session_state.setdefault('filter_state', "All")
     st.session_state.setdefault('filter_team', "")
+    st.session_state.setdefault('filter_search_active_agents', "")
     st.session_state.setdefault('sales_25_min', 0)
     st.session_state.setdefault('sales_25_max', 2000)
     st.session_state.setdefault('volume_25_min', 0)
     st.session_state.setdefault('volume_25_max', 1000000000)
 
     with st.sidebar:
-        st.selectbox("State", ["All"] + us_states, key="filter_state")
-        st.text_input("Broker Filter", key="filter_brokerage")
-        st.text_input("Team Filter", key="filter_team")
-
-        # Sales 2025 Range: two number inputs in one row
-        st.markdown("**Sales 2025 Range**")
-        sales_col1, sales_col2 = st.columns(2)
-        with sales_col1:
-            sales_25_min = st.number_input(
-                "Min Sales 2025",
-                min_value=0,
-                max_value=2000,
-                value=st.session_state.get("sales_25_min", 0),
-                step=1,
-                key="sales_25_min"
-            )
-        with sales_col2:
-            sales_25_max = st.number_input(
-                "Max Sales 2025",
-                min_value=0,
-                max_value=2000,
-                value=st.session_state.get("sales_25_max", 2000),
-                step=1,
-                key="sales_25_max"
+        with st.form("active_agents_filters_form", border=False):
+            st.text_input(
+                "Search", key="filter_search_active_agents", placeholder='e.g. "john smith" remax -keller',
+                help="Full-text search across name, broker, team and city, best matches first."
             )
+            st.selectbox("State", ["All"] + US_STATES, key="filter_state")
+            st.text_input("Broker Filter", key="filter_brokerage")
+            st.text_input("Team Filter", key="filter_team")
+
+            # Sales 2025 Range: two number inputs in one row
+            st.markdown("**Sales 2025 Range**")
+            sales_col1, sales_col2 = st.columns(2)
+            with sales_col1:
+                sales_25_min = st.number_input(
+                    "Min Sales 2025",
+                    min_value=0,
+                    max_value=2000,
+                    value=st.session_state.get("sales_25_min", 0),
+                    step=1,
+                    key="sales_25_min"
+                )
+            with sales_col2:
+                sales_25_max = st.number_input(
+                    "Max Sales 2025",
+                    min_value=0,
+                    max_value=2000,
+                    value=st.session_state.get("sales_25_max", 2000),
+                    step=1,
+                    key="sales_25_max"
+                )
 
-        # Volume 2025 Range: two number inputs in one row
-        st.markdown("**Volume 2025 Range**")
-        volume_col1, volume_col2 = st.columns(2)
-        with volume_col1:
-            volume_25_min = st.number_input(
-                "Min Volume 2025",
-                min_value=0,
-                max_value=1_000_000_000,
-                value=st.session_state.get("volume_25_min", 0),
-                step=50000,
-                key="volume_25_min"
-            )
-        with volume_col2:
-            volume_25_max = st.number_input(
-                "Max Volume 2025",
-                min_value=0,
-                max_value=1_000_000_000,
-                value=st.session_state.get("volume_25_max", 1_000_000_000),
-                step=50000,
-                key="volume_25_max"
-            )
+            # Volume 2025 Range: two number inputs in one row
+            st.markdown("**Volume 2025 Range**")
+            volume_col1, volume_col2 = st.columns(2)
+            with volume_col1:
+                volume_25_min = st.number_input(
+                    "Min Volume 2025",
+                    min_value=0,
+                    max_value=1_000_000_000,
+                    value=st.session_state.get("volume_25_min", 0),
+                    step=50000,
+                    key="volume_25_min"
+                )
+            with volume_col2:
+                volume_25_max = st.number_input(
+                    "Max Volume 2025",
+                    min_value=0,
+                    max_value=1_000_000_000,
+                    value=st.session_state.get("volume_25_max", 1_000_000_000),
+                    step=50000,
+                    key="volume_25_max"
+                )
+            # One query round per submitted batch of edits, not one per keystroke
+            st.form_submit_button("Apply Filters", use_container_width=True)
 
     # Retrieve filters from session state
     agent_name_filter = st.session_state.get("filter_agent", "").strip().lower()
@@ -474,6 +495,7 @@ def active_agents_view():
     # If "All" is selected, do not filter by state; else, use the value
     state_filter = "" if state_value == "All" else state_value.lower()
     team_filter = st.session_state.get("filter_team", "").strip().lower()
+    search_text = st.session_state.get("filter_search_active_agents", "").strip()
     # Get min/max values from session state (set by number_input above)
     sales_25_min = st.session_state.get("sales_25_min", 0)
     sales_25_max = st.session_state.get("sales_25_max", 2000)
@@ -482,6 +504,7 @@ def active_agents_view():
 
     # --- Session state for incremental loading ---
     st.session_state.setdefault('active_agents_offset', 0)
+    st.session_state.setdefault('active_agents_cursor', None)
     st.session_state.setdefault('active_agents_data', pd.DataFrame())
     st.session_state.setdefault('active_agents_total', 0)
     st.session_state.setdefault('active_agents_filters_applied', False)
@@ -494,6 +517,7 @@ def active_agents_view():
         "association_filter": association_filter,
         "state_filter": state_filter,
         "team_filter": team_filter,
+        "search_text": search_text,
         "sales_25_min": sales_25_min,
         "sales_25_max": sales_25_max,
         "volume_25_min": volume_25_min,
@@ -503,144 +527,33 @@ def active_agents_view():
     # Detect if filters have changed
     filters_changed = current_filters != st.session_state.get('active_agents_last_filters', {})
 
+    active_filters = dict(
+        states=None,
+        agent_name_filter=agent_name_filter,
+        brokerage_filter=brokerage_filter,
+        state_filter=state_filter,
+        team_filter=team_filter,
+        sales_25_min=sales_25_min,
+        sales_25_max=sales_25_max,
+        volume_25_min=volume_25_min,
+        volume_25_max=volume_25_max,
+        search_text=search_text,
+        association=association_filter
+    )
+
     if filters_changed or not st.session_state['active_agents_filters_applied']:
         # Reset offset and data, and record filters
         st.session_state['active_agents_offset'] = 0
         st.session_state['active_agents_filters_applied'] = True
         st.session_state['active_agents_last_filters'] = current_filters.copy()
-        with st.spinner("Calculating total active agents..."):
-            st.session_state['active_agents_total'] = get_total_agents_count(
-                states=None,
-                agent_name_filter=agent_name_filter,
-                brokerage_filter=brokerage_filter,
-                state_filter=state_filter,
-                team_filter=team_filter,
-                sales_25_min=sales_25_min,
-                sales_25_max=sales_25_max,
-                volume_25_min=volume_25_min,
-                volume_25_max=volume_25_max
-            )
-        if st.session_state['active_agents_total'] > 0:
-            with st.spinner("Loading active agents data..."):
-                df_first = load_agents_data(
-                    limit=CACHE_LIMIT_AGENTS,
-                    offset=0,
-                    states=None,
-                    agent_name_filter=agent_name_filter,
-                    brokerage_filter=brokerage_filter,
-                    state_filter=state_filter,
-                    team_filter=team_filter,
-                    sales_25_min=sales_25_min,
-                    sales_25_max=sales_25_max,
-                    volume_25_min=volume_25_min,
-                    volume_25_max=volume_25_max
-                )
-                st.session_state['active_agents_data'] = df_first
-        else:
-            st.session_state['active_agents_data'] = pd.DataFrame()
+        with st.spinner("Loading active agents data..."):
+            # Estimated total now, exact COUNT(*) in the background
+            start_count('active_agents_total', get_total_agents_count, **active_filters)
+            df_first = load_agents_data(limit=CACHE_LIMIT_AGENTS, after=None, **active_filters)
+        df_first, st.session_state['active_agents_cursor'] = split_page(df_first)
+        st.session_state['active_agents_data'] = df_first
+        st.session_state['active_agents_data_fmt'] = _format_volumes(df_first)
         # On filter change, rerun to update UI
         st.rerun()
 
-    df_agents_display = st.session_state['active_agents_data']
-    total_agents = st.session_state['active_agents_total']
-    offset = st.session_state['active_agents_offset']
-
-    # Format the volume_24 and volume_25 columns for display, if present
-    def dollar_fmt(val):
-        try:
-            return _fmt_compact_dollars(val)
-        except Exception:
-            return val
-
-    df_agents_display_fmt = df_agents_display.copy()
-    for col in ["volume_24", "volume_25"]:
-        if col in df_agents_display_fmt.columns:
-            df_agents_display_fmt[col] = df_agents_display_fmt[col].apply(dollar_fmt)
-
-    if not df_agents_display.empty:
-        st.dataframe(df_agents_display_fmt, use_container_width=True, hide_index=True)
-
-        col_metric_agents, col_dl_agents = st.columns([2, 1])
-        with col_metric_agents:
-            st.metric("Rows Displayed", len(df_agents_display))
-            st.metric("Total Rows Matching Filters", total_agents)
-            # Show "Showing X-Y of Z" (offset is 0-based, len is number displayed)
-            start = 1
-            end = len(df_agents_display)
-            st.caption(f"Showing agents {start}-{end} of {total_agents}")
-
-        with col_dl_agents:
-            # For export, always export all rows matching filters
-            if total_agents > 15000:
-                os.makedirs(EXPORT_PATH, exist_ok=True)
-                export_path = os.path.join(EXPORT_PATH, "active_agents_view_full.csv")
-                # Use load_all_agents_data for full export
-                df_agents_full = load_all_agents_data(
-                    states=None,
-                    agent_name_filter=agent_name_filter,
-                    brokerage_filter=brokerage_filter,
-                    state_filter=state_filter,
-                    team_filter=team_filter,
-                    sales_25_min=sales_25_min,
-                    sales_25_max=sales_25_max,
-                    volume_25_min=volume_25_min,
-                    volume_25_max=volume_25_max
-                )
-                df_agents_full.to_csv(export_path, index=False)
-                with open(export_path, "rb") as f:
-                    st.download_button(
-                        label="Download Full CSV",
-                        data=f,
-                        file_name="active_agents_view_full.csv",
-                        mime="text/csv",
-                        key="download_active_agents_csv_large"
-                    )
-            else:
-                # Use load_all_agents_data for full export
-                df_agents_full = load_all_agents_data(
-                    states=None,
-                    agent_name_filter=agent_name_filter,
-                    brokerage_filter=brokerage_filter,
-                    state_filter=state_filter,
-                    team_filter=team_filter,
-                    sales_25_min=sales_25_min,
-                    sales_25_max=sales_25_max,
-                    volume_25_min=volume_25_min,
-                    volume_25_max=volume_25_max
-                )
-                csv_data = df_agents_full.to_csv(index=False).encode("utf-8")
-                st.download_button(
-                    label="Export Full Data as CSV",
-                    data=csv_data,
-                    file_name="active_agents_view_full.csv",
-                    mime="text/csv",
-                    key="download_active_agents_csv"
-                )
-
-        # "Load More" button for incremental loading
-        if len(df_agents_display) < total_agents:
-            if st.button("Load More", key="load_more_active_agents"):
-                with st.spinner("Loading more active agents..."):
-                    next_offset = st.session_state['active_agents_offset'] + CACHE_LIMIT_AGENTS
-                    new_agents = load_agents_data(
-                        limit=CACHE_LIMIT_AGENTS,
-                        offset=next_offset,
-                        states=None,
-                        agent_name_filter=agent_name_filter,
-                        brokerage_filter=brokerage_filter,
-                        state_filter=state_filter,
-                        team_filter=team_filter,
-                        sales_25_min=sales_25_min,
-                        sales_25_max=sales_25_max,
-                        volume_25_min=volume_25_min,
-                        volume_25_max=volume_25_max
-                    )
-                    if not new_agents.empty:
-                        st.session_state['active_agents_data'] = pd.concat(
-                            [st.session_state['active_agents_data'], new_agents],
-                            ignore_index=True
-                        )
-                        st.session_state['active_agents_offset'] = next_offset
-                st.rerun()
-    else:
-        st.info("No active agents match the current filters.")
+    _active_agents_results(active_filters)
@@ -1,22 +1,27 @@
 import streamlit as st
 import pandas as pd
-import os
-import re
-import snowflake.connector
-from snowflake.connector import DictCursor
-from config import EXPORT_PATH
-
-SNOWFLAKE = {
-    "user": os.getenv("SNOWFLAKE_USER"),
-    "password": os.getenv("SNOWFLAKE_PASSWORD"),
-    "account": os.getenv("SNOWFLAKE_ACCOUNT"),
-    "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
-    "database": os.getenv("SNOWFLAKE_DATABASE"),
-    "schema": os.getenv("SNOWFLAKE_SCHEMA"),
-}
+import time
+from config import EXPORT_PATH, SNOWFLAKE_RESULT_MAX_AGE
+from filter_spec import FilterSpec, SNOWFLAKE, between, contains, one_of
+from snowflake_db import (
+    run_snowflake_query, run_snowflake_queries_async, run_snowflake_query_once,
+    result_page_query, result_count_query, RESULT_ROW_COL,
+)
+from dimension_options import US_STATES
 
 CACHE_LIMIT = 10_000
 
+# Session state key for the Snowflake query ids in flight for this view
+AP_STATE_KEY = "ap_inflight_query_ids"
+
+# Display order of the stored result. Pages are read back by row number, so the order must be
+# deterministic: first/last name, then email, then HASH(*) over the whole row as the final
+# tiebreaker (rows it can't separate are identical in every column). Verify these match your actual schema!
+AP_ORDER_BY = (
+    "PRESENTED_BY_FIRST_NAME ASC NULLS LAST, PRESENTED_BY_LAST_NAME ASC NULLS LAST, "
+    "EMAIL ASC NULLS LAST, HASH(*)"
+)
+
 CURRENCY_COLS = [
     "Sold Volume", "Avg Sold Price",
     "Pending Volume", "Avg Pending Price",
@@ -45,48 +50,6 @@ def _fmt_display(df: pd.DataFrame) -> pd.DataFrame:
     return out
 
 
-def connect_snowflake() -> snowflake.connector.SnowflakeConnection:
-    try:
-        conn = snowflake.connector.connect(**SNOWFLAKE)
-        return conn
-    except Exception as e:
-        st.error(f"Failed to connect to Snowflake: {e}")
-        return None
-
-
-def run_snowflake_query(query, params=None):
-    """Executes a query on Snowflake and returns a DataFrame."""
-    sql = query.replace("≥", ">=").replace("≤", "<=")
-    if params:
-        sql = re.sub(r":([A-Za-z_][A-Za-z0-9_]*)", r"%(\1)s", sql)
-    conn = connect_snowflake()
-    if conn is None:
-        st.error("Snowflake connection was not established.")
-        return pd.DataFrame()
-    cur = None
-    try:
-        cur = conn.cursor(DictCursor)
-        if params:
-            cur.execute(sql, params)
-        else:
-            cur.execute(sql)
-        rows = cur.fetchall()
-        df = pd.DataFrame(rows)
-        return df
-    except Exception as e:
-        st.error(f"Error executing query: {e}")
-        st.error(f"SQL Query: {sql}")
-        if params:
-            st.error(f"Parameters: {params}")
-        return pd.DataFrame()
-    finally:
-        try:
-            if cur is not None:
-                cur.close()
-        finally:
-            conn.close()
-
-
 def _build_where(
     name_filter, broker_filter, email_filter, role_filter, state_filter,
     total_volume_min=None, total_volume_max=None,
@@ -94,82 +57,21 @@ def _build_where(
     txn_count_min=None, txn_count_max=None,
 ):
     """Shared WHERE clause builder for data and count queries."""
-    where_clauses = []
-    params = {}
-
-    if name_filter:
-        where_clauses.append(
-            "(PRESENTED_BY_FIRST_NAME ILIKE :name_like OR PRESENTED_BY_LAST_NAME ILIKE :name_like)"
-        )
-        params["name_like"] = f"%{name_filter}%"
-
-    if broker_filter:
-        where_clauses.append("BROKERED_BY ILIKE :broker_like")
-        params["broker_like"] = f"%{broker_filter}%"
-
-    if email_filter:
-        where_clauses.append("EMAIL ILIKE :email_like")
-        params["email_like"] = f"%{email_filter}%"
-
-    if role_filter:
-        where_clauses.append("ROLE ILIKE :role_like")
-        params["role_like"] = f"%{role_filter}%"
-
-    if state_filter:
-        placeholders = []
-        for i, state in enumerate(state_filter):
-            key = f"state_{i}"
-            placeholders.append(f":{key}")
-            params[key] = state
-        where_clauses.append(f"STATE IN ({', '.join(placeholders)})")
-
-    if total_volume_min is not None and total_volume_min > 0:
-        where_clauses.append("TOTAL_VOLUME >= :total_volume_min")
-        params["total_volume_min"] = total_volume_min
-
-    if total_volume_max is not None and total_volume_max < 999_999_999_999:
-        where_clauses.append("TOTAL_VOLUME <= :total_volume_max")
-        params["total_volume_max"] = total_volume_max
-
-    if avg_price_min is not None and avg_price_min > 0:
-        where_clauses.append("AVG_TRANSACTION_PRICE >= :avg_price_min")
-        params["avg_price_min"] = avg_price_min
-
-    if avg_price_max is not None and avg_price_max < 999_999_999_999:
-        where_clauses.append("AVG_TRANSACTION_PRICE <= :avg_price_max")
-        params["avg_price_max"] = avg_price_max
-
-    if txn_count_min is not None and txn_count_min > 0:
-        where_clauses.append("TOTAL_TRANSACTION_COUNT >= :txn_count_min")
-        params["txn_count_min"] = txn_count_min
-
-    if txn_count_max is not None and txn_count_max < 999_999:
-        where_clauses.append("TOTAL_TRANSACTION_COUNT <= :txn_count_max")
-        params["txn_count_max"] = txn_count_max
-
-    where_clause = ("WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
-    return where_clause, params
-
-
-def get_total_agent_performance_count(
-    name_filter=None, broker_filter=None, email_filter=None,
-    role_filter=None, state_filter=None,
-    total_volume_min=None, total_volume_max=None,
-    avg_price_min=None, avg_price_max=None,
-    txn_count_min=None, txn_count_max=None,
-):
-    """Returns the total number of matching rows."""
-    where_clause, params = _build_where(
-        name_filter, broker_filter, email_filter, role_filter, state_filter,
-        total_volume_min, total_volume_max, avg_price_min, avg_price_max,
-        txn_count_min, txn_count_max,
-    )
-    query = f"""
-    SELECT COUNT(*) AS "total"
-    FROM SCOUT_DW.COMPCURVE.AGENT_PERFORMANCE_WITH_LOCATION_CANON
-    {where_clause}
-    """
-    df = run_snowflake_query(query, params=params or None)
+    # Range inputs at their widget limits mean "no limit"
+    return FilterSpec.of(
+        contains(["PRESENTED_BY_FIRST_NAME", "PRESENTED_BY_LAST_NAME"], name_filter),
+        contains("BROKERED_BY", broker_filter),
+        contains("EMAIL", email_filter),
+        contains("ROLE", role_filter),
+        one_of("STATE", state_filter),
+        between("TOTAL_VOLUME", total_volume_min, total_volume_max, floor=0, cap=999_999_999_999),
+        between("AVG_TRANSACTION_PRICE", avg_price_min, avg_price_max, floor=0, cap=999_999_999_999),
+        between("TOTAL_TRANSACTION_COUNT", txn_count_min, txn_count_max, floor=0, cap=999_999),
+    ).where(SNOWFLAKE)
+
+
+def _count_from_df(df: pd.DataFrame) -> int:
+    """Reads the single COUNT(*) value out of a count query result."""
     if not df.empty:
         val = df.iloc[0].get("total", df.iloc[0].get("TOTAL", df.iloc[0].iloc[0]))
         try:
@@ -179,22 +81,23 @@ def get_total_agent_performance_count(
     return 0
 
 
-def load_agent_performance_data(
+def _full_query(
     name_filter=None, broker_filter=None, email_filter=None,
     role_filter=None, state_filter=None,
     total_volume_min=None, total_volume_max=None,
     avg_price_min=None, avg_price_max=None,
     txn_count_min=None, txn_count_max=None,
-    limit=CACHE_LIMIT, offset=0,
 ):
-    """Loads Agent Performance data from Snowflake with LIMIT/OFFSET."""
+    """
+    Builds the full filtered query and its :name params. It is run once per filter set
+    (run_snowflake_query_once); rows are numbered in display order in the hidden RESULT_ROW_COL
+    column so pages can be read back from the stored result with RESULT_SCAN.
+    """
     where_clause, params = _build_where(
         name_filter, broker_filter, email_filter, role_filter, state_filter,
         total_volume_min, total_volume_max, avg_price_min, avg_price_max,
         txn_count_min, txn_count_max,
     )
-    params["limit"] = limit
-    params["offset"] = offset
 
     query = f"""
     SELECT
@@ -224,14 +127,115 @@ def load_agent_performance_data(
         OFFICE_ADDRESS_2               AS "Office Address 2",
         OFFICE_CITY                    AS "Office City",
         OFFICE_STATE                   AS "Office State",
-        OFFICE_ZIP                     AS "Office Zip"
+        OFFICE_ZIP                     AS "Office Zip",
+        ROW_NUMBER() OVER (ORDER BY {AP_ORDER_BY}) AS "{RESULT_ROW_COL}"
     FROM SCOUT_DW.COMPCURVE.AGENT_PERFORMANCE_WITH_LOCATION_CANON
     {where_clause}
-    ORDER BY PRESENTED_BY_FIRST_NAME ASC NULLS LAST
-    LIMIT :limit OFFSET :offset
     """
+    return query, params or None
+
+
+def _result_for(**filters):
+    """Query id of the stored full result for these filters (running it if needed), or None."""
+    return run_snowflake_query_once(AP_STATE_KEY, *_full_query(**filters))
+
+
+def load_agent_performance_page(qid, offset, limit=CACHE_LIMIT):
+    """Loads one page of Agent Performance data from stored result `qid` (rows offset+1 .. offset+limit)."""
+    query, params = result_page_query(qid, offset, limit)
+    return run_snowflake_query(query, params=params, cache=True)
+
+
+def _load_first_page(ap_filters):
+    """
+    Runs (or reuses) the stored result for `ap_filters` and reads its count and first page into
+    session state, along with its query id: Load More reads every later page from that same result,
+    so the row numbers it continues from never shift under it.
+    """
+    # The filter and sort run once per filter set; the count and every page are then read
+    # from that stored result. If the filters change while it runs, the rerun cancels it.
+    qid = _result_for(**ap_filters)
+    count_df, first_page = pd.DataFrame(), pd.DataFrame()
+    if qid is not None:
+        count_df, first_page = run_snowflake_queries_async(
+            AP_STATE_KEY,
+            [result_count_query(qid), result_page_query(qid, 0, CACHE_LIMIT)],
+            cache=True,
+        )
+    ap_total = _count_from_df(count_df)
+    st.session_state["ap_qid"] = qid
+    st.session_state["ap_qid_loaded_at"] = time.time()
+    st.session_state["ap_total"] = ap_total
+    st.session_state["ap_df"] = first_page if ap_total > 0 else pd.DataFrame()
+    st.session_state["ap_df_fmt"] = _fmt_display(st.session_state["ap_df"])
+
+
+@st.fragment
+def _agent_performance_results(ap_filters):
+    """
+    The results table, metrics, export and Load More. Runs as a fragment, so fetching the next
+    page only reruns this part of the page (and formats only the new rows) instead of the whole app.
+    """
+    df    = st.session_state["ap_df"]
+    total = st.session_state["ap_total"]
+
+    if not df.empty:
+        df_fmt = st.session_state.get("ap_df_fmt")
+        if df_fmt is None or len(df_fmt) != len(df):
+            df_fmt = _fmt_display(df)
+        st.dataframe(
+            df_fmt,
+            use_container_width=True,
+            hide_index=True,
+            height=600,
+        )
+
+        col_metric, col_dl = st.columns([2, 1])
+        with col_metric:
+            st.metric("Rows Displayed", f"{len(df):,}")
+            st.metric("Total Rows Matching Filters", f"{total:,}")
+            st.caption(f"Showing records 1–{len(df):,} of {total:,}")
+
+        with col_dl:
+            csv_data = df.to_csv(index=False).encode("utf-8")
+            st.download_button(
+                label="Export Displayed Data as CSV",
+                data=csv_data,
+                file_name="agent_performance_view.csv",
+                mime="text/csv",
+                key="download_ap_csv",
+            )
 
-    return run_snowflake_query(query, params=params)
+        # Load More
+        if len(df) < total:
+            if st.button("Load More", key="load_more_ap"):
+                next_offset = len(df)
+                qid = st.session_state.get("ap_qid")
+                more = pd.DataFrame()
+                # Snowflake drops stored results after a day; past our reuse age, don't wait for that
+                if qid is not None and time.time() - st.session_state.get("ap_qid_loaded_at", 0) < SNOWFLAKE_RESULT_MAX_AGE:
+                    with st.spinner("Loading more records..."):
+                        more = load_agent_performance_page(qid, next_offset)
+                if more.empty:
+                    # The stored result is gone: start over from page 1 of a fresh one
+                    with st.spinner("Reloading Agent Performance data..."):
+                        _load_first_page(ap_filters)
+                    st.toast("The stored results had expired, so they were reloaded from the first page.")
+                else:
+                    st.session_state["ap_df"] = pd.concat(
+                        [st.session_state["ap_df"], more], ignore_index=True
+                    )
+                    st.session_state["ap_df_fmt"] = pd.concat(
+                        [df_fmt, _fmt_display(more)], ignore_index=True
+                    )
+                    st.session_state["ap_offset"] = next_offset
+                # Only the results need redrawing; the sidebar and filters haven't changed
+                st.rerun(scope="fragment")
+    else:
+        if total == 0 and st.session_state["ap_last_filters"]:
+            st.info("No Agent Performance records match the current filters.")
+        else:
+            st.info("Loading data...")
 
 
 def agent_performance_view():
@@ -240,61 +244,57 @@ def agent_performance_view():
 
     # ── Sidebar filters ──────────────────────────────────────────────────────
     with st.sidebar:
-        st.markdown("### Filters")
-        st.text_input("Name",      key="filter_ap_name",   placeholder="Search by first or last name...")
-        st.text_input("Broker",    key="filter_ap_broker", placeholder="Search by broker...")
-        st.text_input("Email",     key="filter_ap_email",  placeholder="Search by email...")
-        st.text_input("Team Role", key="filter_ap_role",   placeholder="Search by role...")
-
-        state_options = [
-            'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-            'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-            'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-            'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-            'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY',
-        ]
-        saved = st.session_state.get("filter_ap_state", [])
-        st.multiselect(
-            "State",
-            options=state_options,
-            default=[s for s in saved if s in state_options],
-            key="filter_ap_state",
-        )
+        with st.form("ap_filters_form", border=False):
+            st.markdown("### Filters")
+            st.text_input("Name",      key="filter_ap_name",   placeholder="Search by first or last name...")
+            st.text_input("Broker",    key="filter_ap_broker", placeholder="Search by broker...")
+            st.text_input("Email",     key="filter_ap_email",  placeholder="Search by email...")
+            st.text_input("Team Role", key="filter_ap_role",   placeholder="Search by role...")
+
+            saved = st.session_state.get("filter_ap_state", [])
+            st.multiselect(
+                "State",
+                options=US_STATES,
+                default=[s for s in saved if s in US_STATES],
+                key="filter_ap_state",
+            )
 
-        st.markdown("---")
-
-        with st.expander("Total Volume Range", expanded=False):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.number_input("Min ($)", min_value=0, max_value=999_999_999_999,
-                                value=0, step=100_000, key="filter_ap_vol_min",
-                                format="%d")
-            with col2:
-                st.number_input("Max ($)", min_value=0, max_value=999_999_999_999,
-                                value=999_999_999_999, step=100_000, key="filter_ap_vol_max",
-                                format="%d")
-
-        with st.expander("Avg Transaction Price Range", expanded=False):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.number_input("Min ($)", min_value=0, max_value=999_999_999_999,
-                                value=0, step=10_000, key="filter_ap_avg_min",
-                                format="%d")
-            with col2:
-                st.number_input("Max ($)", min_value=0, max_value=999_999_999_999,
-                                value=999_999_999_999, step=10_000, key="filter_ap_avg_max",
-                                format="%d")
-
-        with st.expander("Total Transaction Count Range", expanded=False):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.number_input("Min", min_value=0, max_value=999_999,
-                                value=0, step=1, key="filter_ap_txn_min")
-            with col2:
-                st.number_input("Max", min_value=0, max_value=999_999,
-                                value=999_999, step=1, key="filter_ap_txn_max")
-
-        st.markdown("---")
+            st.markdown("---")
+
+            with st.expander("Total Volume Range", expanded=False):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.number_input("Min ($)", min_value=0, max_value=999_999_999_999,
+                                    value=0, step=100_000, key="filter_ap_vol_min",
+                                    format="%d")
+                with col2:
+                    st.number_input("Max ($)", min_value=0, max_value=999_999_999_999,
+                                    value=999_999_999_999, step=100_000, key="filter_ap_vol_max",
+                                    format="%d")
+
+            with st.expander("Avg Transaction Price Range", expanded=False):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.number_input("Min ($)", min_value=0, max_value=999_999_999_999,
+                                    value=0, step=10_000, key="filter_ap_avg_min",
+                                    format="%d")
+                with col2:
+                    st.number_input("Max ($)", min_value=0, max_value=999_999_999_999,
+                                    value=999_999_999_999, step=10_000, key="filter_ap_avg_max",
+                                    format="%d")
+
+            with st.expander("Total Transaction Count Range", expanded=False):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.number_input("Min", min_value=0, max_value=999_999,
+                                    value=0, step=1, key="filter_ap_txn_min")
+                with col2:
+                    st.number_input("Max", min_value=0, max_value=999_999,
+                                    value=999_999, step=1, key="filter_ap_txn_max")
+
+            st.markdown("---")
+            # One query round per submitted batch of edits, not one per keystroke
+            st.form_submit_button("Apply Filters", use_container_width=True)
 
     # ── Session state defaults ───────────────────────────────────────────────
     st.session_state.setdefault("ap_offset", 0)
@@ -331,105 +331,28 @@ def agent_performance_view():
 
     filters_changed = current_filters != st.session_state["ap_last_filters"]
 
+    ap_filters = dict(
+        name_filter=name_filter or None,
+        broker_filter=broker_filter or None,
+        email_filter=email_filter or None,
+        role_filter=role_filter or None,
+        state_filter=state_filter or None,
+        total_volume_min=total_volume_min,
+        total_volume_max=total_volume_max,
+        avg_price_min=avg_price_min,
+        avg_price_max=avg_price_max,
+        txn_count_min=txn_count_min,
+        txn_count_max=txn_count_max,
+    )
+
     # ── On filter change: reset and reload first page ────────────────────────
     if filters_changed:
         st.session_state["ap_offset"] = 0
+        with st.spinner("Loading Agent Performance data..."):
+            _load_first_page(ap_filters)
+        # Only mark the filters as loaded once their results are in
         st.session_state["ap_last_filters"] = current_filters.copy()
 
-        with st.spinner("Calculating total records..."):
-            st.session_state["ap_total"] = get_total_agent_performance_count(
-                name_filter=name_filter or None,
-                broker_filter=broker_filter or None,
-                email_filter=email_filter or None,
-                role_filter=role_filter or None,
-                state_filter=state_filter or None,
-                total_volume_min=total_volume_min,
-                total_volume_max=total_volume_max,
-                avg_price_min=avg_price_min,
-                avg_price_max=avg_price_max,
-                txn_count_min=txn_count_min,
-                txn_count_max=txn_count_max,
-            )
-
-        if st.session_state["ap_total"] > 0:
-            with st.spinner("Loading Agent Performance data..."):
-                st.session_state["ap_df"] = load_agent_performance_data(
-                    name_filter=name_filter or None,
-                    broker_filter=broker_filter or None,
-                    email_filter=email_filter or None,
-                    role_filter=role_filter or None,
-                    state_filter=state_filter or None,
-                    total_volume_min=total_volume_min,
-                    total_volume_max=total_volume_max,
-                    avg_price_min=avg_price_min,
-                    avg_price_max=avg_price_max,
-                    txn_count_min=txn_count_min,
-                    txn_count_max=txn_count_max,
-                    limit=CACHE_LIMIT,
-                    offset=0,
-                )
-        else:
-            st.session_state["ap_df"] = pd.DataFrame()
-
         st.rerun()
 
-    # ── Render ───────────────────────────────────────────────────────────────
-    df    = st.session_state["ap_df"]
-    total = st.session_state["ap_total"]
-    offset = st.session_state["ap_offset"]
-
-    if not df.empty:
-        st.dataframe(
-            _fmt_display(df),
-            use_container_width=True,
-            hide_index=True,
-            height=600,
-        )
-
-        col_metric, col_dl = st.columns([2, 1])
-        with col_metric:
-            st.metric("Rows Displayed", f"{len(df):,}")
-            st.metric("Total Rows Matching Filters", f"{total:,}")
-            st.caption(f"Showing records 1–{len(df):,} of {total:,}")
-
-        with col_dl:
-            csv_data = df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                label="Export Displayed Data as CSV",
-                data=csv_data,
-                file_name="agent_performance_view.csv",
-                mime="text/csv",
-                key="download_ap_csv",
-            )
-
-        # Load More
-        if len(df) < total:
-            if st.button("Load More", key="load_more_ap"):
-                next_offset = offset + CACHE_LIMIT
-                with st.spinner("Loading more records..."):
-                    more = load_agent_performance_data(
-                        name_filter=name_filter or None,
-                        broker_filter=broker_filter or None,
-                        email_filter=email_filter or None,
-                        role_filter=role_filter or None,
-                        state_filter=state_filter or None,
-                        total_volume_min=total_volume_min,
-                        total_volume_max=total_volume_max,
-                        avg_price_min=avg_price_min,
-                        avg_price_max=avg_price_max,
-                        txn_count_min=txn_count_min,
-                        txn_count_max=txn_count_max,
-                        limit=CACHE_LIMIT,
-                        offset=next_offset,
-                    )
-                if not more.empty:
-                    st.session_state["ap_df"] = pd.concat(
-                        [st.session_state["ap_df"], more], ignore_index=True
-                    )
-                    st.session_state["ap_offset"] = next_offset
-                st.rerun()
-    else:
-        if total == 0 and st.session_state["ap_last_filters"]:
-            st.info("No Agent Performance records match the current filters.")
-        else:
-            st.info("Loading data...")
+    _agent_performance_results(ap_filters)
@@ -1,40 +1,59 @@
 import streamlit as st
 import pandas as pd
-import os
-from config import EXPORT_PATH
-from db import run_query
+from db import run_query, copy_query_to_csv, estimate_count, estimate_table_rows
+from pagination import ROW_ID, seek_order_by, seek_predicate, seek_select, split_page
+from row_counts import start_count, count_label, watch_count
+from filter_spec import FilterSpec, Raw, SEARCH_RANK_PARAM, contains, one_of, search, search_rank
+from dimension_options import US_STATES
+from exports import full_csv_download
 
 CACHE_LIMIT_AGENTS = 5000
 
+# agents_master has no natural ordering; page by its row key (see migrations/row_keys.py)
+AGENTS_SORT_KEYS = [ROW_ID]
+# While searching, best match first (descending, with the row id as tiebreaker)
+AGENTS_SEARCH_SORT_KEYS = [search_rank(), ROW_ID]
 
-def load_agents_data(limit=CACHE_LIMIT_AGENTS, offset=0, states=None, agent_name_filter=None, brokerage_filter=None):
-    """Loads agent data from the database based on filters."""
-    where_clauses = []
-    params = {'limit': limit, 'offset': offset}
 
-    if states:
-        where_clauses.append('"office_state" IN %(states)s')
-        params['states'] = tuple(states)
+def _agents_filter(states=None, agent_name_filter=None, brokerage_filter=None, search_text=None, association=None):
+    """The agents_master filters as a FilterSpec."""
+    return FilterSpec.of(
+        search(search_text),
+        one_of('"office_state"', states),
+        contains(["agent_first_name", "agent_last_name"], agent_name_filter),
+        contains("office_name", brokerage_filter),
+        contains("association", association),
+    )
 
-    if agent_name_filter:
-        where_clauses.append('('
-                             'LOWER(agent_first_name) LIKE %(name_like)s OR '
-                             'LOWER(agent_last_name) LIKE %(name_like)s'
-                             ')')
-        params['name_like'] = f"%{agent_name_filter}%"
 
-    if brokerage_filter:
-        where_clauses.append('LOWER(office_name) LIKE %(brokerage_like)s')
-        params['brokerage_like'] = f"%{brokerage_filter}%"
-
-    association_filter = st.session_state.get("filter_association", "").strip().lower()
-    if association_filter:
-        where_clauses.append('LOWER(association) LIKE %(association_like)s')
-        params['association_like'] = f"%{association_filter}%"
+def _agents_query(states=None, agent_name_filter=None, brokerage_filter=None, page_limit=None, after=None,
+                  search_text=None, association=None):
+    """
+    Builds the agents_master query and its params for the given filters.
 
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
+    With `page_limit` set, the query returns one keyset page (rows after the cursor `after`)
+    including the hidden seek columns; otherwise it returns every matching row. With
+    `search_text`, pages are ordered by search relevance.
+    """
+    spec = _agents_filter(states, agent_name_filter, brokerage_filter, search_text, association)
+    seek_params = {}
+    seek_columns = ""
+    page_clause = ""
+    if page_limit is not None:
+        search_predicate = search(search_text)
+        descending = search_predicate is not None
+        sort_keys = AGENTS_SEARCH_SORT_KEYS if descending else AGENTS_SORT_KEYS
+        seek_clause, seek_params = seek_predicate(sort_keys, after, descending=descending)
+        if seek_clause:
+            spec = spec.and_(Raw(seek_clause))
+        seek_columns = f",\n      {seek_select(sort_keys)}"
+        page_clause = f"{seek_order_by(sort_keys, descending=descending)}\n    LIMIT %(limit)s"
+        seek_params['limit'] = page_limit
+        if descending:
+            seek_params[SEARCH_RANK_PARAM] = search_predicate.text
+
+    where_clause, params = spec.where()
+    params.update(seek_params)
 
     query = f"""
     SELECT
@@ -51,76 +70,139 @@ def load_agents_data(limit=CACHE_LIMIT_AGENTS, offset=0, states=None, agent_name
       office_phone AS "Phone",
       license_type AS "License type",
       license_number AS "License number",
-      association AS "Association"
+      association AS "Association"{seek_columns}
     FROM agents_master
     {where_clause}
-    LIMIT %(limit)s OFFSET %(offset)s;
+    {page_clause}
     """
-
-    df = run_query(query, params=params)
-    return df
+    return query, params
 
 
-def get_total_agents_count(states=None, agent_name_filter=None, brokerage_filter=None):
-    """Counts total number of agents matching the filters."""
-    where_clauses = []
-    params = {}
+def load_agents_data(limit=CACHE_LIMIT_AGENTS, after=None, states=None, agent_name_filter=None, brokerage_filter=None,
+                     search_text=None, association=None):
+    """Loads one keyset page of agent data (rows after the cursor `after`) based on filters."""
+    query, params = _agents_query(states, agent_name_filter, brokerage_filter, page_limit=limit, after=after,
+                                  search_text=search_text, association=association)
 
-    if states:
-        where_clauses.append('"office_state" IN %(states)s')
-        params['states'] = tuple(states)
+    df = run_query(query, params=params, dtype_backend="pyarrow", cache=True)
+    return df
 
-    if agent_name_filter:
-        where_clauses.append('('
-                             'LOWER(agent_first_name) LIKE %(name_like)s OR '
-                             'LOWER(agent_last_name) LIKE %(name_like)s'
-                             ')')
-        params['name_like'] = f"%{agent_name_filter}%"
 
-    if brokerage_filter:
-        where_clauses.append('LOWER(office_name) LIKE %(brokerage_like)s')
-        params['brokerage_like'] = f"%{brokerage_filter}%"
+def export_agents_csv(dest, states=None, agent_name_filter=None, brokerage_filter=None, search_text=None,
+                      association=None):
+    """Writes every agent matching the filters to `dest` as CSV via COPY, skipping pandas entirely."""
+    query, params = _agents_query(states, agent_name_filter, brokerage_filter, search_text=search_text,
+                                  association=association)
+    return copy_query_to_csv(query, params=params, dest=dest)
 
-    association_filter = st.session_state.get("filter_association", "").strip().lower()
-    if association_filter:
-        where_clauses.append('LOWER(association) LIKE %(association_like)s')
-        params['association_like'] = f"%{association_filter}%"
 
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
+def get_total_agents_count(states=None, agent_name_filter=None, brokerage_filter=None, search_text=None,
+                           association=None, estimate=False):
+    """Counts total number of agents matching the filters; with `estimate=True` returns the planner's estimate instead."""
+    where_clause, params = _agents_filter(states, agent_name_filter, brokerage_filter, search_text,
+                                          association).where()
 
     query = f"""
     SELECT COUNT(*) FROM agents_master
     {where_clause};
     """
 
-    result = run_query(query, params=params)
+    if estimate:
+        # Unfiltered: the table statistics already hold the answer
+        return estimate_count(query, params) if where_clause else estimate_table_rows("agents_master")
+
+    result = run_query(query, params=params, cache=True)
     return result.iloc[0][0] if not result.empty else 0
 
 
+@st.fragment
+def _agents_results(applied_filters):
+    """
+    The results table, metrics, export and Load More. Runs as a fragment, so fetching the next
+    page only reruns this part of the page instead of the whole app.
+
+    Args:
+        applied_filters (dict): The filters the loaded rows were fetched with (keyword arguments of
+            load_agents_data), so Load More continues the same result set after unapplied sidebar edits.
+    """
+    df_agents = st.session_state.get('filtered_agents_data', pd.DataFrame())
+
+    if not df_agents.empty:
+        st.dataframe(df_agents, use_container_width=True, hide_index=True)
+
+        col_metric_agents, col_dl_agents = st.columns([2, 1])
+        with col_metric_agents:
+            st.metric("Rows Displayed", len(df_agents))
+            st.metric("Total Rows Matching Filters", count_label('total_agents'))
+            # Every loaded page is kept, so the rows shown always start at 1
+            end = len(df_agents)
+            st.caption(f"Showing agents 1-{end} of {count_label('total_agents')}")
+            watch_count('total_agents')
+
+        with col_dl_agents:
+            if len(df_agents) > 15000:
+                # Let PostgreSQL render the CSV (COPY ... TO STDOUT), only when asked for
+                full_csv_download(
+                    "agents", "filtered_agents_view.csv", applied_filters,
+                    lambda dest: export_agents_csv(dest, **applied_filters),
+                    st.session_state.total_agents
+                )
+            else:
+                csv_data = df_agents.to_csv(index=False).encode("utf-8")
+                st.download_button(
+                    label="Export Displayed Data as CSV",
+                    data=csv_data,
+                    file_name="filtered_agents_view.csv",
+                    mime="text/csv",
+                    key="download_agents_csv"
+                )
+
+        if end < st.session_state.total_agents and st.button("Load More", key="load_more_agents"):
+            with st.spinner("Loading more agent data..."):
+                new_agents = load_agents_data(
+                    CACHE_LIMIT_AGENTS,
+                    st.session_state.get('agents_master_cursor'),
+                    **applied_filters
+                )
+            new_agents, next_cursor = split_page(new_agents)
+            if not new_agents.empty:
+                st.session_state.agents_master_cursor = next_cursor
+                st.session_state.filtered_agents_data = pd.concat(
+                    [st.session_state.filtered_agents_data, new_agents], ignore_index=True
+                )
+            # Only the results need redrawing; the sidebar and filters haven't changed
+            st.rerun(scope="fragment")
+
+    else:
+        if st.session_state.total_agents == 0 and st.session_state.agents_filters_applied:
+            st.info("No agents match the current filters.")
+        else:
+            st.info("Apply filters using the sidebar to load agent data.")
+
+
 def agents_view():
     st.title("Agents View")
 
-    us_states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-                 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-                 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-                 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-                 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
-
     # Additional filters
     st.session_state.setdefault('filter_agent', "")
     st.session_state.setdefault('filter_brokerage', "")
+    st.session_state.setdefault('filter_search_agents', "")
 
     # Session state
-    st.session_state.setdefault('agents_offset', 0)
+    st.session_state.setdefault('agents_master_cursor', None)
     st.session_state.setdefault('filtered_agents_data', pd.DataFrame())
     st.session_state.setdefault('total_agents', 0)
-    st.session_state.setdefault('selected_states_agents', us_states)
+    st.session_state.setdefault('selected_states_agents', US_STATES)
     st.session_state.setdefault('agents_filters_applied', False)
-    st.session_state.setdefault('load_more_requested', False)
+    st.session_state.setdefault('agents_applied_filters', {})
 
     with st.sidebar:
+        st.header("Search")
+        st.text_input(
+            "Search", key="filter_search_agents", placeholder='e.g. "john smith" remax -keller',
+            help="Full-text search across name, brokerage and city, best matches first."
+        )
+
         st.header("Filter Agents by Location")
         st.text_input("Agent Name", key="filter_agent")
         st.text_input("Brokerage", key="filter_brokerage")
@@ -129,10 +211,10 @@ def agents_view():
         st.header("Filter Agents by Location")
         select_all_states_agents = st.checkbox("Select All States", key="select_all_states_agents", value=True)
         if select_all_states_agents:
-            st.session_state.selected_states_agents = us_states
+            st.session_state.selected_states_agents = US_STATES
         else:
             st.session_state.selected_states_agents = st.multiselect(
-                "State", us_states, default=st.session_state.selected_states_agents, key="state_select_agents"
+                "State", US_STATES, default=st.session_state.selected_states_agents, key="state_select_agents"
             )
 
         col1, col2 = st.columns(2)
@@ -140,95 +222,32 @@ def agents_view():
             apply_filters_btn = st.button("Apply Filters", key="apply_filters_agents")
         with col2:
             if st.button("Clear Filters", key="clear_filters_agents"):
-                st.session_state.selected_states_agents = us_states
+                st.session_state.selected_states_agents = US_STATES
                 st.session_state.agents_filters_applied = False
-                st.session_state.agents_offset = 0
                 st.session_state.filtered_agents_data = pd.DataFrame()
                 if "filter_association" in st.session_state:
                     del st.session_state["filter_association"]
+                del st.session_state["filter_search_agents"]
                 st.rerun()
 
-    agent_name_filter = st.session_state.get("filter_agent", "").strip().lower()
-    brokerage_filter = st.session_state.get("filter_brokerage", "").strip().lower()
-
     if apply_filters_btn or not st.session_state.agents_filters_applied:
-        st.session_state.agents_offset = 0
         st.session_state.agents_filters_applied = True
-        with st.spinner("Calculating total agents..."):
-            st.session_state.total_agents = get_total_agents_count(
-                st.session_state.selected_states_agents,
-                agent_name_filter,
-                brokerage_filter
-            )
-        if st.session_state.total_agents > 0:
-            with st.spinner("Loading agent data..."):
-                st.session_state.filtered_agents_data = load_agents_data(
-                    CACHE_LIMIT_AGENTS, 0, st.session_state.selected_states_agents, agent_name_filter, brokerage_filter
-                )
-        else:
-            st.session_state.filtered_agents_data = pd.DataFrame()
+        # Snapshot the sidebar as applied: the results and Load More use these until the next Apply
+        applied_filters = {
+            "states": list(st.session_state.selected_states_agents),
+            "agent_name_filter": st.session_state.get("filter_agent", "").strip().lower(),
+            "brokerage_filter": st.session_state.get("filter_brokerage", "").strip().lower(),
+            "search_text": st.session_state.get("filter_search_agents", "").strip(),
+            "association": st.session_state.get("filter_association", "").strip(),
+        }
+        st.session_state.agents_applied_filters = applied_filters
+        with st.spinner("Loading agent data..."):
+            # Estimated total now, exact COUNT(*) in the background
+            start_count('total_agents', get_total_agents_count, **applied_filters)
+            first_page = load_agents_data(CACHE_LIMIT_AGENTS, None, **applied_filters)
+        first_page, st.session_state.agents_master_cursor = split_page(first_page)
+        st.session_state.filtered_agents_data = first_page
         if apply_filters_btn:
             st.rerun()
 
-    df_agents = st.session_state.get('filtered_agents_data', pd.DataFrame())
-
-    if not df_agents.empty:
-        st.dataframe(df_agents, use_container_width=True, hide_index=True)
-
-        col_metric_agents, col_dl_agents = st.columns([2, 1])
-        with col_metric_agents:
-            st.metric("Rows Displayed", len(df_agents))
-            st.metric("Total Rows Matching Filters", st.session_state.total_agents)
-            start = st.session_state.agents_offset + 1
-            end = st.session_state.agents_offset + len(df_agents)
-            st.caption(f"Showing agents {start}-{end} of {st.session_state.total_agents}")
-
-        with col_dl_agents:
-            if len(df_agents) > 15000:
-                os.makedirs(EXPORT_PATH, exist_ok=True)
-                export_path = os.path.join(EXPORT_PATH, "filtered_agents_view.csv")
-                df_agents.to_csv(export_path, index=False)
-                with open(export_path, "rb") as f:
-                    st.download_button(
-                        label="Download Full CSV",
-                        data=f,
-                        file_name="filtered_agents_view.csv",
-                        mime="text/csv",
-                        key="download_agents_csv_large"
-                    )
-            else:
-                csv_data = df_agents.to_csv(index=False).encode("utf-8")
-                st.download_button(
-                    label="Export Displayed Data as CSV",
-                    data=csv_data,
-                    file_name="filtered_agents_view.csv",
-                    mime="text/csv",
-                    key="download_agents_csv"
-                )
-
-        if end < st.session_state.total_agents:
-            if st.button("Load More", key="load_more_agents"):
-                st.session_state.load_more_requested = True
-
-        if st.session_state.load_more_requested:
-            with st.spinner("Loading more agent data..."):
-                new_agents = load_agents_data(
-                    CACHE_LIMIT_AGENTS,
-                    st.session_state.agents_offset + CACHE_LIMIT_AGENTS,
-                    st.session_state.selected_states_agents,
-                    agent_name_filter,
-                    brokerage_filter
-                )
-            if not new_agents.empty:
-                st.session_state.filtered_agents_data = pd.concat(
-                    [st.session_state.filtered_agents_data, new_agents], ignore_index=True
-                )
-                st.session_state.agents_offset += CACHE_LIMIT_AGENTS
-            st.session_state.load_more_requested = False
-            st.rerun()
-
-    else:
-        if st.session_state.total_agents == 0 and st.session_state.agents_filters_applied:
-            st.info("No agents match the current filters.")
-        else:
-            st.info("Apply filters using the sidebar to load agent data.")
+    _agents_results(st.session_state.agents_applied_filters)
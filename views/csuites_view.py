@@ -1,28 +1,40 @@
 import streamlit as st
 import pandas as pd
-import os
-import re
-import snowflake.connector
-from snowflake.connector import DictCursor
-from config import EXPORT_PATH
-
-SNOWFLAKE = {
-    "user": os.getenv("SNOWFLAKE_USER"),
-    "password": os.getenv("SNOWFLAKE_PASSWORD"),
-    "account": os.getenv("SNOWFLAKE_ACCOUNT"),
-    "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
-    "database": os.getenv("SNOWFLAKE_DATABASE"),
-    "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from snowflake_db import (
+    run_snowflake_query, snowflake_query_to_csv, run_snowflake_queries_async,
+    run_snowflake_query_once, result_page_query, result_count_query, RESULT_ROW_COL,
+)
+from table_snapshot import TableSnapshot, BUCKET_COL
+from filter_spec import FilterSpec, SNOWFLAKE, between, contains, equals, excludes, one_of
+from dimension_options import US_STATES, distinct_values
+from exports import full_csv_download
+
+# Rows per window in the default (windowed) mode
+CACHE_LIMIT = 10_000
+
+# Session state key for the Snowflake query ids in flight for this view
+CSUITES_STATE_KEY = "csuites_inflight_query_ids"
+
+# CSUITES columns and their display names, in display order
+CSUITES_COLUMNS = {
+    "COMPANY": "Brokerage",
+    "FIRST_NAME": "First Name",
+    "LAST_NAME": "Last Name",
+    "TITLE": "Title",
+    "JOB_FUNCTION": "Job Function",
+    "PHONE": "Phone",
+    "EMAIL": "Email",
+    "COMPANY_ADDRESS": "Address",
+    "COMPANY_CITY": "City",
+    "COMPANY_STATE": "State",
+    "COMPANY_POSTAL_CODE": "Zip Code",
+    "COMPANY_PHONE": "Office Phone",
+    "COMPANY_WEBSITE": "Website",
+    "AGENTS_COUNT": "Agent Count",
 }
 
-def connect_snowflake() -> snowflake.connector.SnowflakeConnection:
-    try:
-        conn = snowflake.connector.connect(**SNOWFLAKE)
-        return conn
-    except Exception as e:
-        st.error(f"Failed to connect to Snowflake: {e}")
-        return None
-
 # def get_snowflake_engine():
 #     """Creates and returns a Snowflake SQLAlchemy engine."""
 #     SF_ACCOUNT = os.getenv('SF_ACCOUNT')
@@ -38,132 +50,120 @@ def connect_snowflake() -> snowflake.connector.SnowflakeConnection:
 #     return engine
 
 
-def run_snowflake_query(query, params=None):
-    """Executes a query on Snowflake and returns a DataFrame."""
-    # Normalize any Unicode comparison operators that may sneak in
-    sql = query.replace("≥", ">=").replace("≤", "<=")
-    # Convert SQLAlchemy/colon binds (:name) to pyformat binds (%(name)s)
-    if params:
-        sql = re.sub(r":([A-Za-z_][A-Za-z0-9_]*)", r"%(\1)s", sql)
-    conn = connect_snowflake()
-    if conn is None:
-        st.error("Snowflake connection was not established.")
-        return pd.DataFrame()
-    cur = None
-    try:
-        cur = conn.cursor(DictCursor)
-        if params:
-            cur.execute(sql, params)
-        else:
-            cur.execute(sql)
-        rows = cur.fetchall()
-        # DictCursor returns list[dict] with correct column names
-        df = pd.DataFrame(rows)
-        return df
-    except Exception as e:
-        st.error(f"Error executing query: {e}")
-        st.error(f"SQL Query: {sql}")
-        if params:
-            st.error(f"Parameters: {params}")
-        return pd.DataFrame()
-    finally:
-        try:
-            if cur is not None:
-                cur.close()
-        finally:
-            conn.close()
-
-
-def load_csuites_data(
+def _csuites_filter(
+    name_filter=None, company_filter=None,
+    title_filter=None, job_function_filter=None,
+    city_filter=None, state_filter=None,
+    agents_count_min=None, agents_count_max=None
+):
+    """The C-Suites filters as a FilterSpec over the raw CSUITES columns (Exclude Company is read from session state)."""
+    return FilterSpec.of(
+        contains(["FIRST_NAME", "LAST_NAME"], name_filter),
+        contains("COMPANY", company_filter),
+        # Exclude Company (comma-separated)
+        excludes("COMPANY", st.session_state.get("filter_csuite_exclude_company", "")),
+        contains("TITLE", title_filter),
+        equals("JOB_FUNCTION", job_function_filter),
+        contains("COMPANY_CITY", city_filter),
+        one_of("COMPANY_STATE", state_filter),
+        # Records without an agent count always match the range
+        between("AGENTS_COUNT", agents_count_min, agents_count_max, cap=999999, keep_null=True),
+    )
+
+
+def _csuites_query(
     name_filter=None, company_filter=None,
     title_filter=None, job_function_filter=None,
     city_filter=None, state_filter=None,
     agents_count_min=None, agents_count_max=None,
-    show_all_records=False
+    numbered=False
 ):
-    """Loads all C-Suite data from Snowflake based on filters (no LIMIT/OFFSET)."""
-    where_clauses = []
-    params = {}
-
-    if name_filter:
-        where_clauses.append('(FIRST_NAME ILIKE :name_like OR LAST_NAME ILIKE :name_like)')
-        params['name_like'] = f"%{name_filter}%"
-
-    if company_filter:
-        where_clauses.append('COMPANY ILIKE :company_like')
-        params['company_like'] = f"%{company_filter}%"
-
-    # Exclude Company (comma-separated)
-    exclude_raw = st.session_state.get("filter_csuite_exclude_company", "").strip()
-    if exclude_raw:
-        excludes = [e.strip() for e in exclude_raw.split(",") if e.strip()]
-        for i, excl in enumerate(excludes):
-            where_clauses.append(f'COMPANY NOT ILIKE :exclude_company_{i}')
-            params[f'exclude_company_{i}'] = f"%{excl}%"
-
-    if title_filter:
-        where_clauses.append('TITLE ILIKE :title_like')
-        params['title_like'] = f"%{title_filter}%"
-
-    if job_function_filter:
-        where_clauses.append('JOB_FUNCTION = :job_function')
-        params['job_function'] = job_function_filter
-
-    if city_filter:
-        where_clauses.append('LOWER(COMPANY_CITY) LIKE :city_like')
-        params['city_like'] = f"%{city_filter}%"
-
-    if state_filter:
-        # state_filter is expected to be a list of states
-        placeholders = []
-        for i, state in enumerate(state_filter):
-            key = f"state_{i}"
-            placeholders.append(f":{key}")
-            params[key] = state
-        where_clauses.append(f"COMPANY_STATE IN ({', '.join(placeholders)})")
-
-    if agents_count_min is not None:
-        where_clauses.append('(AGENTS_COUNT >= :agents_count_min OR AGENTS_COUNT IS NULL)')
-        params['agents_count_min'] = agents_count_min
-
-    if agents_count_max is not None and agents_count_max < 999999:
-        where_clauses.append('(AGENTS_COUNT <= :agents_count_max OR AGENTS_COUNT IS NULL)')
-        params['agents_count_max'] = agents_count_max
-
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
-
-    # Always retrieve all rows: no LIMIT clause
-    limit_clause = ""
+    """
+    Builds the unpaginated C-Suites query and its :name params for the given filters.
+
+    With numbered=True the rows are numbered in display order in the hidden RESULT_ROW_COL
+    column instead of being sorted, so windows can be read back with RESULT_SCAN.
+    """
+    where_clause, params = _csuites_filter(
+        name_filter, company_filter, title_filter, job_function_filter,
+        city_filter, state_filter, agents_count_min, agents_count_max
+    ).where(SNOWFLAKE)
+
+    if numbered:
+        row_col = f',\n        ROW_NUMBER() OVER (ORDER BY AGENTS_COUNT DESC NULLS LAST) AS "{RESULT_ROW_COL}"'
+        order_clause = ""
+    else:
+        row_col = ""
+        order_clause = "ORDER BY AGENTS_COUNT DESC NULLS LAST"
+
+    select_list = ",\n        ".join(f'{col} AS "{alias}"' for col, alias in CSUITES_COLUMNS.items())
 
     query = f"""
     SELECT
-        COMPANY AS "Brokerage",
-        FIRST_NAME AS "First Name",
-        LAST_NAME AS "Last Name",
-        TITLE AS "Title",
-        JOB_FUNCTION AS "Job Function",
-        PHONE AS "Phone",
-        EMAIL AS "Email",
-        COMPANY_ADDRESS AS "Address",
-        COMPANY_CITY AS "City",
-        COMPANY_STATE AS "State",
-        COMPANY_POSTAL_CODE AS "Zip Code",
-        COMPANY_PHONE AS "Office Phone",
-        COMPANY_WEBSITE AS "Website",
-        AGENTS_COUNT AS "Agent Count"
+        {select_list}{row_col}
     FROM SCOUT_DW.COMPCURVE.CSUITES
     {where_clause}
-    ORDER BY AGENTS_COUNT DESC NULLS LAST
-    {limit_clause}
+    {order_clause}
     """
 
-    df = run_snowflake_query(query, params=params)
+    return query, params or None
+
+
+def _csuites_result(**filters):
+    """Query id of the stored, numbered C-Suites result for these filters (running it if needed), or None."""
+    return run_snowflake_query_once(CSUITES_STATE_KEY, *_csuites_query(**filters, numbered=True))
+
+
+def load_csuites_page(offset=0, limit=CACHE_LIMIT, **filters):
+    """Loads one window of C-Suite records (rows offset+1 .. offset+limit) for the given filters."""
+    qid = _csuites_result(**filters)
+    if qid is None:
+        return pd.DataFrame()
+    query, params = result_page_query(qid, offset, limit)
+    return run_snowflake_query(query, params=params, cache=True)
+
+
+def load_csuites_data(
+    name_filter=None, company_filter=None,
+    title_filter=None, job_function_filter=None,
+    city_filter=None, state_filter=None,
+    agents_count_min=None, agents_count_max=None
+):
+    """Loads every C-Suite record matching the filters (used when "Show all records" is checked)."""
+    query, params = _csuites_query(
+        name_filter, company_filter, title_filter, job_function_filter,
+        city_filter, state_filter, agents_count_min, agents_count_max
+    )
+    # The full pull is ~70K rows; keep it on disk so restarts don't pay for it again
+    df = run_snowflake_query(query, params=params, persist=True)
     return df
 
 
-# load_all_csuites_data is no longer needed; all logic is in load_csuites_data
+def export_csuites_csv(dest, name_filter=None, company_filter=None,
+                       title_filter=None, job_function_filter=None,
+                       city_filter=None, state_filter=None,
+                       agents_count_min=None, agents_count_max=None):
+    """
+    Writes every C-Suite record matching the filters to `dest` as CSV: from the local snapshot
+    when it is available, otherwise streamed batch by batch from Snowflake.
+    """
+    filtered = filter_csuites_snapshot(
+        name_filter, company_filter, title_filter, job_function_filter,
+        city_filter, state_filter, agents_count_min, agents_count_max
+    )
+    if filtered is not None:
+        try:
+            pa_csv.write_csv(filtered, dest)
+            return True
+        except (OSError, pa.ArrowException) as e:
+            st.error(f"Export error: {e}")
+            print(f"C-Suites CSV export error: {e}")
+            return False
+    query, params = _csuites_query(
+        name_filter, company_filter, title_filter, job_function_filter,
+        city_filter, state_filter, agents_count_min, agents_count_max
+    )
+    return snowflake_query_to_csv(query, params=params, dest=dest)
 
 
 def get_total_csuites_count(name_filter=None, company_filter=None,
@@ -171,56 +171,10 @@ def get_total_csuites_count(name_filter=None, company_filter=None,
                             city_filter=None, state_filter=None,
                             agents_count_min=None, agents_count_max=None):
     """Counts total number of C-Suite records matching the filters."""
-    where_clauses = []
-    params = {}
-
-    if name_filter:
-        where_clauses.append('(FIRST_NAME ILIKE :name_like OR LAST_NAME ILIKE :name_like)')
-        params['name_like'] = f"%{name_filter}%"
-
-    if company_filter:
-        where_clauses.append('COMPANY ILIKE :company_like')
-        params['company_like'] = f"%{company_filter}%"
-
-    # Exclude Company (comma-separated)
-    exclude_raw = st.session_state.get("filter_csuite_exclude_company", "").strip()
-    if exclude_raw:
-        excludes = [e.strip() for e in exclude_raw.split(",") if e.strip()]
-        for i, excl in enumerate(excludes):
-            where_clauses.append(f'COMPANY NOT ILIKE :exclude_company_{i}')
-            params[f'exclude_company_{i}'] = f"%{excl}%"
-
-    if title_filter:
-        where_clauses.append('TITLE ILIKE :title_like')
-        params['title_like'] = f"%{title_filter}%"
-
-    if job_function_filter:
-        where_clauses.append('JOB_FUNCTION = :job_function')
-        params['job_function'] = job_function_filter
-
-    if city_filter:
-        where_clauses.append('LOWER(COMPANY_CITY) LIKE :city_like')
-        params['city_like'] = f"%{city_filter}%"
-
-    if state_filter:
-        placeholders = []
-        for i, state in enumerate(state_filter):
-            key = f"state_{i}"
-            placeholders.append(f":{key}")
-            params[key] = state
-        where_clauses.append(f"COMPANY_STATE IN ({', '.join(placeholders)})")
-
-    if agents_count_min is not None:
-        where_clauses.append('(AGENTS_COUNT >= :agents_count_min OR AGENTS_COUNT IS NULL)')
-        params['agents_count_min'] = agents_count_min
-
-    if agents_count_max is not None and agents_count_max < 999999:
-        where_clauses.append('(AGENTS_COUNT <= :agents_count_max OR AGENTS_COUNT IS NULL)')
-        params['agents_count_max'] = agents_count_max
-
-    where_clause = " AND ".join(where_clauses)
-    if where_clause:
-        where_clause = "WHERE " + where_clause
+    where_clause, params = _csuites_filter(
+        name_filter, company_filter, title_filter, job_function_filter,
+        city_filter, state_filter, agents_count_min, agents_count_max
+    ).where(SNOWFLAKE)
 
     query = f"""
     SELECT COUNT(*) AS "total"
@@ -228,7 +182,11 @@ def get_total_csuites_count(name_filter=None, company_filter=None,
     {where_clause}
     """
 
-    df = run_snowflake_query(query, params=params)
+    return _count_from_df(run_snowflake_query(query, params=params or None, cache=True))
+
+
+def _count_from_df(df):
+    """Reads the single COUNT(*) value out of a count query result."""
     if not df.empty:
         # Prefer exact lowercase alias preserved via quotes
         if 'total' in df.columns:
@@ -246,99 +204,190 @@ def get_total_csuites_count(name_filter=None, company_filter=None,
     return 0
 
 
+@st.cache_resource
+def get_csuites_snapshot():
+    """Process-wide local snapshot of the CSUITES table, kept in display order."""
+    return TableSnapshot(
+        "csuites",
+        "SCOUT_DW.COMPCURVE.CSUITES",
+        list(CSUITES_COLUMNS),
+        order_by=[("AGENTS_COUNT", "descending")],
+    )
+
+
+def filter_csuites_snapshot(
+    name_filter=None, company_filter=None,
+    title_filter=None, job_function_filter=None,
+    city_filter=None, state_filter=None,
+    agents_count_min=None, agents_count_max=None
+):
+    """
+    Applies the filters to the local CSUITES snapshot.
+
+    Returns:
+        pyarrow.Table | None: Matching rows with display column names, in display order, or None
+        if the snapshot is unavailable (callers then query Snowflake).
+    """
+    snapshot = get_csuites_snapshot().get()
+    if snapshot is None:
+        return None
+    expr = _csuites_filter(
+        name_filter, company_filter, title_filter, job_function_filter,
+        city_filter, state_filter, agents_count_min, agents_count_max
+    ).to_arrow()
+    filtered = snapshot if expr is None else snapshot.filter(expr)
+    return filtered.drop_columns([BUCKET_COL]).rename_columns(list(CSUITES_COLUMNS.values()))
+
+
+@st.fragment
+def _csuites_results(csuites_filters, current_filters, show_all_records):
+    """
+    The results table, metrics, export and Load More. Runs as a fragment, so fetching the next
+    window or preparing the export only reruns this part of the page instead of the whole app.
+    """
+    df_csuites = st.session_state.get('csuites_df', pd.DataFrame())
+    total_csuites = st.session_state['csuites_total']
+
+    if not df_csuites.empty:
+        st.dataframe(df_csuites, use_container_width=True, hide_index=True, height=600)
+        source = "the local snapshot" if st.session_state.get('csuites_filtered') is not None else "Snowflake"
+        st.caption(f"Loaded {len(df_csuites):,} records from {source}.")
+
+        col_metric_csuites, col_dl_csuites = st.columns([2, 1])
+        with col_metric_csuites:
+            st.metric("Rows Displayed", f"{len(df_csuites):,}")
+            st.metric("Total Rows Matching Filters", f"{total_csuites:,}")
+            start = 1
+            end = len(df_csuites)
+            st.caption(f"Showing records {start}-{end:,} of {total_csuites:,}")
+
+        with col_dl_csuites:
+            if len(df_csuites) >= total_csuites and total_csuites <= 15000:
+                # Everything matching is already loaded
+                csv_data = df_csuites.to_csv(index=False).encode("utf-8")
+                st.download_button(
+                    label="Export Full Data as CSV",
+                    data=csv_data,
+                    file_name="csuites_view_full.csv",
+                    mime="text/csv",
+                    key="download_csuites_csv"
+                )
+            else:
+                # Only pull every matching row when the user asks for the export; written straight
+                # from the snapshot or Snowflake's Arrow batches
+                full_csv_download(
+                    "csuites", "csuites_view_full.csv", current_filters,
+                    lambda dest: export_csuites_csv(dest, **csuites_filters),
+                    total_csuites
+                )
+
+        # Load More (windowed mode)
+        if len(df_csuites) < total_csuites and not show_all_records:
+            if st.button("Load More", key="load_more_csuites"):
+                filtered = st.session_state.get('csuites_filtered')
+                if filtered is not None:
+                    more = filtered.slice(len(df_csuites), CACHE_LIMIT).to_pandas()
+                else:
+                    with st.spinner("Loading more records..."):
+                        more = load_csuites_page(offset=len(df_csuites), **csuites_filters)
+                if not more.empty:
+                    st.session_state['csuites_df'] = pd.concat([df_csuites, more], ignore_index=True)
+                # Only the results need redrawing; the sidebar and filters haven't changed
+                st.rerun(scope="fragment")
+    else:
+        st.info("No C-Suite records match the current filters.")
+
+
 def csuites_view():
     """Main view for C-Suite data from Snowflake."""
     st.title("C-Suite Executives")
 
     # Filters in sidebar
     with st.sidebar:
-        st.markdown("### Filters")
-
-        st.text_input(
-            "Name",
-            key="filter_csuite_name",
-            placeholder="Search by first or last name..."
-        )
-        st.text_input(
-            "Company",
-            key="filter_csuite_company",
-            placeholder="Search by company..."
-        )
-        st.text_input(
-            "Exclude Company (comma-separated)",
-            key="filter_csuite_exclude_company",
-            placeholder="e.g. Compass, Keller Williams",
-            help="Exclude records where company name matches any value (case-insensitive)."
-        )
-        st.text_input(
-            "Title",
-            key="filter_csuite_title",
-            placeholder="Search by title..."
-        )
-        job_function_options = [
-            "Leadership & Ownership",
-            "Sales & Agent Functions",
-            "Operations & Administration",
-            "Marketing & Lead Generation",
-            "Finance & Back Office",
-            "Technology & Data",
-            "HR & Talent",
-            "Mortgage, Title & Related",
-            "Property & Asset Management",
-            "Coaching & Training",
-            "Support & Client Services"
-        ]
-        job_function_filter = st.selectbox(
-            "Job Function",
-            options=[""] + job_function_options,
-            index=0,
-            key="filter_csuite_job_function"
-        )
-        st.text_input(
-            "City",
-            key="filter_csuite_city",
-            placeholder="Search by city..."
-        )
-        state_options = [
-            'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-            'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-            'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-            'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-            'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
-        ]
-
-        # Ensure defaults are valid
-        saved_state_filter = st.session_state.get("filter_csuite_state", [])
-        valid_default = [s for s in saved_state_filter if s in state_options]
-
-        state_filter = st.multiselect(
-            "State",
-            options=state_options,
-            default=valid_default,
-            key="filter_csuite_state"
-        )
-        show_all_records = st.checkbox("Show all records (70K+)", value=False, key="show_all_records")
-        st.markdown("---")
-        with st.expander("Agent Count Range", expanded=False):
-            agents_col1, agents_col2 = st.columns(2)
-            with agents_col1:
-                agents_count_min = st.number_input(
-                    "Min Agents",
-                    min_value=0,
-                    max_value=1_000_000,
-                    value=st.session_state.get("agents_count_min", 0),
-                    step=1,
-                    key="agents_count_min"
-                )
-            with agents_col2:
-                agents_count_max = st.number_input(
-                    "Max Agents",
-                    min_value=0,
-                    max_value=1_000_000,
-                    value=st.session_state.get("agents_count_max", 1_000_000),
-                    step=1,
-                    key="agents_count_max"
-                )
+        with st.form("csuites_filters_form", border=False):
+            st.markdown("### Filters")
+
+            st.text_input(
+                "Name",
+                key="filter_csuite_name",
+                placeholder="Search by first or last name..."
+            )
+            st.text_input(
+                "Company",
+                key="filter_csuite_company",
+                placeholder="Search by company..."
+            )
+            st.text_input(
+                "Exclude Company (comma-separated)",
+                key="filter_csuite_exclude_company",
+                placeholder="e.g. Compass, Keller Williams",
+                help="Exclude records where company name matches any value (case-insensitive)."
+            )
+            st.text_input(
+                "Title",
+                key="filter_csuite_title",
+                placeholder="Search by title..."
+            )
+            job_function_options = [
+                "Leadership & Ownership",
+                "Sales & Agent Functions",
+                "Operations & Administration",
+                "Marketing & Lead Generation",
+                "Finance & Back Office",
+                "Technology & Data",
+                "HR & Talent",
+                "Mortgage, Title & Related",
+                "Property & Asset Management",
+                "Coaching & Training",
+                "Support & Client Services"
+            ]
+            job_function_filter = st.selectbox(
+                "Job Function",
+                # Live values from the table, falling back to the known list if Snowflake is unreachable
+                options=[""] + (distinct_values("SCOUT_DW.COMPCURVE.CSUITES", "JOB_FUNCTION", SNOWFLAKE) or job_function_options),
+                index=0,
+                key="filter_csuite_job_function"
+            )
+            st.text_input(
+                "City",
+                key="filter_csuite_city",
+                placeholder="Search by city..."
+            )
+
+            # Ensure defaults are valid
+            saved_state_filter = st.session_state.get("filter_csuite_state", [])
+            valid_default = [s for s in saved_state_filter if s in US_STATES]
+
+            state_filter = st.multiselect(
+                "State",
+                options=US_STATES,
+                default=valid_default,
+                key="filter_csuite_state"
+            )
+            show_all_records = st.checkbox("Show all records (70K+)", value=False, key="show_all_records")
+            st.markdown("---")
+            with st.expander("Agent Count Range", expanded=False):
+                agents_col1, agents_col2 = st.columns(2)
+                with agents_col1:
+                    agents_count_min = st.number_input(
+                        "Min Agents",
+                        min_value=0,
+                        max_value=1_000_000,
+                        value=st.session_state.get("agents_count_min", 0),
+                        step=1,
+                        key="agents_count_min"
+                    )
+                with agents_col2:
+                    agents_count_max = st.number_input(
+                        "Max Agents",
+                        min_value=0,
+                        max_value=1_000_000,
+                        value=st.session_state.get("agents_count_max", 1_000_000),
+                        step=1,
+                        key="agents_count_max"
+                    )
+            # One query round per submitted batch of edits, not one per keystroke
+            st.form_submit_button("Apply Filters", use_container_width=True)
 
     # Retrieve filters from session state
     name_filter = st.session_state.get("filter_csuite_name", "").strip()
@@ -353,74 +402,55 @@ def csuites_view():
     agents_count_max = st.session_state.get("agents_count_max", 1_000_000)
     show_all_records = st.session_state.get("show_all_records", False)
 
+    csuites_filters = dict(
+        name_filter=name_filter,
+        company_filter=company_filter,
+        title_filter=title_filter,
+        job_function_filter=job_function_filter,
+        city_filter=city_filter,
+        state_filter=state_filter,
+        agents_count_min=agents_count_min,
+        agents_count_max=agents_count_max,
+    )
+
     # Compose current filters as a dict for comparison
     current_filters = {
-        "name_filter": name_filter,
-        "company_filter": company_filter,
-        "title_filter": title_filter,
-        "job_function_filter": job_function_filter,
-        "city_filter": city_filter,
-        "state_filter": state_filter,
-        "agents_count_min": agents_count_min,
-        "agents_count_max": agents_count_max,
+        **csuites_filters,
+        "exclude_company_filter": st.session_state.get("filter_csuite_exclude_company", "").strip(),
         "show_all_records": show_all_records,
     }
 
-    # Use session state to avoid unnecessary reloads, but always load all filtered data
+    st.session_state.setdefault('csuites_total', 0)
+
+    # Use session state to avoid unnecessary reloads
     if 'csuites_last_filters' not in st.session_state or current_filters != st.session_state['csuites_last_filters']:
-        with st.spinner("Loading C-Suite data..."):
-            df_csuites = load_csuites_data(
-                name_filter=name_filter,
-                company_filter=company_filter,
-                title_filter=title_filter,
-                job_function_filter=job_function_filter,
-                city_filter=city_filter,
-                state_filter=state_filter,
-                agents_count_min=agents_count_min,
-                agents_count_max=agents_count_max,
-                show_all_records=show_all_records
-            )
+        st.session_state.pop('csuites_export_filters', None)
+        # Filter the local snapshot when it is available; the window is sliced from the result
+        filtered = filter_csuites_snapshot(**csuites_filters)
+        st.session_state['csuites_filtered'] = filtered
+        if filtered is not None:
+            total_csuites = filtered.num_rows
+            window = filtered if show_all_records else filtered.slice(0, CACHE_LIMIT)
+            df_csuites = window.to_pandas()
+        elif show_all_records:
+            with st.spinner("Loading all C-Suite records..."):
+                df_csuites = load_csuites_data(**csuites_filters)
+            total_csuites = len(df_csuites)
+        else:
+            with st.spinner("Loading C-Suite data..."):
+                # The filtered, sorted result is computed once in the warehouse; the count and the
+                # first window are read from it side by side.
+                qid = _csuites_result(**csuites_filters)
+                count_df, df_csuites = pd.DataFrame(), pd.DataFrame()
+                if qid is not None:
+                    count_df, df_csuites = run_snowflake_queries_async(
+                        CSUITES_STATE_KEY,
+                        [result_count_query(qid), result_page_query(qid, 0, CACHE_LIMIT)],
+                        cache=True,
+                    )
+            total_csuites = _count_from_df(count_df)
         st.session_state['csuites_df'] = df_csuites
+        st.session_state['csuites_total'] = total_csuites
         st.session_state['csuites_last_filters'] = current_filters.copy()
-    else:
-        df_csuites = st.session_state.get('csuites_df', pd.DataFrame())
-
-    # Calculate total count for metrics
-    total_csuites = len(df_csuites)
-
-    if not df_csuites.empty:
-        st.dataframe(df_csuites, use_container_width=True, hide_index=True, height=8000)
-        st.caption(f"Loaded {len(df_csuites)} records from Snowflake.")
-
-        col_metric_csuites, col_dl_csuites = st.columns([2, 1])
-        with col_metric_csuites:
-            st.metric("Rows Displayed", len(df_csuites))
-            st.metric("Total Rows Matching Filters", total_csuites)
-            start = 1
-            end = len(df_csuites)
-            st.caption(f"Showing records {start}-{end} of {total_csuites}")
 
-        with col_dl_csuites:
-            if total_csuites > 15000:
-                os.makedirs(EXPORT_PATH, exist_ok=True)
-                export_path = os.path.join(EXPORT_PATH, "csuites_view_full.csv")
-                df_csuites.to_csv(export_path, index=False)
-                with open(export_path, "rb") as f:
-                    st.download_button(
-                        label="Download Full CSV",
-                        data=f,
-                        file_name="csuites_view_full.csv",
-                        mime="text/csv",
-                        key="download_csuites_csv_large"
-                    )
-            else:
-                csv_data = df_csuites.to_csv(index=False).encode("utf-8")
-                st.download_button(
-                    label="Export Full Data as CSV",
-                    data=csv_data,
-                    file_name="csuites_view_full.csv",
-                    mime="text/csv",
-                    key="download_csuites_csv"
-                )
-    else:
-        st.info("No C-Suite records match the current filters.")
+    _csuites_results(csuites_filters, current_filters, show_all_records)
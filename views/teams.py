@@ -1,7 +1,12 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from db import run_query  # Assuming db.py is in the same directory or path is configured
+from db import run_query, estimate_count  # Assuming db.py is in the same directory or path is configured
+from pagination import seek_order_by, seek_predicate, seek_select, split_page
+from row_counts import start_count, refresh_count, count_label, watch_count
+from filter_spec import FilterSpec, Raw, between, contains, excludes, one_of
+from dimension_options import US_STATES
+from migrations.brokerage_rollup import brokerage_aggregate
 
 CACHE_LIMIT_TEAMS = 5000  # Number of rows per page for teams
 
@@ -20,6 +25,10 @@ DB_COL_TEAM_PHONE = '"Cell"'
 DB_COL_ZIP = '"Zip"'
 DB_COL_CITY = '"City"' # Added DB column for City
 DB_TABLE_TEAMS = '"z_agents"'  # Assuming the same table for now, adjust if needed
+# One row per team, maintained by migrations/team_rollup.py (refresh with `python -m migrations --refresh`)
+DB_TABLE_TEAM_ROLLUP = "team_rollup"
+# One row per brokerage for "Group results by Brokerage", maintained by migrations/brokerage_rollup.py
+DB_TABLE_BROKERAGE_ROLLUP = "brokerage_rollup"
 
 # --- DataFrame Column Names for Teams ---
 DF_COL_TEAM_NAME = 'Team Name'
@@ -51,77 +60,75 @@ DISPLAY_COL_TEAM_PHONE = 'Team Leader Cell'
 DISPLAY_COL_ZIP = 'Zip'
 DISPLAY_COL_CITY = 'City' # Added Display column for City
 
+# Keyset pagination order for teams: State, then the team id as a unique tiebreaker
+# (served by the (state, team_id) index on team_rollup)
+TEAMS_SORT_KEYS = ["state", "team_id"]
+# Grouped by brokerage: Sales 12 Mo. descending, then the brokerage key
+BROKERAGE_SORT_KEYS = ["sales_12_mo", "brokerage_key"]
 
-def get_total_team_count(states=None):
-    """Calculates the total number of teams matching the filters."""
+
+def _brokerage_source(states=None):
+    """
+    The grouped view's rows: brokerage_rollup, or with a State filter the same aggregate computed
+    over only the selected states' teams, so a brokerage's totals and lists cover just those states.
+
+    Returns:
+        tuple[str, dict]: The FROM source and its params.
+    """
+    state_where, params = FilterSpec.of(one_of("state", states)).where(prefix="s")
+    if not state_where:
+        return DB_TABLE_BROKERAGE_ROLLUP, params
+    return f"({brokerage_aggregate(state_where)}) AS brokerages", params
+
+
+def _brokerage_filter():
+    """The grouped view's brokerage filters (read from session state) on brokerage_rollup columns, as a FilterSpec."""
+    return FilterSpec.of(
+        contains("brokerage", st.session_state.get("filter_brokerage", "")),
+        # Exclude Brokerages (comma-separated)
+        excludes("brokerage", st.session_state.get("filter_exclude_brokerages", "")),
+    )
+
+
+def _teams_filter(states=None):
+    """The Teams sidebar filters (read from session state) on team_rollup columns, as a FilterSpec."""
+    sales12_range = st.session_state.get("filter_sales12")
+    sales12 = None
+    if sales12_range and tuple(sales12_range) != (0, 100):
+        sales12 = between("sales_lastyear", sales12_range[0], sales12_range[1])
+    return FilterSpec.of(
+        one_of("state", states),
+        contains("org", st.session_state.get("filter_brokerage", "")),
+        # Exclude Brokerages (comma-separated)
+        excludes("org", st.session_state.get("filter_exclude_brokerages", "")),
+        contains("team_name", st.session_state.get("filter_team", "")),
+        contains("team_name", st.session_state.get("filter_team_name", "")),
+        sales12,
+        contains("team_lead", st.session_state.get("filter_team_lead_name", "")),
+        # Team Members (Team Size): an index range scan on team_rollup.team_members
+        between(
+            "team_members",
+            st.session_state.get("filter_team_size_min", 0),
+            st.session_state.get("filter_team_size_max", 500)
+        ),
+    )
+
+
+def get_total_team_count(states=None, estimate=False):
+    """
+    Calculates the total number of teams matching the filters.
+    With `estimate=True` returns the planner's estimate instead.
+    """
     if not st.session_state.get('authenticated', False):
         st.error("Authentication required.")
         return 0
 
-    where_clauses = [
-        'lead."Team_role" = \'Lead\'',
-        'lead."Team_encodedZuid" IS NOT NULL'
-    ]
-    params = {}
-
-    # Apply filter for state(s)
-    if states:
-        where_clauses.append('lead."State" IN %(states)s')
-        params['states'] = tuple(states)
-
-    # Additional filter for Brokerage
-    if st.session_state.get("filter_brokerage", "").strip():
-        where_clauses.append('lead."Org" ILIKE %(brokerage)s')
-        params['brokerage'] = f"%{st.session_state.filter_brokerage.strip()}%"
-
-    # Exclude Brokerages (comma-separated)
-    exclude_raw = st.session_state.get("filter_exclude_brokerages", "").strip()
-    if exclude_raw:
-        excludes = [e.strip() for e in exclude_raw.split(",") if e.strip()]
-        for i, excl in enumerate(excludes):
-            where_clauses.append(f'lead."Org" NOT ILIKE %(exclude_brokerage_{i})s')
-            params[f'exclude_brokerage_{i}'] = f"%{excl}%"
-
-    # Additional filter for Team
-    if st.session_state.get("filter_team", "").strip():
-        where_clauses.append('lead."Team" ILIKE %(team)s')
-        params['team'] = f"%{st.session_state.filter_team.strip()}%"
-
-    # Additional filter for Team Name
-    if st.session_state.get("filter_team_name", "").strip():
-        where_clauses.append('lead."Team" ILIKE %(team_name)s')
-        params['team_name'] = f"%{st.session_state.filter_team_name.strip()}%"
-
-    # Additional filter for Sales 12 Mo.
-    if st.session_state.get("filter_sales12"):
-        sales12_range = st.session_state.filter_sales12
-        if sales12_range != (0, 100):
-            where_clauses.append('lead."sales_lastyear" BETWEEN %(sales12_min)s AND %(sales12_max)s')
-            params['sales12_min'] = sales12_range[0]
-            params['sales12_max'] = sales12_range[1]
-
-    # Set params for Team Members (Team Size) filter to be used in HAVING
-    params['team_size_min'] = st.session_state.get("filter_team_size_min", 0)
-    params['team_size_max'] = st.session_state.get("filter_team_size_max", 500)
-
-    # Additional filter for Team Lead Name
-    if st.session_state.get("filter_team_lead_name", "").strip():
-        where_clauses.append('lead."Name" ILIKE %(team_lead_name)s')
-        params['team_lead_name'] = f"%{st.session_state.filter_team_lead_name.strip()}%"
-
-    where_clause = " AND ".join(where_clauses)
+    where_clause, params = _teams_filter(states).where()
+
     query = f"""
     SELECT COUNT(*)
-    FROM (
-        SELECT lead."Team_encodedZuid"
-        FROM {DB_TABLE_TEAMS} AS lead
-        JOIN {DB_TABLE_TEAMS} AS team_records
-            ON lead."Team_encodedZuid" = team_records."Team_encodedZuid"
-        WHERE {where_clause}
-        GROUP BY lead."Team_encodedZuid"
-        HAVING COUNT(team_records."Team_encodedZuid")
-            BETWEEN %(team_size_min)s AND %(team_size_max)s
-    ) t;
+    FROM {DB_TABLE_TEAM_ROLLUP}
+    {where_clause};
     """
 
     print("--- Teams Count Query ---")
@@ -129,8 +136,11 @@ def get_total_team_count(states=None):
     print(f"Params: {params}")
     print("-------------------------")
 
+    if estimate:
+        return estimate_count(query, params)
+
     try:
-        result = run_query(query, params=params)
+        result = run_query(query, params=params, cache=True)
         count = result.iloc[0][0] if not result.empty and result.iloc[0][0] is not None else 0
         print(f"Teams Count Result: {count}")
         return count
@@ -140,90 +150,45 @@ def get_total_team_count(states=None):
         return 0
 
 
-def load_team_data(limit=CACHE_LIMIT_TEAMS, offset=0, states=None):
-    """Loads team data from the database based on filters."""
+def load_team_data(limit=CACHE_LIMIT_TEAMS, after=None, states=None):
+    """
+    Loads one page of team data from the database based on filters.
+
+    Pages are fetched by keyset: pass the cursor returned by pagination.split_page() for the
+    previous page as `after` (None for the first page).
+    """
     if not st.session_state.get('authenticated', False):
         st.error("Authentication required.")
         return pd.DataFrame()
 
-    where_clauses = [
-        'lead."Team_role" = \'Lead\'',
-        'lead."Team_encodedZuid" IS NOT NULL'
-    ]
-    params = {'limit': limit, 'offset': offset}
-
-    # Apply filter for state(s)
-    if states:
-        where_clauses.append('lead."State" IN %(states)s')
-        params['states'] = tuple(states)
-
-    # Additional filter for Brokerage
-    if st.session_state.get("filter_brokerage", "").strip():
-        where_clauses.append('lead."Org" ILIKE %(brokerage)s')
-        params['brokerage'] = f"%{st.session_state.filter_brokerage.strip()}%"
-
-    # Exclude Brokerages (comma-separated)
-    exclude_raw = st.session_state.get("filter_exclude_brokerages", "").strip()
-    if exclude_raw:
-        excludes = [e.strip() for e in exclude_raw.split(",") if e.strip()]
-        for i, excl in enumerate(excludes):
-            where_clauses.append(f'lead."Org" NOT ILIKE %(exclude_brokerage_{i})s')
-            params[f'exclude_brokerage_{i}'] = f"%{excl}%"
-
-    # Additional filter for Team
-    if st.session_state.get("filter_team", "").strip():
-        where_clauses.append('lead."Team" ILIKE %(team)s')
-        params['team'] = f"%{st.session_state.filter_team.strip()}%"
-
-    # Additional filter for Team Name
-    if st.session_state.get("filter_team_name", "").strip():
-        where_clauses.append('lead."Team" ILIKE %(team_name)s')
-        params['team_name'] = f"%{st.session_state.filter_team_name.strip()}%"
-
-    # Additional filter for Sales 12 Mo.
-    if st.session_state.get("filter_sales12"):
-        sales12_range = st.session_state.filter_sales12
-        if sales12_range != (0, 100):
-            where_clauses.append('lead."sales_lastyear" BETWEEN %(sales12_min)s AND %(sales12_max)s')
-            params['sales12_min'] = sales12_range[0]
-            params['sales12_max'] = sales12_range[1]
-
-    # Set params for Team Members (Team Size) filter to be used in HAVING
-    params['team_size_min'] = st.session_state.get("filter_team_size_min", 0)
-    params['team_size_max'] = st.session_state.get("filter_team_size_max", 500)
-
-    # Additional filter for Team Lead Name
-    if st.session_state.get("filter_team_lead_name", "").strip():
-        where_clauses.append('lead."Name" ILIKE %(team_lead_name)s')
-        params['team_lead_name'] = f"%{st.session_state.filter_team_lead_name.strip()}%"
-
-    where_clause = " AND ".join(where_clauses)
+    spec = _teams_filter(states)
+    seek_clause, seek_params = seek_predicate(TEAMS_SORT_KEYS, after)
+    if seek_clause:
+        spec = spec.and_(Raw(seek_clause))
+    where_clause, params = spec.where()
+    params.update(seek_params)
+    params['limit'] = limit
+
     query = f"""
     SELECT
-        lead."Team" AS "{DF_COL_TEAM_NAME}",
-        lead."Name" AS "{DF_COL_TEAM_LEAD}",
-        COUNT(team_records."Team_encodedZuid") AS "{DF_COL_TEAM_MEMBERS_COUNT}",
-        lead."Org" AS "{DF_COL_BROKERAGE}",
-        lead."State" AS "{DF_COL_STATE_TEAMS}",
-        lead."sales" AS "{DF_COL_TOTAL_SALES}",
-        lead."sales_lastyear" AS "{DF_COL_SALES_LASTYEAR_TEAMS}",
-        lead."averageValueThreeYear" AS "{DF_COL_AVG_SALE_TEAMS}",
-        REPLACE(lead."Team_member_name(cut by ^)", '^', '; ') AS "{DF_COL_MEMBERS_LIST}",
-        lead."Email" AS "{DF_COL_TEAM_EMAIL}",
-        lead."Cell" AS "{DF_COL_TEAM_PHONE}",
-        lead."Zip" AS "{DF_COL_ZIP}",
-        lead."City" AS "{DF_COL_CITY}"  -- Added City to the SELECT statement
-    FROM {DB_TABLE_TEAMS} AS lead
-    JOIN {DB_TABLE_TEAMS} AS team_records
-        ON lead."Team_encodedZuid" = team_records."Team_encodedZuid"
-    WHERE {where_clause}
-    GROUP BY lead."Team", lead."Name", lead."Team_encodedZuid", lead."Org", lead."State",
-             lead."sales", lead."sales_lastyear", lead."averageValueThreeYear",
-             lead."Team_member_name(cut by ^)", lead."Email", lead."Cell", lead."Zip", lead."City"
-    HAVING COUNT(team_records."Team_encodedZuid")
-        BETWEEN %(team_size_min)s AND %(team_size_max)s
-    ORDER BY lead."State" ASC
-    LIMIT %(limit)s OFFSET %(offset)s;
+        team_name AS "{DF_COL_TEAM_NAME}",
+        team_lead AS "{DF_COL_TEAM_LEAD}",
+        team_members AS "{DF_COL_TEAM_MEMBERS_COUNT}",
+        org AS "{DF_COL_BROKERAGE}",
+        state AS "{DF_COL_STATE_TEAMS}",
+        sales AS "{DF_COL_TOTAL_SALES}",
+        sales_lastyear AS "{DF_COL_SALES_LASTYEAR_TEAMS}",
+        avg_sale AS "{DF_COL_AVG_SALE_TEAMS}",
+        array_to_string(members, '; ') AS "{DF_COL_MEMBERS_LIST}",
+        email AS "{DF_COL_TEAM_EMAIL}",
+        cell AS "{DF_COL_TEAM_PHONE}",
+        zip AS "{DF_COL_ZIP}",
+        city AS "{DF_COL_CITY}",
+        {seek_select(TEAMS_SORT_KEYS)}
+    FROM {DB_TABLE_TEAM_ROLLUP}
+    {where_clause}
+    {seek_order_by(TEAMS_SORT_KEYS)}
+    LIMIT %(limit)s;
     """
 
     print("--- Teams Data Query ---")
@@ -232,7 +197,7 @@ def load_team_data(limit=CACHE_LIMIT_TEAMS, offset=0, states=None):
     print("------------------------")
 
     try:
-        df = run_query(query, params=params)
+        df = run_query(query, params=params, cache=True)
         print(f"Columns returned by load_team_data: {df.columns.tolist()}")
         if not df.empty:
             print("Raw team data sample (head) from load_team_data:")
@@ -244,112 +209,245 @@ def load_team_data(limit=CACHE_LIMIT_TEAMS, offset=0, states=None):
         return pd.DataFrame()
 
 
-def load_brokerage_data(limit=CACHE_LIMIT_TEAMS, offset=0, states=None):
+def get_total_brokerage_count(states=None, estimate=False):
+    """Counts the brokerages matching the grouped view's filters; with `estimate=True` returns the planner's estimate instead."""
     if not st.session_state.get('authenticated', False):
         st.error("Authentication required.")
-        return pd.DataFrame()
+        return 0
 
-    where_clauses = [
-        'lead."Team_role" = \'Lead\'',
-        'lead."Team_encodedZuid" IS NOT NULL'
-    ]
-    params = {'limit': limit, 'offset': offset}
+    source, params = _brokerage_source(states)
+    where_clause, filter_params = _brokerage_filter().where()
+    params.update(filter_params)
 
-    if states:
-        where_clauses.append('lead."State" IN %(states)s')
-        params['states'] = tuple(states)
+    query = f"""
+    SELECT COUNT(*)
+    FROM {source}
+    {where_clause};
+    """
 
-    if st.session_state.get("filter_brokerage", "").strip():
-        where_clauses.append('lead."Org" ILIKE %(brokerage)s')
-        params['brokerage'] = f"%{st.session_state.filter_brokerage.strip()}%"
+    if estimate:
+        return estimate_count(query, params)
 
-    exclude_raw = st.session_state.get("filter_exclude_brokerages", "").strip()
-    if exclude_raw:
-        excludes = [e.strip() for e in exclude_raw.split(",") if e.strip()]
-        for i, excl in enumerate(excludes):
-            where_clauses.append(f'lead."Org" NOT ILIKE %(exclude_brokerage_{i})s')
-            params[f'exclude_brokerage_{i}'] = f"%{excl}%"
+    result = run_query(query, params=params, cache=True)
+    return result.iloc[0][0] if not result.empty and result.iloc[0][0] is not None else 0
 
-    where_clause = " AND ".join(where_clauses)
+
+def load_brokerage_data(limit=CACHE_LIMIT_TEAMS, after=None, states=None):
+    """
+    Loads one page of brokerage aggregates (highest Sales 12 Mo. first) from brokerage_rollup,
+    aggregated over the selected states' teams only when `states` is set.
+
+    Pages are fetched by keyset: pass the cursor returned by pagination.split_page() for the
+    previous page as `after` (None for the first page).
+    """
+    if not st.session_state.get('authenticated', False):
+        st.error("Authentication required.")
+        return pd.DataFrame()
+
+    source, params = _brokerage_source(states)
+    spec = _brokerage_filter()
+    seek_clause, seek_params = seek_predicate(BROKERAGE_SORT_KEYS, after, descending=True)
+    if seek_clause:
+        spec = spec.and_(Raw(seek_clause))
+    where_clause, filter_params = spec.where()
+    params.update(filter_params)
+    params.update(seek_params)
+    params['limit'] = limit
 
     query = f"""
-    WITH team_rollup AS (
-        SELECT
-            UPPER(TRIM(lead."Org")) AS brokerage_key,
-            MAX(TRIM(lead."Org")) AS brokerage_display,
-            lead."Team_encodedZuid" AS team_id,
-
-            MAX(lead."Name") AS team_lead,
-            COUNT(DISTINCT team_records."Name") AS team_members,
-
-            lead."State" AS state,
-            lead."City" AS city,
-            lead."Zip" AS zip,
-
-            MAX(lead."sales") AS total_sales,
-            MAX(lead."sales_lastyear") AS sales_12_mo,
-            MAX(lead."averageValueThreeYear") AS avg_sale,
-
-            team_records."Name" AS member_name,
-            MAX(lead."Email") AS team_lead_email
-        FROM {DB_TABLE_TEAMS} AS lead
-        JOIN {DB_TABLE_TEAMS} AS team_records
-            ON lead."Team_encodedZuid" = team_records."Team_encodedZuid"
-        WHERE {where_clause}
-        GROUP BY
-            UPPER(TRIM(lead."Org")),
-            lead."Team_encodedZuid",
-            lead."State",
-            lead."City",
-            lead."Zip",
-            team_records."Name"
-    )
     SELECT
-        MAX(brokerage_display) AS "Brokerage",
-        COUNT(DISTINCT team_id) AS "Teams",
-        STRING_AGG(DISTINCT team_lead, ', ') AS "Team Leads",
-        STRING_AGG(DISTINCT team_lead_email, ', ') AS "Team Lead Emails",
-        COUNT(DISTINCT member_name) AS "Team Members",
-
-        STRING_AGG(DISTINCT state, ', ') AS "States",
-        STRING_AGG(DISTINCT city, ', ') AS "Cities",
-        STRING_AGG(DISTINCT zip, ', ') AS "Zips",
-
-        SUM(DISTINCT total_sales) AS "Total Sales",
-        SUM(DISTINCT sales_12_mo) AS "Sales 12 Mo.",
-        AVG(DISTINCT avg_sale) AS "Avg. Sale",
-
-        STRING_AGG(DISTINCT member_name, ', ') AS "All Members"
-    FROM team_rollup
-    GROUP BY brokerage_key
-    ORDER BY "Sales 12 Mo." DESC NULLS LAST
-    LIMIT %(limit)s OFFSET %(offset)s;
+        brokerage AS "Brokerage",
+        teams AS "Teams",
+        team_leads AS "Team Leads",
+        team_lead_emails AS "Team Lead Emails",
+        team_members AS "Team Members",
+        states AS "States",
+        cities AS "Cities",
+        zips AS "Zips",
+        total_sales AS "Total Sales",
+        sales_12_mo AS "Sales 12 Mo.",
+        avg_sale AS "Avg. Sale",
+        members AS "All Members",
+        {seek_select(BROKERAGE_SORT_KEYS)}
+    FROM {source}
+    {where_clause}
+    {seek_order_by(BROKERAGE_SORT_KEYS, descending=True)}
+    LIMIT %(limit)s;
     """
 
     try:
-        df = run_query(query, params=params)
+        df = run_query(query, params=params, cache=True)
         return df
     except Exception as e:
         st.error(f"SQL Error loading brokerage data: {e}")
         return pd.DataFrame()
 
 
+@st.fragment
+def _teams_results():
+    """
+    The results table, metrics, export and Load More. Runs as a fragment, so fetching the next
+    page only reruns this part of the page instead of the whole app.
+    """
+    # --- Display Team Data ---
+    current_team_data = st.session_state.get('filtered_teams_data', pd.DataFrame())
+
+    # Row counters for caption / metrics
+    start_row_teams = 1
+    end_row_teams = len(current_team_data)
+
+    if not current_team_data.empty:
+        df_teams_display = current_team_data.copy()
+
+        # Decide view FIRST
+        is_grouped = st.session_state.get("group_by_brokerage")
+
+        if is_grouped:
+            # --- Brokerage Aggregated View ---
+            display_cols = [
+                "Brokerage",
+                "Teams",
+                "Team Members",
+                "Total Sales",
+                "Sales 12 Mo.",
+                "Avg. Sale",
+                "Team Leads",
+                "Team Lead Emails",
+                "States",
+                "Cities",
+                "Zips",
+                "All Members"
+            ]
+            display_cols = [c for c in display_cols if c in df_teams_display.columns]
+
+            # Format numeric fields (currency vs counts)
+            if "Total Sales" in df_teams_display.columns:
+                df_teams_display["Total Sales"] = df_teams_display["Total Sales"].apply(
+                    lambda x: f"${x:,.0f}" if pd.notna(x) else ""
+                )
+
+            if "Avg. Sale" in df_teams_display.columns:
+                df_teams_display["Avg. Sale"] = df_teams_display["Avg. Sale"].apply(
+                    lambda x: f"${x:,.0f}" if pd.notna(x) else ""
+                )
+
+            if "Sales 12 Mo." in df_teams_display.columns:
+                df_teams_display["Sales 12 Mo."] = df_teams_display["Sales 12 Mo."].apply(
+                    lambda x: f"{int(x):,}" if pd.notna(x) else ""
+                )
+
+            # Flatten arrays for display
+            for col in ["Team Leads", "Team Lead Emails", "States", "Cities", "Zips", "All Members"]:
+                if col in df_teams_display.columns:
+                    df_teams_display[col] = df_teams_display[col].apply(
+                        lambda x: ", ".join(sorted(set(x))) if isinstance(x, list) else x
+                    )
+
+        else:
+            # --- Standard Team View ---
+            display_cols = [
+                DISPLAY_COL_TEAM_NAME,
+                DISPLAY_COL_TEAM_LEAD,
+                DISPLAY_COL_TEAM_MEMBERS_COUNT,
+                DISPLAY_COL_BROKERAGE,
+                DISPLAY_COL_STATE_TEAMS,
+                DISPLAY_COL_CITY,
+                DISPLAY_COL_ZIP,
+                DISPLAY_COL_TOTAL_SALES,
+                DISPLAY_COL_SALES_LASTYEAR_TEAMS,
+                DISPLAY_COL_AVG_SALE_TEAMS,
+                DISPLAY_COL_MEMBERS_LIST,
+                DISPLAY_COL_TEAM_EMAIL,
+                DISPLAY_COL_TEAM_PHONE
+            ]
+            display_cols = [c for c in display_cols if c in df_teams_display.columns]
+
+            # Format numeric fields
+            if DISPLAY_COL_TOTAL_SALES in df_teams_display.columns:
+                df_teams_display[DISPLAY_COL_TOTAL_SALES] = df_teams_display[DISPLAY_COL_TOTAL_SALES].apply(
+                    lambda x: f"{x:,.0f}" if pd.notna(x) else ""
+                )
+            if DISPLAY_COL_SALES_LASTYEAR_TEAMS in df_teams_display.columns:
+                df_teams_display[DISPLAY_COL_SALES_LASTYEAR_TEAMS] = df_teams_display[DISPLAY_COL_SALES_LASTYEAR_TEAMS].apply(
+                    lambda x: f"{x:,.0f}" if pd.notna(x) else ""
+                )
+            if DISPLAY_COL_AVG_SALE_TEAMS in df_teams_display.columns:
+                df_teams_display[DISPLAY_COL_AVG_SALE_TEAMS] = df_teams_display[DISPLAY_COL_AVG_SALE_TEAMS].apply(
+                    lambda x: f"${x:,.0f}" if pd.notna(x) else ""
+                )
+
+        # Render DataFrame
+        if display_cols:
+            st.dataframe(
+                df_teams_display[display_cols],
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.error("No valid columns available to display.")
+        # --- Metrics and Download for Teams ---
+        unit = "brokerages" if is_grouped else "teams"
+        col_metric_teams, col_dl_teams = st.columns([2, 1])
+        with col_metric_teams:
+            st.metric(f"{unit.capitalize()} Displayed", len(df_teams_display))
+            total_teams_label = count_label('total_teams')
+            st.metric(f"Total {unit.capitalize()} Matching Filters", total_teams_label)
+            st.caption(f"Showing {unit} {start_row_teams}-{end_row_teams} of {total_teams_label}")
+            watch_count('total_teams')
+        with col_dl_teams:
+            csv_data_teams = df_teams_display[display_cols].to_csv(index=False).encode('utf-8')
+            st.download_button(
+                label="Export Displayed Teams as CSV",
+                data=csv_data_teams,
+                file_name="filtered_teams_view.csv",
+                mime="text/csv",
+                key='download_teams_csv'
+            )
+
+        # --- Pagination for Teams (or brokerages, when grouped) ---
+        if len(st.session_state.filtered_teams_data) < st.session_state.total_teams:
+            if st.button("Load More", key="load_more_teams"):
+                print(f"\n--- Loading More {unit.capitalize()} ---")
+                loader = load_brokerage_data if is_grouped else load_team_data
+                with st.spinner(f"Loading more {unit} data..."):
+                    new_team_data = loader(
+                        CACHE_LIMIT_TEAMS,
+                        st.session_state.get('teams_cursor'),
+                        st.session_state.selected_states_teams
+                    )
+                new_team_data, next_cursor = split_page(new_team_data)
+                if not new_team_data.empty:
+                    st.session_state.teams_cursor = next_cursor
+                    st.session_state.filtered_teams_data = pd.concat(
+                        [st.session_state.filtered_teams_data, new_team_data], ignore_index=True
+                    )
+                    st.session_state.teams_offset += CACHE_LIMIT_TEAMS
+                    print("---------------------------\n")
+                else:
+                    st.warning(f"No more {unit} data found.")
+                    print(f"Load More {unit} returned empty DataFrame unexpectedly.")
+                # Only the results need redrawing; the sidebar and filters haven't changed
+                st.rerun(scope="fragment")
+        elif refresh_count('total_teams') and st.session_state.total_teams > 0:
+            st.success(f"All matching {unit} data loaded.")
+
+    # --- Handle No Data Scenarios for Teams ---
+    elif st.session_state.total_teams == 0 and st.session_state.get('teams_filters_applied', False):
+        st.info("No teams match the current filters.")
+    else:
+        st.info("Apply filters using the sidebar to load team data.")
+
+
 def teams_view():
     """Displays the Teams data view with filtering and pagination."""
     st.title("Teams View")
 
-    us_states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-                  'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-                  'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-                  'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-                  'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
-
     # Initialize session state variables safely for teams view.
     st.session_state.setdefault('teams_offset', 0)
+    st.session_state.setdefault('teams_cursor', None)
     st.session_state.setdefault('filtered_teams_data', pd.DataFrame())
     st.session_state.setdefault('total_teams', 0)
     st.session_state.setdefault('teams_filters_applied', False)
-    st.session_state.setdefault('load_more_requested', False)
     st.session_state.setdefault('teams_last_filters', {})
 
     if st.session_state.get('authenticated', False):
@@ -357,13 +455,6 @@ def teams_view():
         with st.sidebar:
             st.header("Filter Teams by Location")
 
-            st.session_state.selected_states_teams = st.multiselect(
-                "State",
-                options=us_states,
-                default=[],
-                placeholder="Choose options"
-            )
-
             # --- Group by Brokerage toggle ---
             group_by_brokerage = st.toggle(
                 "Group results by Brokerage",
@@ -390,65 +481,72 @@ def teams_view():
                 st.session_state.clear_states_teams_inline = False
                 st.rerun()
 
-            # New filters for Brokerage, Sales 12 Mo., and Team Size
-            st.text_input("Brokerage", key="filter_brokerage")
-            st.text_input(
-                "Exclude Brokerages (comma-separated)",
-                key="filter_exclude_brokerages",
-                help="Exclude teams where brokerage name matches any value (case-insensitive)."
-            )
-            st.slider("Sales 12 Mo.", min_value=0, max_value=100, value=(0, 100), step=1, key="filter_sales12")
-            st.number_input(
-                "Min Team Size",
-                min_value=0,
-                max_value=500,
-                value=st.session_state.get("filter_team_size_min", 0),
-                step=1,
-                key="filter_team_size_min"
-            )
-            st.number_input(
-                "Max Team Size",
-                min_value=0,
-                max_value=500,
-                value=st.session_state.get("filter_team_size_max", 500),
-                step=1,
-                key="filter_team_size_max"
-            )
+            # One query round per submitted batch of edits, not one per keystroke
+            with st.form("teams_filters_form", border=False):
+                st.session_state.selected_states_teams = st.multiselect(
+                    "State",
+                    options=US_STATES,
+                    default=[],
+                    placeholder="Choose options"
+                )
+
+                # New filters for Brokerage, Sales 12 Mo., and Team Size
+                st.text_input("Brokerage", key="filter_brokerage")
+                st.text_input(
+                    "Exclude Brokerages (comma-separated)",
+                    key="filter_exclude_brokerages",
+                    help="Exclude teams where brokerage name matches any value (case-insensitive)."
+                )
+                st.slider("Sales 12 Mo.", min_value=0, max_value=100, value=(0, 100), step=1, key="filter_sales12")
+                st.number_input(
+                    "Min Team Size",
+                    min_value=0,
+                    max_value=500,
+                    value=st.session_state.get("filter_team_size_min", 0),
+                    step=1,
+                    key="filter_team_size_min"
+                )
+                st.number_input(
+                    "Max Team Size",
+                    min_value=0,
+                    max_value=500,
+                    value=st.session_state.get("filter_team_size_max", 500),
+                    step=1,
+                    key="filter_team_size_max"
+                )
+
+                # Team Name filter
+                st.text_input("Team Name", key="filter_team_name")
+                # Team Lead Name filter
+                st.text_input("Team Lead Name", key="filter_team_lead_name")
+
+                apply_filters_btn = st.form_submit_button("Apply Filters", key="apply_filters_btn")
 
-            # Team Name filter
-            st.text_input("Team Name", key="filter_team_name")
-            # Team Lead Name filter
-            st.text_input("Team Lead Name", key="filter_team_lead_name")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                apply_filters_btn = st.button("Apply Filters", key="apply_filters_btn")
-            with col2:
-                if st.button("Clear Filters", key="clear_filters"):
-                    st.session_state.selected_states_teams = []
-                    # Remove widget keys from session_state to clear their values
-                    if "filter_brokerage" in st.session_state:
-                        del st.session_state["filter_brokerage"]
-                    if "filter_team" in st.session_state:
-                        del st.session_state["filter_team"]
-                    if "filter_team_name" in st.session_state:
-                        del st.session_state["filter_team_name"]
-                    if "filter_team_lead_name" in st.session_state:
-                        del st.session_state["filter_team_lead_name"]
-                    if "filter_sales12" in st.session_state:
-                        del st.session_state["filter_sales12"]
-                    if "filter_team_size_min" in st.session_state:
-                        del st.session_state["filter_team_size_min"]
-                    if "filter_team_size_max" in st.session_state:
-                        del st.session_state["filter_team_size_max"]
-                    if "filter_exclude_brokerages" in st.session_state:
-                        del st.session_state["filter_exclude_brokerages"]
-                    st.session_state.teams_filters_applied = False
-                    st.session_state.teams_offset = 0
-                    st.session_state.filtered_teams_data = pd.DataFrame()
-                    st.rerun()
-
-        # --- Auto-detect filter changes and reset so data reloads ---
+            if st.button("Clear Filters", key="clear_filters"):
+                st.session_state.selected_states_teams = []
+                # Remove widget keys from session_state to clear their values
+                if "filter_brokerage" in st.session_state:
+                    del st.session_state["filter_brokerage"]
+                if "filter_team" in st.session_state:
+                    del st.session_state["filter_team"]
+                if "filter_team_name" in st.session_state:
+                    del st.session_state["filter_team_name"]
+                if "filter_team_lead_name" in st.session_state:
+                    del st.session_state["filter_team_lead_name"]
+                if "filter_sales12" in st.session_state:
+                    del st.session_state["filter_sales12"]
+                if "filter_team_size_min" in st.session_state:
+                    del st.session_state["filter_team_size_min"]
+                if "filter_team_size_max" in st.session_state:
+                    del st.session_state["filter_team_size_max"]
+                if "filter_exclude_brokerages" in st.session_state:
+                    del st.session_state["filter_exclude_brokerages"]
+                st.session_state.teams_filters_applied = False
+                st.session_state.teams_offset = 0
+                st.session_state.filtered_teams_data = pd.DataFrame()
+                st.rerun()
+
+        # --- Detect submitted filter changes and reset so data reloads ---
         current_filters_snapshot = {
             "states":        tuple(st.session_state.get("selected_states_teams", [])),
             "brokerage":     st.session_state.get("filter_brokerage", "").strip(),
@@ -471,180 +569,22 @@ def teams_view():
             st.session_state.teams_offset = 0
             st.session_state.teams_filters_applied = True
             print("\n--- Applying Team Filters ---")
-            with st.spinner("Calculating totals..."):
+            with st.spinner("Loading team data..."):
+                # --- Conditional data loader based on grouping ---
+                # Estimated total now, exact COUNT(*) in the background
+                selected_states = st.session_state.selected_states_teams
                 if st.session_state.get("group_by_brokerage"):
-                    st.session_state.total_teams = None
+                    start_count('total_teams', get_total_brokerage_count, selected_states)
+                    first_page = load_brokerage_data(CACHE_LIMIT_TEAMS, None, selected_states)
                 else:
-                    st.session_state.total_teams = get_total_team_count(st.session_state.selected_states_teams)
-            if (st.session_state.total_teams and st.session_state.total_teams > 0) or st.session_state.get("group_by_brokerage"):
-                with st.spinner("Loading team data..."):
-                    # --- Conditional data loader based on grouping ---
-                    if st.session_state.get("group_by_brokerage"):
-                        st.session_state.filtered_teams_data = load_brokerage_data(
-                            CACHE_LIMIT_TEAMS,
-                            0,
-                            st.session_state.selected_states_teams
-                        )
-                    else:
-                        st.session_state.filtered_teams_data = load_team_data(
-                            CACHE_LIMIT_TEAMS,
-                            0,
-                            st.session_state.selected_states_teams
-                        )
-            else:
-                st.session_state.filtered_teams_data = pd.DataFrame()
+                    start_count('total_teams', get_total_team_count, selected_states)
+                    first_page = load_team_data(CACHE_LIMIT_TEAMS, None, selected_states)
+                first_page, st.session_state.teams_cursor = split_page(first_page)
+                st.session_state.filtered_teams_data = first_page
             print("-----------------------------\n")
             if apply_filters_btn:
                 st.rerun()
 
-        # --- Display Team Data ---
-        current_team_data = st.session_state.get('filtered_teams_data', pd.DataFrame())
-
-        # Row counters for caption / metrics
-        start_row_teams = 1
-        end_row_teams = len(current_team_data)
-
-        if not current_team_data.empty:
-            df_teams_display = current_team_data.copy()
-
-            # Decide view FIRST
-            is_grouped = st.session_state.get("group_by_brokerage")
-
-            if is_grouped:
-                # --- Brokerage Aggregated View ---
-                display_cols = [
-                    "Brokerage",
-                    "Teams",
-                    "Team Members",
-                    "Total Sales",
-                    "Sales 12 Mo.",
-                    "Avg. Sale",
-                    "Team Leads",
-                    "Team Lead Emails",
-                    "States",
-                    "Cities",
-                    "Zips",
-                    "All Members"
-                ]
-                display_cols = [c for c in display_cols if c in df_teams_display.columns]
-
-                # Format numeric fields (currency vs counts)
-                if "Total Sales" in df_teams_display.columns:
-                    df_teams_display["Total Sales"] = df_teams_display["Total Sales"].apply(
-                        lambda x: f"${x:,.0f}" if pd.notna(x) else ""
-                    )
-
-                if "Avg. Sale" in df_teams_display.columns:
-                    df_teams_display["Avg. Sale"] = df_teams_display["Avg. Sale"].apply(
-                        lambda x: f"${x:,.0f}" if pd.notna(x) else ""
-                    )
-
-                if "Sales 12 Mo." in df_teams_display.columns:
-                    df_teams_display["Sales 12 Mo."] = df_teams_display["Sales 12 Mo."].apply(
-                        lambda x: f"{int(x):,}" if pd.notna(x) else ""
-                    )
-
-                # Flatten arrays for display
-                for col in ["Team Leads", "States", "Cities", "Zips", "All Members"]:
-                    if col in df_teams_display.columns:
-                        df_teams_display[col] = df_teams_display[col].apply(
-                            lambda x: ", ".join(sorted(set(x))) if isinstance(x, list) else x
-                        )
-
-            else:
-                # --- Standard Team View ---
-                display_cols = [
-                    DISPLAY_COL_TEAM_NAME,
-                    DISPLAY_COL_TEAM_LEAD,
-                    DISPLAY_COL_TEAM_MEMBERS_COUNT,
-                    DISPLAY_COL_BROKERAGE,
-                    DISPLAY_COL_STATE_TEAMS,
-                    DISPLAY_COL_CITY,
-                    DISPLAY_COL_ZIP,
-                    DISPLAY_COL_TOTAL_SALES,
-                    DISPLAY_COL_SALES_LASTYEAR_TEAMS,
-                    DISPLAY_COL_AVG_SALE_TEAMS,
-                    DISPLAY_COL_MEMBERS_LIST,
-                    DISPLAY_COL_TEAM_EMAIL,
-                    DISPLAY_COL_TEAM_PHONE
-                ]
-                display_cols = [c for c in display_cols if c in df_teams_display.columns]
-
-                # Format numeric fields
-                if DISPLAY_COL_TOTAL_SALES in df_teams_display.columns:
-                    df_teams_display[DISPLAY_COL_TOTAL_SALES] = df_teams_display[DISPLAY_COL_TOTAL_SALES].apply(
-                        lambda x: f"{x:,.0f}" if pd.notna(x) else ""
-                    )
-                if DISPLAY_COL_SALES_LASTYEAR_TEAMS in df_teams_display.columns:
-                    df_teams_display[DISPLAY_COL_SALES_LASTYEAR_TEAMS] = df_teams_display[DISPLAY_COL_SALES_LASTYEAR_TEAMS].apply(
-                        lambda x: f"{x:,.0f}" if pd.notna(x) else ""
-                    )
-                if DISPLAY_COL_AVG_SALE_TEAMS in df_teams_display.columns:
-                    df_teams_display[DISPLAY_COL_AVG_SALE_TEAMS] = df_teams_display[DISPLAY_COL_AVG_SALE_TEAMS].apply(
-                        lambda x: f"${x:,.0f}" if pd.notna(x) else ""
-                    )
-
-            # Render DataFrame
-            if display_cols:
-                st.dataframe(
-                    df_teams_display[display_cols],
-                    use_container_width=True,
-                    hide_index=True
-                )
-            else:
-                st.error("No valid columns available to display.")
-            # --- Metrics and Download for Teams ---
-            col_metric_teams, col_dl_teams = st.columns([2, 1])
-            with col_metric_teams:
-                if st.session_state.get("group_by_brokerage"):
-                    st.metric("Brokerages Displayed", len(df_teams_display))
-                else:
-                    st.metric("Teams Displayed", len(df_teams_display))
-                st.metric("Total Teams Matching Filters", st.session_state.total_teams)
-                st.caption(f"Showing teams {start_row_teams}-{end_row_teams} of {st.session_state.total_teams}")
-            with col_dl_teams:
-                csv_data_teams = df_teams_display[display_cols].to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="Export Displayed Teams as CSV",
-                    data=csv_data_teams,
-                    file_name="filtered_teams_view.csv",
-                    mime="text/csv",
-                    key='download_teams_csv'
-                )
-
-            # --- Pagination for Teams ---
-            if not st.session_state.get("group_by_brokerage"):
-                if len(st.session_state.filtered_teams_data) < st.session_state.total_teams:
-                    if st.button("Load More", key="load_more_teams"):
-                        st.session_state.load_more_requested = True
-
-                # --- Handle Load More Logic AFTER button and BEFORE next data display ---
-                if st.session_state.get('load_more_requested', False):
-                    print("\n--- Loading More Teams ---")
-                    with st.spinner("Loading more team data..."):
-                        new_team_data = load_team_data(
-                            CACHE_LIMIT_TEAMS,
-                            st.session_state.teams_offset,
-                            st.session_state.selected_states_teams
-                        )
-                    if not new_team_data.empty:
-                        st.session_state.filtered_teams_data = pd.concat(
-                            [st.session_state.filtered_teams_data, new_team_data], ignore_index=True
-                        )
-                        st.session_state.teams_offset += CACHE_LIMIT_TEAMS
-                        print("---------------------------\n")
-                    else:
-                        st.warning("No more team data found.")
-                        print("Load More teams returned empty DataFrame unexpectedly.")
-                    st.session_state.load_more_requested = False
-                    st.rerun()
-                elif st.session_state.total_teams > 0 and not current_team_data.empty:
-                    st.success("All matching team data loaded.")
-
-        # --- Handle No Data Scenarios for Teams ---
-        elif st.session_state.total_teams == 0 and st.session_state.get('teams_filters_applied', False):
-            st.info("No teams match the current filters.")
-        else:
-            st.info("Apply filters using the sidebar to load team data.")
+        _teams_results()
     else:
         st.info("Please log in to view team data.")
@@ -1,23 +1,72 @@
 import streamlit as st
-from db import run_query
+from db import run_query, copy_query_to_csv, estimate_count
 import pandas as pd
 from datetime import datetime, timedelta
-import os
-from config import EXPORT_PATH
+from pagination import ROW_ID, seek_order_by, seek_predicate, seek_select, split_page
+from row_counts import start_count, reset_count, count_label, watch_count
+from filter_spec import FilterSpec, Raw, SEARCH_RANK_PARAM, between, contains, one_of, search, search_rank
+from dimension_options import US_STATES
+from exports import full_csv_download
 
 CACHE_LIMIT_TRANSACTIONS = 5000  # Set your desired page size
 
-us_states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY',
-             'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND',
-             'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+# Keyset pagination order: newest listings first, row key as a unique tiebreaker
+# (served by the transactions_2_keyset_idx expression index, see migrations/row_keys.py)
+TRANSACTIONS_SORT_KEYS = ["COALESCE(list_date, DATE '0001-01-01')", ROW_ID]
+# While searching, best match first instead
+TRANSACTIONS_SEARCH_SORT_KEYS = [search_rank(), ROW_ID]
+
 all_statuses = ["Pending", "Active", "Sold"]
 today = datetime.now().date()
 
 
-@st.cache_data(ttl=600)
-def load_transactions_data(limit=CACHE_LIMIT_TRANSACTIONS, offset=0, date_range=None, states=None, statuses=None,
-                           price_min=None, price_max=None, agent_first=None, agent_last=None, brokerage=None):
-    query = """
+def _transactions_filter(date_range=None, states=None, statuses=None, price_min=None, price_max=None,
+                         agent_first=None, agent_last=None, brokerage=None, search_text=None):
+    """The transactions_2 filters as a FilterSpec."""
+    start, end = date_range if date_range else (None, None)
+    return FilterSpec.of(
+        search(search_text),
+        between("list_date", start, end),
+        one_of("state", states),
+        one_of("status", statuses),
+        between("price", price_min, price_max),
+        contains("presented_by_first_name", agent_first),
+        contains("presented_by_last_name", agent_last),
+        contains("brokered_by", brokerage),
+    )
+
+
+def _transactions_query(date_range=None, states=None, statuses=None, price_min=None, price_max=None,
+                        agent_first=None, agent_last=None, brokerage=None, page_limit=None, after=None,
+                        search_text=None):
+    """
+    Builds the transactions query and its params for the given filters.
+
+    With `page_limit` set, the query returns one keyset page (rows after the cursor `after`)
+    including the hidden seek columns; otherwise it returns every matching row. With
+    `search_text`, pages are ordered by search relevance instead of by list date.
+    """
+    spec = _transactions_filter(date_range, states, statuses, price_min, price_max, agent_first, agent_last, brokerage,
+                                search_text)
+    seek_params = {}
+    seek_columns = ""
+    page_clause = ""
+    if page_limit is not None:
+        search_predicate = search(search_text)
+        sort_keys = TRANSACTIONS_SEARCH_SORT_KEYS if search_predicate else TRANSACTIONS_SORT_KEYS
+        seek_clause, seek_params = seek_predicate(sort_keys, after, descending=True)
+        if seek_clause:
+            spec = spec.and_(Raw(seek_clause))
+        seek_columns = f",\n      {seek_select(sort_keys)}"
+        page_clause = f"{seek_order_by(sort_keys, descending=True)}\n    LIMIT %(limit)s"
+        seek_params['limit'] = page_limit
+        if search_predicate:
+            seek_params[SEARCH_RANK_PARAM] = search_predicate.text
+
+    where_clause, params = spec.where()
+    params.update(seek_params)
+
+    query = f"""
     SELECT
       email AS "Email",
       presented_by_first_name AS "Agent First",
@@ -34,109 +83,57 @@ def load_transactions_data(limit=CACHE_LIMIT_TRANSACTIONS, offset=0, date_range=
       square_feet AS "SQFT",
       presented_by_mobile AS "Phone",
       listing_agent_id AS "Agent MLS ID",
-      listing_office_id AS "Office ID"
+      listing_office_id AS "Office ID"{seek_columns}
     FROM transactions_2
-    WHERE 1=1
+    {where_clause}
+    {page_clause}
     """
-    params_list = []
-    where_clauses = []
-
-    if date_range:
-        where_clauses.append("list_date >= %s AND list_date <= %s")
-        params_list.extend(date_range)
-
-    if states:
-        where_clauses.append("state IN %s")
-        params_list.append(tuple(states))
-
-    if statuses and len(statuses) > 0:
-        where_clauses.append("status IN %s")
-        params_list.append(tuple(statuses))
+    return query, params
 
-    if price_min is not None:
-        where_clauses.append("price >= %s")
-        params_list.append(price_min)
 
-    if price_max is not None:
-        where_clauses.append("price <= %s")
-        params_list.append(price_max)
-
-    if agent_first:
-        where_clauses.append("LOWER(presented_by_first_name) LIKE %s")
-        params_list.append(f"%{agent_first.lower()}%")
-
-    if agent_last:
-        where_clauses.append("LOWER(presented_by_last_name) LIKE %s")
-        params_list.append(f"%{agent_last.lower()}%")
-
-    if brokerage:
-        where_clauses.append("LOWER(brokered_by) LIKE %s")
-        params_list.append(f"%{brokerage.lower()}%")
-
-    if where_clauses:
-        query += " AND " + " AND ".join(where_clauses)
-
-    query += " LIMIT %s OFFSET %s;"
-    params_list.append(limit)
-    params_list.append(offset)
+def load_transactions_data(limit=CACHE_LIMIT_TRANSACTIONS, after=None, date_range=None, states=None, statuses=None,
+                           price_min=None, price_max=None, agent_first=None, agent_last=None, brokerage=None,
+                           search_text=None):
+    """Loads one keyset page of transactions (rows after the cursor `after`) based on filters."""
+    query, params = _transactions_query(date_range, states, statuses, price_min, price_max,
+                                        agent_first, agent_last, brokerage, page_limit=limit, after=after,
+                                        search_text=search_text)
 
     print("\n[DEBUG] Transactions Query:")
     print(query)
     print("[DEBUG] Params:")
-    print(params_list)
+    print(params)
 
-    return run_query(query, params=tuple(params_list))
+    # Arrow path: Price/List Date arrive as typed columns, no string re-parsing needed
+    return run_query(query, params=params, dtype_backend="pyarrow", cache=True)
 
 
-def get_total_matching_rows(date_range=None, states=None, statuses=None, price_min=None, price_max=None,
-                            agent_first=None, agent_last=None, brokerage=None):
-    query = """
-    SELECT COUNT(*) FROM transactions_2 WHERE 1=1
-    """
-    params_list = []
-    where_clauses = []
+def export_transactions_csv(dest, date_range=None, states=None, statuses=None, price_min=None, price_max=None,
+                            agent_first=None, agent_last=None, brokerage=None, search_text=None):
+    """Writes every transaction matching the filters to `dest` as CSV via COPY, skipping pandas entirely."""
+    query, params = _transactions_query(date_range, states, statuses, price_min, price_max,
+                                        agent_first, agent_last, brokerage, search_text=search_text)
+    return copy_query_to_csv(query, params=params, dest=dest)
 
-    if date_range:
-        where_clauses.append("list_date >= %s AND list_date <= %s")
-        params_list.extend(date_range)
 
-    if states:
-        where_clauses.append("state IN %s")
-        params_list.append(tuple(states))
-
-    if statuses and len(statuses) > 0:
-        where_clauses.append("status IN %s")
-        params_list.append(tuple(statuses))
-
-    if price_min is not None:
-        where_clauses.append("price >= %s")
-        params_list.append(price_min)
-
-    if price_max is not None:
-        where_clauses.append("price <= %s")
-        params_list.append(price_max)
-
-    if agent_first:
-        where_clauses.append("LOWER(presented_by_first_name) LIKE %s")
-        params_list.append(f"%{agent_first.lower()}%")
-
-    if agent_last:
-        where_clauses.append("LOWER(presented_by_last_name) LIKE %s")
-        params_list.append(f"%{agent_last.lower()}%")
-
-    if brokerage:
-        where_clauses.append("LOWER(brokered_by) LIKE %s")
-        params_list.append(f"%{brokerage.lower()}%")
+def get_total_matching_rows(date_range=None, states=None, statuses=None, price_min=None, price_max=None,
+                            agent_first=None, agent_last=None, brokerage=None, search_text=None, estimate=False):
+    """Counts transactions matching the filters; with `estimate=True` returns the planner's estimate instead."""
+    where_clause, params = _transactions_filter(date_range, states, statuses, price_min, price_max,
+                                                agent_first, agent_last, brokerage, search_text).where()
+    query = f"""
+    SELECT COUNT(*) FROM transactions_2 {where_clause}
+    """
 
-    if where_clauses:
-        query += " AND " + " AND ".join(where_clauses)
+    if estimate:
+        return estimate_count(query, params)
 
-    result = run_query(query, params=tuple(params_list))
+    result = run_query(query, params=params, cache=True)
 
     print("\n[DEBUG] Total Rows Query:")
     print(query)
     print("[DEBUG] Params:")
-    print(params_list)
+    print(params)
 
     return result.iloc[0][0] if not result.empty else 0
 
@@ -150,6 +147,90 @@ def format_price(price):
         return str(price)
 
 
+def _load_transactions_page(transaction_filters):
+    """Loads the next keyset page for `transaction_filters`, adds the per-agent columns and appends it."""
+    offset = st.session_state.transactions_offset
+    after = st.session_state.get('transactions_cursor') if offset > 0 else None
+    df = load_transactions_data(limit=CACHE_LIMIT_TRANSACTIONS, after=after, **transaction_filters)
+    df, st.session_state.transactions_cursor = split_page(df)
+
+    if 'listing_agent_id' in df.columns:
+        df['Price Numeric'] = pd.to_numeric(df['Price'], errors='coerce')
+        df['total_transaction_counts'] = df.groupby('listing_agent_id')['Agent MLS ID'].transform('count').fillna(1).astype(int)
+        df['Avg. Listing Price Temp'] = df.groupby('listing_agent_id')['Price Numeric'].transform('mean')
+        df['Avg. Listing Price'] = df.apply(
+            lambda row: '${:,.2f}'.format(row['Avg. Listing Price Temp']) if pd.notna(row['Avg. Listing Price Temp']) and row['Avg. Listing Price Temp'] != 0
+            else (f"${float(row['Price Numeric']):,.2f}" if 'Price Numeric' in row and pd.notna(row['Price Numeric']) else ""),
+            axis=1
+        )
+        df.drop(columns=['Avg. Listing Price Temp'], inplace=True)
+    else:
+        df['total_transaction_counts'] = 1
+        df['Avg. Listing Price'] = f"${float(df['Price'].iloc[0]):,.2f}" if not df.empty and pd.notna(df['Price'].iloc[0]) else ""
+    # Format each page once as it arrives rather than the whole accumulated frame on every rerun
+    if "Price" in df.columns:
+        df["Price"] = df["Price"].apply(format_price)
+
+    if offset == 0:
+        st.session_state.filtered_transactions_data = df
+    else:
+        st.session_state.filtered_transactions_data = pd.concat(
+            [st.session_state.filtered_transactions_data, df], ignore_index=True
+        )
+
+    st.session_state.transactions_offset += CACHE_LIMIT_TRANSACTIONS
+
+
+@st.fragment
+def _transactions_results():
+    """
+    The results table, export, metrics and Load More. Runs as a fragment, so fetching the next
+    page only reruns this part of the page instead of the whole app.
+    """
+    df_display = st.session_state.filtered_transactions_data.iloc[
+                 0: st.session_state.transactions_offset
+                 ]
+
+    if not st.session_state.filtered_transactions_data.empty:
+        st.dataframe(df_display[['Email', 'Agent First', 'Agent Last', 'Brokerage', 'List Date', 'Status', 'Price', 'Address 1', 'Address 2', 'City', 'State', 'Zip', 'SQFT', 'Phone', 'Agent MLS ID', 'Office ID', 'total_transaction_counts', 'Avg. Listing Price']], use_container_width=True)
+
+        col_dl = st.columns([1])
+        with col_dl[0]:
+            if len(df_display) > 15000:
+                # Let PostgreSQL render the CSV (COPY ... TO STDOUT), only when asked for
+                transaction_filters = st.session_state.transaction_filters
+                full_csv_download(
+                    "transactions", "filtered_transactions.csv", transaction_filters,
+                    lambda dest: export_transactions_csv(dest, **transaction_filters),
+                    st.session_state.total_matching_rows
+                )
+            else:
+                csv_data = df_display.to_csv(index=False).encode('utf-8')
+                st.download_button(
+                    label="Export Displayed Data as CSV",
+                    data=csv_data,
+                    file_name="filtered_transactions.csv",
+                    mime="text/csv",
+                    key="download_transactions_csv"
+                )
+
+        st.metric("Rows Displayed", len(df_display))
+        st.metric("Total Rows Matching Filters", count_label('total_matching_rows'))
+        st.caption(f"Showing rows 1 – "
+                   f"{len(df_display)} of "
+                   f"{count_label('total_matching_rows')}")
+        watch_count('total_matching_rows')
+
+        if st.session_state.total_matching_rows > len(df_display):
+            if st.button("Load More", key="load_more_button"):
+                with st.spinner("Loading more transactions..."):
+                    _load_transactions_page(st.session_state.transaction_filters)
+                # Only the results need redrawing; the sidebar and filters haven't changed
+                st.rerun(scope="fragment")
+    else:
+        st.info("No transactions match the current filters.")
+
+
 def transactions_view():
     st.title("Transactions View")
 
@@ -161,13 +242,15 @@ def transactions_view():
     st.session_state.setdefault("filter_brokerage", "")
     st.session_state.setdefault("filter_agent_first", "")
     st.session_state.setdefault("filter_agent_last", "")
+    st.session_state.setdefault("filter_search_transactions", "")
 
     # Defaults
     default_range = (today - timedelta(days=7), today)
-    default_states = us_states
+    default_states = US_STATES
     default_statuses = ["Active"]
 
     st.session_state.setdefault('transactions_offset', 0)
+    st.session_state.setdefault('transactions_cursor', None)
     st.session_state.setdefault('filtered_transactions_data', pd.DataFrame())
     st.session_state.setdefault('total_matching_rows', 0)
     st.session_state.setdefault('date_range', default_range)
@@ -175,11 +258,15 @@ def transactions_view():
     st.session_state.setdefault('selected_statuses', default_statuses)
     st.session_state.setdefault('min_price', 0)
     st.session_state.setdefault('max_price', 99999999.0)
-    st.session_state.setdefault('load_more_requested', False)
 
     with st.sidebar:
         st.header("Filter Transactions")
 
+        st.text_input(
+            "Search", key="filter_search_transactions", placeholder='e.g. "john smith" remax austin',
+            help="Full-text search across agent name, brokerage and city, best matches first."
+        )
+
         # LIKE filters
         st.text_input("Brokerage", key="filter_brokerage")
         st.text_input("Agent First Name", key="filter_agent_first")
@@ -193,9 +280,9 @@ def transactions_view():
 
         select_all_states = st.checkbox("Select All States", key="select_all_states", value=True)
         if select_all_states:
-            selected_states = us_states
+            selected_states = US_STATES
         else:
-            selected_states = st.multiselect("State", us_states, default=us_states)
+            selected_states = st.multiselect("State", US_STATES, default=US_STATES)
 
         selected_statuses = st.multiselect("Status", all_statuses, default=["Active"])
 
@@ -211,28 +298,26 @@ def transactions_view():
             if st.button("Clear Filters"):
                 st.session_state.transactions_offset = 0
                 st.session_state.filtered_transactions_data = pd.DataFrame()
-                st.session_state.total_matching_rows = 0
+                reset_count('total_matching_rows')
                 st.rerun()
 
     st.session_state.date_range = (start_date, end_date)
 
-    if apply_filters or st.session_state.filtered_transactions_data.empty or st.session_state.get("load_more_requested"):
-        if apply_filters:
-            st.session_state.transactions_offset = 0
-            st.session_state.filtered_transactions_data = pd.DataFrame()
+    if apply_filters or st.session_state.filtered_transactions_data.empty:
+        st.session_state.transactions_offset = 0
+        st.session_state.filtered_transactions_data = pd.DataFrame()
         brokerage_filter = st.session_state.get("filter_brokerage", "").lower().strip()
         agent_first_filter = st.session_state.get("filter_agent_first", "").lower().strip()
         agent_last_filter = st.session_state.get("filter_agent_last", "").lower().strip()
+        search_text = st.session_state.get("filter_search_transactions", "").strip()
 
-        offset = st.session_state.transactions_offset
         st.session_state.selected_states = selected_states
         st.session_state.selected_statuses = selected_statuses
         st.session_state.min_price = min_price
         st.session_state.max_price = max_price
 
-        df = load_transactions_data(
-            limit=CACHE_LIMIT_TRANSACTIONS,
-            offset=offset,
+        # Load More and the export reuse the filters the current results were loaded with
+        st.session_state.transaction_filters = dict(
             date_range=st.session_state.date_range,
             states=selected_states,
             statuses=selected_statuses,
@@ -240,111 +325,11 @@ def transactions_view():
             price_max=max_price,
             agent_first=agent_first_filter if agent_first_filter else None,
             agent_last=agent_last_filter if agent_last_filter else None,
-            brokerage=brokerage_filter if brokerage_filter else None
-        )
-
-        if 'listing_agent_id' in df.columns:
-            df['Price'] = df['Price'].astype(str)
-            df['Price Numeric'] = df['Price'].str.replace(r'[\$,]', '', regex=True).astype(float)
-            df['total_transaction_counts'] = df.groupby('listing_agent_id')['Agent MLS ID'].transform('count').fillna(1).astype(int)
-            df['Avg. Listing Price Temp'] = df.groupby('listing_agent_id')['Price Numeric'].transform('mean')
-            df['Avg. Listing Price'] = df.apply(
-                lambda row: '${:,.2f}'.format(row['Avg. Listing Price Temp']) if pd.notna(row['Avg. Listing Price Temp']) and row['Avg. Listing Price Temp'] != 0
-                else (f"${float(row['Price Numeric']):,.2f}" if 'Price Numeric' in row and pd.notna(row['Price Numeric']) else ""),
-                axis=1
-            )
-            df.drop(columns=['Avg. Listing Price Temp'], inplace=True)
-        else:
-            df['total_transaction_counts'] = 1
-            df['Avg. Listing Price'] = f"${float(df['Price'].iloc[0]):,.2f}" if not df.empty and pd.notna(df['Price'].iloc[0]) else ""
-
-        if offset == 0:
-            st.session_state.filtered_transactions_data = df
-        else:
-            st.session_state.filtered_transactions_data = pd.concat(
-                [st.session_state.filtered_transactions_data, df], ignore_index=True
-            )
-
-        st.session_state.transactions_offset += CACHE_LIMIT_TRANSACTIONS
-        st.session_state.total_matching_rows = get_total_matching_rows(
-            date_range=st.session_state.date_range,
-            states=selected_states,
-            statuses=selected_statuses,
-            price_min=min_price,
-            price_max=max_price,
-            agent_first=agent_first_filter if agent_first_filter else None,
-            agent_last=agent_last_filter if agent_last_filter else None,
-            brokerage=brokerage_filter if brokerage_filter else None
-        )
-        st.session_state.load_more_requested = False
-
-    df_display = st.session_state.filtered_transactions_data.iloc[
-                 0: st.session_state.transactions_offset
-                 ]
-
-    if 'total_transaction_counts' not in df_display.columns:
-        df_display['total_transaction_counts'] = (
-            df_display.groupby('Agent MLS ID')['Agent MLS ID']
-            .transform('count').fillna(1).astype(int)
-            if 'Agent MLS ID' in df_display.columns
-            else 1
+            brokerage=brokerage_filter if brokerage_filter else None,
+            search_text=search_text or None
         )
+        # New filters: show an estimated total now, the exact COUNT(*) finishes in the background
+        start_count('total_matching_rows', get_total_matching_rows, **st.session_state.transaction_filters)
+        _load_transactions_page(st.session_state.transaction_filters)
 
-        if 'Avg. Listing Price' not in df_display.columns:
-            if 'Agent MLS ID' in df_display.columns:
-                df_display['Price'] = df_display['Price'].astype(str)
-                df_display['Price Numeric'] = df_display['Price'].str.replace(r'[\$,]', '', regex=True).astype(float)
-            df_display['Avg. Listing Price Temp'] = (
-                df_display.groupby('Agent MLS ID')['Price Numeric']
-                .transform('mean')
-            )
-            df_display['Avg. Listing Price'] = df_display.apply(
-                lambda row: '${:,.2f}'.format(row['Avg. Listing Price Temp']) if pd.notna(row['Avg. Listing Price Temp']) and row['Avg. Listing Price Temp'] != 0
-                else (f"${float(row['Price Numeric']):,.2f}" if 'Price Numeric' in row and pd.notna(row['Price Numeric']) else ""),
-                axis=1
-            )
-            df_display.drop(columns=['Avg. Listing Price Temp'], inplace=True)
-        else:
-            df_display['Avg. Listing Price'] = f"${float(df_display['Price'].iloc[0]):,.2f}" if not df_display.empty and pd.notna(df_display['Price'].iloc[0]) else ""
-
-    if not st.session_state.filtered_transactions_data.empty:
-        df_display["Price"] = df_display["Price"].apply(format_price)
-        st.dataframe(df_display[['Email', 'Agent First', 'Agent Last', 'Brokerage', 'List Date', 'Status', 'Price', 'Address 1', 'Address 2', 'City', 'State', 'Zip', 'SQFT', 'Phone', 'Agent MLS ID', 'Office ID', 'total_transaction_counts', 'Avg. Listing Price']], use_container_width=True)
-
-        col_dl = st.columns([1])
-        with col_dl[0]:
-            if len(df_display) > 15000:
-                os.makedirs(EXPORT_PATH, exist_ok=True)
-                export_path = os.path.join(EXPORT_PATH, "filtered_transactions.csv")
-                df_display.to_csv(export_path, index=False)
-                with open(export_path, "rb") as f:
-                    st.download_button(
-                        label="Download Full CSV",
-                        data=f,
-                        file_name="filtered_transactions.csv",
-                        mime="text/csv",
-                        key="download_transactions_csv_large"
-                    )
-            else:
-                csv_data = df_display.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="Export Displayed Data as CSV",
-                    data=csv_data,
-                    file_name="filtered_transactions.csv",
-                    mime="text/csv",
-                    key="download_transactions_csv"
-                )
-
-        st.metric("Rows Displayed", len(df_display))
-        st.metric("Total Rows Matching Filters", st.session_state.total_matching_rows)
-        st.caption(f"Showing rows 1 – "
-                   f"{len(df_display)} of "
-                   f"{st.session_state.total_matching_rows}")
-
-        if st.session_state.total_matching_rows > len(df_display):
-            st.button("Load More", key="load_more_button")
-            if st.session_state.load_more_requested:
-                st.session_state.load_more_requested = False
-                st.rerun()
-    else:
-        st.info("No transactions match the current filters.")
+    _transactions_results()
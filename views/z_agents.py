@@ -1,7 +1,11 @@
 import streamlit as st
-from db import run_query  # Assuming db.py contains your run_query function
+from db import run_query, estimate_count  # Assuming db.py contains your run_query function
+from pagination import ROW_ID, seek_order_by, seek_predicate, seek_select, split_page
+from row_counts import start_count, refresh_count, count_label, watch_count
+from filter_spec import FilterSpec, Raw, SEARCH_RANK_PARAM, between, contains, one_of, search, search_rank
 import pandas as pd
 import numpy as np  # Import numpy for NaN checking
+from dimension_options import US_STATES, distinct_values
 
 CACHE_LIMIT = 5000  # Number of rows per page
 
@@ -12,6 +16,9 @@ DB_COL_TEAM = '"Team"'
 DB_COL_TEAM_ROLE = '"Team_role"'
 DB_COL_ORG = '"Org"'
 DB_COL_STATE = '"State"'
+# Typed copies of the sales columns, generated and indexed by migrations/numeric_columns.py
+DB_COL_SALES_NUMBER_NUM = "sales_lastyear_num"
+DB_COL_SALES_VALUE_NUM = "sales_value_num"
 DB_TABLE_AGENTS = '"z_agents"'
 
 # --- DataFrame Column Names (Expected names AFTER loading from DB) ---
@@ -32,63 +39,51 @@ SLIDER_SALES_VAL_MAX = 100_000_000  # 100M
 SLIDER_SALES_VAL_STEP = 1_000_000
 SLIDER_SALES_VAL_FORMAT = "$%d"
 
-# Helper function for safe casting in SQL WHERE clauses
-def sql_safe_cast(db_column_name, cast_type="bigint"):
-    """Generates SQL fragment for safe casting, handling non-numeric chars and empty strings."""
-    cleaned_col = f"NULLIF(REGEXP_REPLACE({db_column_name}::text, '[^0-9.]', '', 'g'), '')"
-    return f"CAST({cleaned_col} AS {cast_type})"
+# Keyset pagination order: Name, then the row key as a unique tiebreaker
+# (served by the z_agents_keyset_idx expression index, see migrations/row_keys.py)
+AGENTS_SORT_KEYS = ['COALESCE("Name", \'\')', ROW_ID]
+# While searching, best match first (descending, with the row id as tiebreaker)
+AGENTS_SEARCH_SORT_KEYS = [search_rank(), ROW_ID]
+
+
+def _z_agents_filter(states=None, team_roles=None, active_teams=False,
+                     sales_number_range=None, sales_value_range=None, search_text=None, brokerage=None):
+    """
+    The z_agents filters as a FilterSpec. The sales filters are plain ranges on the indexed numeric columns.
+    """
+    sales_number_min, sales_number_max = sales_number_range or (None, None)
+    sales_value_min, sales_value_max = sales_value_range or (None, None)
+    return FilterSpec.of(
+        Raw(f"{DB_COL_TEAM} IS NOT NULL"),
+        Raw(f"{DB_COL_TEAM} <> ''"),
+        search(search_text),
+        one_of(DB_COL_STATE, states),
+        one_of(DB_COL_TEAM_ROLE, team_roles),
+        contains(DB_COL_ORG, brokerage),
+        between(DB_COL_SALES_NUMBER_NUM, 1) if active_teams else None,
+        # Slider ends mean "no limit" (the top of the sales number slider displays as 99+)
+        between(DB_COL_SALES_NUMBER_NUM, sales_number_min, sales_number_max,
+                floor=SLIDER_SALES_NUM_MIN, cap=SLIDER_SALES_NUM_MAX),
+        between(DB_COL_SALES_VALUE_NUM, sales_value_min, sales_value_max,
+                floor=SLIDER_SALES_VAL_MIN, cap=SLIDER_SALES_VAL_MAX),
+    )
+
 
 # --- Updated Data Functions ---
 def get_total_row_count(states=None, team_roles=None, active_teams=False,
-                        sales_number_range=None, sales_value_range=None):
-    """Calculates the total number of rows matching ALL filters, using ranges."""
+                        sales_number_range=None, sales_value_range=None, search_text=None, brokerage=None,
+                        estimate=False):
+    """
+    Calculates the total number of rows matching ALL filters, using ranges.
+    With `estimate=True` returns the planner's estimate instead.
+    """
     if not st.session_state.get('authenticated', False):
         st.error("Authentication required.")
         return 0
 
-    where_clauses = [f"{DB_COL_TEAM} IS NOT NULL", f"{DB_COL_TEAM} <> ''"]
-    params = {}
-
-    if states:
-        where_clauses.append(f"{DB_COL_STATE} IN %(states)s")
-        params['states'] = tuple(states)
-    if team_roles:
-        where_clauses.append(f"{DB_COL_TEAM_ROLE} IN %(team_roles)s")
-        params['team_roles'] = tuple(team_roles)
-    if st.session_state.get("filter_brokerage", "").strip():
-        where_clauses.append(f"{DB_COL_ORG} ILIKE %(brokerage)s")
-        params['brokerage'] = f"%{st.session_state.filter_brokerage.strip()}%"
-
-    # --- Filter by Sales Number Range ---
-    sales_num_col_casted = sql_safe_cast(DB_COL_SALES_LASTYEAR, "bigint")
-    if active_teams:
-        where_clauses.append(f"{sales_num_col_casted} >= 1")
-
-    # Apply slider range.  Important: Use 99 in the where clause, not 100.
-    if sales_number_range and \
-            (sales_number_range[0] != SLIDER_SALES_NUM_MIN or sales_number_range[1] != SLIDER_SALES_NUM_MAX):
-        selected_min, selected_max = sales_number_range
-        if selected_min > SLIDER_SALES_NUM_MIN:
-            where_clauses.append(f"{sales_num_col_casted} >= %(sales_number_min)s")
-            params['sales_number_min'] = selected_min
-        # Max is 99 for filtering
-        if selected_max < SLIDER_SALES_NUM_MAX:
-            where_clauses.append(f"{sales_num_col_casted} <= %(sales_number_max)s")
-            params['sales_number_max'] = selected_max
-
-    # --- Filter by Sales Value Range ---
-    sales_value_calculation = f"({sql_safe_cast(DB_COL_SALES_LASTYEAR, 'numeric')} * {sql_safe_cast(DB_COL_AVG_VALUE, 'numeric')})"
-    if sales_value_range and \
-            (sales_value_range[0] != SLIDER_SALES_VAL_MIN or sales_value_range[1] != SLIDER_SALES_VAL_MAX):
-        selected_min, selected_max = sales_value_range
-        if selected_min > SLIDER_SALES_VAL_MIN:
-            where_clauses.append(f"{sales_value_calculation} >= %(sales_value_min)s")
-            params['sales_value_min'] = selected_min
-        if selected_max < SLIDER_SALES_VAL_MAX:
-            where_clauses.append(f"{sales_value_calculation} <= %(sales_value_max)s")
-            params['sales_value_max'] = selected_max
-
-    where_clause = " AND ".join(where_clauses)
+    where_clause, params = _z_agents_filter(states, team_roles, active_teams,
+                                            sales_number_range, sales_value_range, search_text,
+                                            brokerage).compile()
     query = f"SELECT COUNT(*) FROM {DB_TABLE_AGENTS} WHERE {where_clause}"
 
     print("--- Count Query ---")
@@ -96,8 +91,11 @@ def get_total_row_count(states=None, team_roles=None, active_teams=False,
     print(f"Params: {params}")
     print("-------------------")
 
+    if estimate:
+        return estimate_count(query, params)
+
     try:
-        result = run_query(query, params=params)
+        result = run_query(query, params=params, cache=True)
         count = result.iloc[0][0] if not result.empty and result.iloc[0][0] is not None else 0
         print(f"Count Result: {count}")
         return count
@@ -109,56 +107,31 @@ def get_total_row_count(states=None, team_roles=None, active_teams=False,
 
 
 
-def load_data(limit=CACHE_LIMIT, offset=0, states=None, team_roles=None, active_teams=False,
-              sales_number_range=None, sales_value_range=None):
-    """Loads data from the database based on filters, using ranges."""
+def load_data(limit=CACHE_LIMIT, after=None, states=None, team_roles=None, active_teams=False,
+              sales_number_range=None, sales_value_range=None, search_text=None, brokerage=None):
+    """
+    Loads one page of data from the database based on filters, using ranges.
+
+    Pages are fetched by keyset: pass the cursor returned by pagination.split_page() for the
+    previous page as `after` (None for the first page). With `search_text`, pages are ordered
+    by search relevance instead of by Name.
+    """
     if not st.session_state.get('authenticated', False):
         st.error("Authentication required.")
         return pd.DataFrame()
 
-    where_clauses = [f"{DB_COL_TEAM} IS NOT NULL", f"{DB_COL_TEAM} <> ''"]
-    params = {}
-
-    if states:
-        where_clauses.append(f"{DB_COL_STATE} IN %(states)s")
-        params['states'] = tuple(states)
-    if team_roles:
-        where_clauses.append(f"{DB_COL_TEAM_ROLE} IN %(team_roles)s")
-        params['team_roles'] = tuple(team_roles)
-    if st.session_state.get("filter_brokerage", "").strip():
-        where_clauses.append(f"{DB_COL_ORG} ILIKE %(brokerage)s")
-        params['brokerage'] = f"%{st.session_state.filter_brokerage.strip()}%"
-
-    # --- Filter by Sales Number Range ---
-    sales_num_col_casted = sql_safe_cast(DB_COL_SALES_LASTYEAR, "bigint")
-    if active_teams:
-        where_clauses.append(f"{sales_num_col_casted} >= 1")
-
-    # Apply slider range.  Important: Use 99 in the where clause, not 100.
-    if sales_number_range and \
-            (sales_number_range[0] != SLIDER_SALES_NUM_MIN or sales_number_range[1] != SLIDER_SALES_NUM_MAX):
-        selected_min, selected_max = sales_number_range
-        if selected_min > SLIDER_SALES_NUM_MIN:
-            where_clauses.append(f"{sales_num_col_casted} >= %(sales_number_min)s")
-            params['sales_number_min'] = selected_min
-        # Max is 99 for filtering
-        if selected_max < SLIDER_SALES_NUM_MAX:
-            where_clauses.append(f"{sales_num_col_casted} <= %(sales_number_max)s")
-            params['sales_number_max'] = selected_max
-
-    # --- Filter by Sales Value Range ---
-    sales_value_calculation = f"({sql_safe_cast(DB_COL_SALES_LASTYEAR, 'numeric')} * {sql_safe_cast(DB_COL_AVG_VALUE, 'numeric')})"
-    if sales_value_range and \
-            (sales_value_range[0] != SLIDER_SALES_VAL_MIN or sales_value_range[1] != SLIDER_SALES_VAL_MAX):
-        selected_min, selected_max = sales_value_range
-        if selected_min > SLIDER_SALES_VAL_MIN:
-            where_clauses.append(f"{sales_value_calculation} >= %(sales_value_min)s")
-            params['sales_value_min'] = selected_min
-        if selected_max < SLIDER_SALES_VAL_MAX:
-            where_clauses.append(f"{sales_value_calculation} <= %(sales_value_max)s")
-            params['sales_value_max'] = selected_max
-
-    where_clause = " AND ".join(where_clauses)
+    spec = _z_agents_filter(states, team_roles, active_teams, sales_number_range, sales_value_range, search_text,
+                            brokerage)
+    search_predicate = search(search_text)
+    descending = search_predicate is not None
+    sort_keys = AGENTS_SEARCH_SORT_KEYS if descending else AGENTS_SORT_KEYS
+    seek_clause, seek_params = seek_predicate(sort_keys, after, descending=descending)
+    if seek_clause:
+        spec = spec.and_(Raw(seek_clause))
+    where_clause, params = spec.compile()
+    params.update(seek_params)
+    if descending:
+        params[SEARCH_RANK_PARAM] = search_predicate.text
 
     query = f"""
     SELECT
@@ -168,14 +141,14 @@ def load_data(limit=CACHE_LIMIT, offset=0, states=None, team_roles=None, active_
         {DB_COL_AVG_VALUE},
         "priceRangeThreeYearMin" AS "3 Year Min",
         "priceRangeThreeYearMax" AS "3 Year Max",
-        {sales_value_calculation} AS "{DF_COL_SALES_VALUE_CALCULATED}"
+        {DB_COL_SALES_VALUE_NUM} AS "{DF_COL_SALES_VALUE_CALCULATED}",
+        {seek_select(sort_keys)}
     FROM {DB_TABLE_AGENTS}
     WHERE {where_clause}
-    ORDER BY "Name"
-    LIMIT %(limit)s OFFSET %(offset)s;
+    {seek_order_by(sort_keys, descending=descending)}
+    LIMIT %(limit)s;
     """
     params['limit'] = limit
-    params['offset'] = offset
 
     print("--- Data Query ---")
     print(f"SQL: {query}")
@@ -183,7 +156,7 @@ def load_data(limit=CACHE_LIMIT, offset=0, states=None, team_roles=None, active_
     print("------------------")
 
     try:
-        df = run_query(query, params=params)
+        df = run_query(query, params=params, cache=True)
         print(f"Columns returned by load_data: {df.columns.tolist()}")
         if not df.empty:
             print("Raw data sample (head) from load_data:")
@@ -210,13 +183,149 @@ def load_data(limit=CACHE_LIMIT, offset=0, states=None, team_roles=None, active_
         return pd.DataFrame()
 
 
+def _format_for_display(df):
+    """Formats a page of loaded rows for the table and keeps only the display columns."""
+    df_display = df.copy()
+    print(f"Columns in df_display before formatting: {df_display.columns.tolist()}")
+
+    # --- Format Sales Columns for Display ---
+    df_display[DISPLAY_COL_SALES_NUMBER] = df_display[DF_COL_SALES_LASTYEAR]  # Show actual value
+    df_display[DISPLAY_COL_SALES_VALUE] = df_display[DF_COL_SALES_VALUE_CALCULATED] # show calculated
+
+    #  Format for display in the table
+    df_display[DISPLAY_COL_SALES_NUMBER] = df_display[DISPLAY_COL_SALES_NUMBER].apply(lambda x: f"{x:,.0f}")
+    df_display[DISPLAY_COL_SALES_VALUE] = df_display[DISPLAY_COL_SALES_VALUE].apply(lambda x: f"${x:,.0f}")
+
+    # Optionally format the new price range columns if needed (here showing two decimal places)
+    df_display["3 Year Min"] = df_display["3 Year Min"].apply(lambda x: f"${x:,.0f}" if pd.notnull(x) else x)
+    df_display["3 Year Max"] = df_display["3 Year Max"].apply(lambda x: f"${x:,.0f}" if pd.notnull(x) else x)
+
+    # --- Define Columns for Display ---
+    columns_to_display_in_table = [
+        "Name", "Team", "Team_role", "Org",
+        "Phone", "Cell", "Email", "City", "State", "Zip",
+        DISPLAY_COL_SALES_NUMBER,
+        DISPLAY_COL_SALES_VALUE,
+        "3 Year Min",
+        "3 Year Max"
+    ]
+    valid_columns_to_display = [col for col in columns_to_display_in_table if col in df_display.columns]
+    return df_display[valid_columns_to_display]
+
+
+def _apply_filters():
+    """
+    Snapshots the sidebar filters as applied: the results and Load More use the snapshot until the
+    next Apply, whatever the sidebar shows in between.
+
+    Returns:
+        tuple: The filter arguments shared by the count and page queries.
+    """
+    st.session_state.z_agents_applied_filters = (
+        list(st.session_state.selected_states),
+        list(st.session_state.selected_team_roles),
+        st.session_state.active_teams_only,
+        tuple(st.session_state.sales_number_range),
+        tuple(st.session_state.sales_value_range),
+        st.session_state.get('filter_search_z_agents', ''),
+        st.session_state.get('filter_brokerage', '')
+    )
+    return st.session_state.z_agents_applied_filters
+
+
+@st.fragment
+def _z_agents_results(filter_args):
+    """
+    The results table, metrics, export and Load More. Runs as a fragment, so fetching the next
+    page only reruns this part of the page: the sidebar (and its team role query) isn't rebuilt,
+    and only the new page is formatted.
+
+    Args:
+        filter_args (tuple): The filters the loaded rows were fetched with (positional arguments of
+            load_data after the cursor), so Load More continues the same result set after unapplied
+            sidebar edits.
+    """
+    current_data = st.session_state.get('filtered_data', pd.DataFrame())
+
+    if not current_data.empty:
+        # Formatted rows are kept alongside the loaded ones; reformat only when the data was replaced
+        df_display = st.session_state.get('filtered_data_display')
+        if df_display is None or st.session_state.get('filtered_data_display_for') is not current_data:
+            df_display = _format_for_display(current_data)
+            st.session_state.filtered_data_display = df_display
+            st.session_state.filtered_data_display_for = current_data
+
+        if df_display.columns.empty:
+            st.error("No valid columns available to display.")
+        else:
+            # --- Display DataFrame ---
+            st.dataframe(
+                df_display,
+                use_container_width=True,
+                column_config={
+                    # Email defaults to text display now
+                    DISPLAY_COL_SALES_NUMBER: st.column_config.TextColumn(help=f"Source: {DF_COL_SALES_LASTYEAR}"),
+                    DISPLAY_COL_SALES_VALUE: st.column_config.TextColumn(
+                        help=f"Source: {DF_COL_SALES_VALUE_CALCULATED}"),
+                },
+                hide_index=True
+            )
+
+        # --- Metrics and Download ---
+        col_metric, col_dl = st.columns([2, 1])
+        with col_metric:
+            st.metric("Rows Displayed", len(df_display))
+            st.metric("Total Rows Matching Filters", count_label('total_rows'))
+            # Every loaded page is kept, so the rows shown always start at 1
+            end_row = len(df_display)
+            st.caption(f"Showing rows 1-{end_row} of {count_label('total_rows')}")
+            watch_count('total_rows')
+        with col_dl:
+            csv_data = df_display.to_csv(index=False).encode('utf-8')
+            st.download_button(label="Export Displayed Data as CSV", data=csv_data,
+                               file_name="filtered_agents_view.csv", mime="text/csv", key='download_csv')
+
+        # --- Load More Button (now below table) ---
+        if end_row < st.session_state.total_rows and st.button("Load More", key="load_more"):
+            print("\n--- Loading More ---")
+            with st.spinner("Loading more data..."):
+                new_data = load_data(CACHE_LIMIT, st.session_state.get('team_members_cursor'), *filter_args)
+            new_data, next_cursor = split_page(new_data)
+            if not new_data.empty:
+                st.session_state.team_members_cursor = next_cursor
+                st.session_state.filtered_data = pd.concat(
+                    [st.session_state.filtered_data, new_data], ignore_index=True
+                )
+                st.session_state.filtered_data_display = pd.concat(
+                    [df_display, _format_for_display(new_data)], ignore_index=True
+                )
+                st.session_state.filtered_data_display_for = st.session_state.filtered_data
+                print("------------------\n")
+            else:
+                st.warning("No more data found.")
+                print("Load More returned empty DataFrame unexpectedly.")
+            # Only the results need redrawing; the sidebar and filters haven't changed
+            st.rerun(scope="fragment")
+
+        # --- Pagination status ---
+        if refresh_count('total_rows') and end_row >= st.session_state.total_rows and st.session_state.total_rows > 0:
+            st.success("All matching data loaded.")
+
+    # --- Handle No Data Scenarios ---
+    elif st.session_state.total_rows == 0 and st.session_state.get('filters_applied', False):
+        st.info("No data matches the current filters.")
+    elif not st.session_state.get('filters_applied', False):
+        st.info("Apply filters using the sidebar to load data.")
+
+
 def z_agents_view():
     """Displays the Z Agents data view with filtering and pagination."""
     st.title("Team Members View")
 
     # Initialize session state variables safely
-    st.session_state.setdefault('offset', 0)
+    st.session_state.setdefault('team_members_cursor', None)
     st.session_state.setdefault('filtered_data', pd.DataFrame())
+    st.session_state.setdefault('z_agents_applied_filters', ())
     st.session_state.setdefault('total_rows', 0)
     st.session_state.setdefault('selected_states', [])
     st.session_state.setdefault('selected_team_roles', [])
@@ -225,36 +334,30 @@ def z_agents_view():
     st.session_state.setdefault('sales_value_range', (SLIDER_SALES_VAL_MIN, SLIDER_SALES_VAL_MAX))
     st.session_state.setdefault('authenticated', True)
     st.session_state.setdefault('filter_brokerage', '')
-    st.session_state.setdefault('load_more_requested', False)
+    st.session_state.setdefault('filter_search_z_agents', '')
 
     if st.session_state.get('authenticated', False):
         # --- Sidebar Filters ---
         with st.sidebar:
+            st.header("Search")
+            st.text_input(
+                "Search", key="filter_search_z_agents", placeholder='e.g. "jane doe" compass -realty',
+                help="Full-text search across name, brokerage, team and city, best matches first."
+            )
+
             st.header("Filter by Location and Role")
-            us_states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA',
-                         'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD',
-                         'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ',
-                         'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC',
-                         'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
 
             select_all_states = st.checkbox("Select All States", key="select_all_states", value=True)
             if select_all_states:
-                st.session_state.selected_states = us_states
+                st.session_state.selected_states = US_STATES
             else:
                 st.session_state.selected_states = st.multiselect(
-                    "State", us_states, default=st.session_state.selected_states, key="state_select"
+                    "State", US_STATES, default=st.session_state.selected_states, key="state_select"
                 )
             st.text_input("Brokerage", key="filter_brokerage")
 
-            try:
-                role_query = f"SELECT DISTINCT {DB_COL_TEAM_ROLE} FROM {DB_TABLE_AGENTS} WHERE {DB_COL_TEAM_ROLE} IS NOT NULL AND {DB_COL_TEAM_ROLE} <> '' ORDER BY {DB_COL_TEAM_ROLE}"
-                print(f"Executing Team Role Query: {role_query}")
-                unique_team_roles_df = run_query(role_query)
-                unique_team_roles = sorted(unique_team_roles_df[unique_team_roles_df.columns[0]].dropna().unique()) if not unique_team_roles_df.empty else []
-            except Exception as e:
-                st.warning(f"Could not load team roles: {e}")
-                print(f"Error loading team roles: {e}")
-                unique_team_roles = []
+            # Served from the shared query cache; only re-queried when z_agents changes
+            unique_team_roles = distinct_values(DB_TABLE_AGENTS, DB_COL_TEAM_ROLE)
 
             st.session_state.selected_team_roles = st.multiselect(
                 "Team Role", unique_team_roles, default=st.session_state.selected_team_roles, key="role_select"
@@ -301,169 +404,39 @@ def z_agents_view():
                     st.session_state.sales_value_range = (SLIDER_SALES_VAL_MIN, SLIDER_SALES_VAL_MAX)
                     if "filter_brokerage" in st.session_state:
                         del st.session_state["filter_brokerage"]
-                    st.session_state.offset = 0
+                    del st.session_state["filter_search_z_agents"]
                     st.session_state.filtered_data = pd.DataFrame()
                     st.rerun()
 
         if 'auto_loaded' not in st.session_state:
+            filter_args = _apply_filters()
             with st.spinner("Loading data..."):
-                st.session_state.total_rows = get_total_row_count(
-                    st.session_state.selected_states,
-                    st.session_state.selected_team_roles,
-                    st.session_state.active_teams_only,
-                    st.session_state.sales_number_range,
-                    st.session_state.sales_value_range
-                )
-                st.session_state.filtered_data = load_data(
-                    CACHE_LIMIT, 0,
-                    st.session_state.selected_states,
-                    st.session_state.selected_team_roles,
-                    st.session_state.active_teams_only,
-                    st.session_state.sales_number_range,
-                    st.session_state.sales_value_range
-                )
+                # Estimated total now, exact COUNT(*) in the background
+                start_count('total_rows', get_total_row_count, *filter_args)
+                first_page = load_data(CACHE_LIMIT, None, *filter_args)
+                st.session_state.filtered_data, st.session_state.team_members_cursor = split_page(first_page)
             st.session_state.auto_loaded = True
             st.session_state.filters_applied = True
             st.rerun()
         # --- Apply Filters Logic ---
         if apply_filters_button:
-            st.session_state.offset = 0
+            filter_args = _apply_filters()
             print("\n--- Applying Filters ---")
-            with st.spinner("Calculating total rows..."):
-                st.session_state.total_rows = get_total_row_count(
-                    st.session_state.selected_states, st.session_state.selected_team_roles,
-                    st.session_state.active_teams_only,
-                    st.session_state.sales_number_range,
-                    st.session_state.sales_value_range
-                )
-            if st.session_state.total_rows > 0:
-                with st.spinner("Loading data..."):
-                    st.session_state.filtered_data = load_data(
-                        CACHE_LIMIT, 0, st.session_state.selected_states, st.session_state.selected_team_roles,
-                        st.session_state.active_teams_only,
-                        st.session_state.sales_number_range,
-                        st.session_state.sales_value_range
-                    )
-            else:
-                st.session_state.filtered_data = pd.DataFrame()
+            with st.spinner("Loading data..."):
+                # Estimated total now, exact COUNT(*) in the background
+                start_count('total_rows', get_total_row_count, *filter_args)
+                first_page = load_data(CACHE_LIMIT, None, *filter_args)
+            first_page, st.session_state.team_members_cursor = split_page(first_page)
+            st.session_state.filtered_data = first_page
             print("------------------------\n")
             st.rerun()
             if st.session_state.filtered_data.empty and 'preloaded' not in st.session_state:
-                st.session_state.total_rows = get_total_row_count(
-                    st.session_state.selected_states,
-                    st.session_state.selected_team_roles,
-                    st.session_state.active_teams_only,
-                    st.session_state.sales_number_range,
-                    st.session_state.sales_value_range
-                )
-                st.session_state.filtered_data = load_data(
-                    CACHE_LIMIT, 0,
-                    st.session_state.selected_states,
-                    st.session_state.selected_team_roles,
-                    st.session_state.active_teams_only,
-                    st.session_state.sales_number_range,
-                    st.session_state.sales_value_range
-                )
+                start_count('total_rows', get_total_row_count, *filter_args)
+                first_page = load_data(CACHE_LIMIT, None, *filter_args)
+                st.session_state.filtered_data, st.session_state.team_members_cursor = split_page(first_page)
                 st.session_state.preloaded = True
 
-        # --- Display Data ---
-        current_data = st.session_state.get('filtered_data', pd.DataFrame())
-
-        start_row = st.session_state.offset + 1
-        end_row = st.session_state.offset + len(current_data)
-        # --- If load_more_requested, trigger data append and rerun ---
-        if st.session_state.load_more_requested:
-            print("\n--- Loading More ---")
-            with st.spinner("Loading more data..."):
-                new_data = load_data(
-                    CACHE_LIMIT, st.session_state.offset + CACHE_LIMIT,
-                    st.session_state.selected_states, st.session_state.selected_team_roles,
-                    st.session_state.active_teams_only,
-                    st.session_state.sales_number_range,
-                    st.session_state.sales_value_range
-                )
-            if not new_data.empty:
-                st.session_state.filtered_data = pd.concat(
-                    [st.session_state.filtered_data, new_data], ignore_index=True
-                )
-                st.session_state.offset += CACHE_LIMIT
-                print("------------------\n")
-            else:
-                st.warning("No more data found.")
-                print("Load More returned empty DataFrame unexpectedly.")
-            st.session_state.load_more_requested = False
-            st.rerun()
-
-        if not current_data.empty:
-            df_display = current_data.copy()
-            print(f"Columns in df_display before formatting: {df_display.columns.tolist()}")
-
-            # --- Format Sales Columns for Display ---
-            df_display[DISPLAY_COL_SALES_NUMBER] = df_display[DF_COL_SALES_LASTYEAR]  # Show actual value
-            df_display[DISPLAY_COL_SALES_VALUE] = df_display[DF_COL_SALES_VALUE_CALCULATED] # show calculated
-
-            #  Format for display in the table
-            df_display[DISPLAY_COL_SALES_NUMBER] = df_display[DISPLAY_COL_SALES_NUMBER].apply(lambda x: f"{x:,.0f}")
-            df_display[DISPLAY_COL_SALES_VALUE] = df_display[DISPLAY_COL_SALES_VALUE].apply(lambda x: f"${x:,.0f}")
-
-            # Optionally format the new price range columns if needed (here showing two decimal places)
-            df_display["3 Year Min"] = df_display["3 Year Min"].apply(lambda x: f"${x:,.0f}" if pd.notnull(x) else x)
-            df_display["3 Year Max"] = df_display["3 Year Max"].apply(lambda x: f"${x:,.0f}" if pd.notnull(x) else x)
-
-            # --- Define Columns for Display ---
-            columns_to_display_in_table = [
-                "Name", "Team", "Team_role", "Org",
-                "Phone", "Cell", "Email", "City", "State", "Zip",
-                DISPLAY_COL_SALES_NUMBER,
-                DISPLAY_COL_SALES_VALUE,
-                "3 Year Min",
-                "3 Year Max"
-            ]
-            valid_columns_to_display = [col for col in columns_to_display_in_table if col in df_display.columns]
-
-            if not valid_columns_to_display:
-                st.error("No valid columns available to display.")
-            else:
-                # --- Display DataFrame ---
-                st.dataframe(
-                    df_display[valid_columns_to_display],
-                    use_container_width=True,
-                    column_config={
-                        # Email defaults to text display now
-                        DISPLAY_COL_SALES_NUMBER: st.column_config.TextColumn(help=f"Source: {DF_COL_SALES_LASTYEAR}"),
-                        DISPLAY_COL_SALES_VALUE: st.column_config.TextColumn(
-                            help=f"Source: {DF_COL_SALES_VALUE_CALCULATED}"),
-                    },
-                    hide_index=True
-                )
-
-            # --- Metrics and Download ---
-            col_metric, col_dl = st.columns([2, 1])
-            with col_metric:
-                st.metric("Rows Displayed", len(df_display))
-                st.metric("Total Rows Matching Filters", st.session_state.total_rows)
-                start_row = st.session_state.offset + 1
-                end_row = st.session_state.offset + len(df_display)
-                st.caption(f"Showing rows {start_row}-{end_row} of {st.session_state.total_rows}")
-            with col_dl:
-                csv_data = df_display[valid_columns_to_display].to_csv(index=False).encode('utf-8')
-                st.download_button(label="Export Displayed Data as CSV", data=csv_data,
-                                   file_name="filtered_agents_view.csv", mime="text/csv", key='download_csv')
-
-            # --- Load More Button (now below table) ---
-            if end_row < st.session_state.total_rows:
-                if st.button("Load More", key="load_more"):
-                    st.session_state.load_more_requested = True
-
-            # --- Pagination status ---
-            if end_row >= st.session_state.total_rows and st.session_state.total_rows > 0:
-                st.success("All matching data loaded.")
-
-        # --- Handle No Data Scenarios ---
-        elif st.session_state.total_rows == 0 and st.session_state.get('filters_applied', False):
-            st.info("No data matches the current filters.")
-        elif not st.session_state.get('filters_applied', False):
-            st.info("Apply filters using the sidebar to load data.")
+        _z_agents_results(st.session_state.z_agents_applied_filters)
 
     else:
         st.info("Please log in to view Z Agents data.")